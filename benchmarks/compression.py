@@ -0,0 +1,159 @@
+"""
+Measures compression of large note bodies: ratio and speed of zlib and lzma levels on generated log-like notes,
+memory and notes.json size of a notebook with compression off and on, and show-note latency with a cold and
+a warm body cache.
+
+    python benchmarks/compression.py --notes 2000 --size 20000 --out compression.json
+"""
+import argparse
+import json
+import lzma
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from generate import WORDS
+
+import commands  # noqa: E402  (bot_cli is put on sys.path by generate)
+from notes_classes import Notes, Note, NOTE_BODIES  # noqa: E402
+
+CODECS = {
+    "zlib-1": (lambda data: zlib.compress(data, 1), zlib.decompress),
+    "zlib-6": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "zlib-9": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    "lzma-0": (lambda data: lzma.compress(data, preset=0), lzma.decompress),
+    "lzma-6": (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+
+
+def generate_bodies(count: int, size: int, seed: int) -> list[str]:
+    """
+    :return: `count` texts of about `size` characters made of log lines and pasted meeting notes
+    """
+    rnd = random.Random(seed)
+    bodies = []
+    for _ in range(count):
+        lines = []
+        length = 0
+        while length < size:
+            if rnd.random() < 0.7:
+                line = (f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:"
+                        f"{rnd.randint(0, 59):02d} {rnd.choice(['INFO', 'WARN', 'ERROR'])} "
+                        f"request {rnd.randrange(10 ** 6)} took {rnd.randint(1, 900)} ms")
+            else:
+                line = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 20)))
+            lines.append(line)
+            length += len(line) + 1
+        bodies.append("\n".join(lines))
+    return bodies
+
+
+def measure_codecs(bodies: list[str]) -> dict:
+    encoded = [body.encode() for body in bodies]
+    total = sum(len(data) for data in encoded)
+    results = {}
+    for name, (compress, decompress) in CODECS.items():
+        start = time.perf_counter()
+        compressed = [compress(data) for data in encoded]
+        compress_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for data in compressed:
+            decompress(data)
+        decompress_time = time.perf_counter() - start
+        results[name] = {
+            "ratio": round(total / sum(len(data) for data in compressed), 2),
+            "compress_mb_s": round(total / compress_time / 2 ** 20, 1),
+            "decompress_mb_s": round(total / decompress_time / 2 ** 20, 1),
+        }
+        print(f"{name:<8} ratio {results[name]['ratio']:>6.2f}  compress {results[name]['compress_mb_s']:>8.1f} MB/s  "
+              f"decompress {results[name]['decompress_mb_s']:>8.1f} MB/s", file=sys.stderr)
+    return results
+
+
+def measure_notebook(bodies: list[str], min_size: int, work_dir: str) -> dict:
+    """
+    Builds a notebook of the bodies with notes of `min_size` characters or more compressed
+    """
+    Note.COMPRESS_MIN_SIZE = min_size
+    notebook = Notes()
+    for body in bodies:
+        notebook.add_note(body)
+    path = os.path.join(work_dir, f"notes-{min_size}.json")
+    start = time.perf_counter()
+    notebook.save_notes(path)
+    save_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    Notes().load_notes(path)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # memory held by a loaded notebook, the generated bodies would be shared with one built from them
+    tracemalloc.start()
+    notebook = Notes()
+    notebook.load_notes(path)
+    NOTE_BODIES.entries.clear()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    show_ms = {}
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for cache in ("cold", "warm"):
+            start = time.perf_counter()
+            for index in range(1, min(len(bodies), NOTE_BODIES.size) + 1):
+                commands.show_note(notebook, [str(index)])
+            show_ms[cache] = (time.perf_counter() - start) * 1000 / min(len(bodies), NOTE_BODIES.size)
+    return {
+        "memory_kib": round(memory / 1024, 1),
+        "file_kib": round(os.path.getsize(path) / 1024, 1),
+        "save_ms": round(save_ms, 2),
+        "load_ms": round(load_ms, 2),
+        "show_note_cold_ms": round(show_ms["cold"], 4),
+        "show_note_warm_ms": round(show_ms["warm"], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=2000, help="number of large notes")
+    parser.add_argument("--size", type=int, default=20_000, help="characters in every note")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="compression_results.json", help="where to save the results")
+    args = parser.parse_args()
+
+    print(f"Generating {args.notes} notes of {args.size} characters...", file=sys.stderr)
+    bodies = generate_bodies(args.notes, args.size, args.seed)
+    codecs = measure_codecs(bodies)
+    default_min_size = Note.COMPRESS_MIN_SIZE
+    notebooks = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode, min_size in (("off", sys.maxsize), ("on", default_min_size)):
+            notebooks[mode] = measure_notebook(bodies, min_size, work_dir)
+            print(f"compression {mode:<3} " + "  ".join(f"{key} {value}" for key, value in notebooks[mode].items()),
+                  file=sys.stderr)
+    Note.COMPRESS_MIN_SIZE = default_min_size
+
+    with open(args.out, "w") as file:
+        json.dump({
+            "meta": {
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "notes": args.notes,
+                "size": args.size,
+                "compress_min_size": default_min_size,
+            },
+            "codecs": codecs,
+            "notebook": notebooks,
+        }, file, indent=4)
+    print(f"Results were saved to '{args.out}'", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Seeded generators of realistic address books and notebooks for the benchmarks
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot_cli"))
+
+from address_book_classes import AddressBook, Record, Name, Phone, Birthday, Email, Address  # noqa: E402
+from notes_classes import Notes  # noqa: E402
+
+FIRST_NAMES = [
+    "John", "Jane", "Zoë", "José", "François", "Łukasz", "Søren", "Mária", "O'brien", "D'angelo",
+    "Олександр", "Олена", "Андрій", "Марʼяна", "Ірина", "Юрій", "Дмитро", "Наталія", "Sofía", "Chloé",
+]
+LAST_NAMES = [
+    "Smith", "Müller", "Kowalski", "Новак", "Шевченко", "Коваленко", "Бондар", "García", "Løvholt", "Černý",
+]
+CITIES = ["Kyiv", "Lviv", "Odesa", "Kharkiv", "Dnipro", "Berlin", "Warsaw", "London", "Paris", "Kraków"]
+STREETS = ["Khreshchatyk str", "Main St", "Oak Ave", "Shevchenka blvd", "Market sq", "Rynok sq"]
+DOMAINS = ["gmail.com", "ukr.net", "example.com", "outlook.com", "i.ua"]
+WORDS = [
+    "meeting", "call", "buy", "milk", "report", "deadline", "project", "review", "зустріч", "дзвінок",
+    "купити", "звіт", "завтра", "budget", "release", "notes", "plan", "idea", "todo", "травень",
+]
+TAGS = ["work", "home", "asap", "ideas", "shopping", "робота", "дім", "later", "family", "travel"]
+# syllables of made-up second surnames, which keep generated names distinct without digits,
+# as duplicate detection compares only the letters of names
+SYLLABLES = [consonant + vowel for consonant in "bdhklmnprstvz" for vowel in "aeiou"]
+# share of contacts added again with a typo in the name, which duplicate detection should find
+DUPLICATE_SHARE = 0.02
+
+
+def generate_name(rnd: random.Random, names: list[str]) -> str:
+    """
+    :return: made-up surname of four syllables, first name and another surname,
+    or one of the names with a letter left out, as a contact entered twice with a typo
+    """
+    if names and rnd.random() < DUPLICATE_SHARE:
+        name = rnd.choice(names)
+        typo = rnd.randrange(1, len(name))
+        return name[:typo] + name[typo + 1:]
+    second = "".join(rnd.choice(SYLLABLES) for _ in range(4))
+    return f"{second}_{rnd.choice(FIRST_NAMES)}"
+
+
+def generate_address_book(size: int, seed: int = 42) -> AddressBook:
+    """
+    :return: address book with `size` contacts having 1-3 phones and optional birthday, email and address
+    """
+    rnd = random.Random(seed)
+    address_book = AddressBook()
+    names = []
+    for i in range(size):
+        name = generate_name(rnd, names)
+        while address_book.find(Name(name)) is not None:
+            name = generate_name(rnd, names)
+        names.append(name)
+        record = Record(Name(name), Phone(f"{rnd.randrange(10 ** 10):010d}"))
+        for _ in range(rnd.randrange(3)):
+            record.add_phone(Phone(f"{rnd.randrange(10 ** 10):010d}"))
+        if rnd.random() < 0.7:
+            record.add_birthday(Birthday(f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{rnd.randint(1950, 2010)}"))
+        if rnd.random() < 0.5:
+            record.add_email(Email(f"user{i}@{rnd.choice(DOMAINS)}"))
+        if rnd.random() < 0.5:
+            record.add_address(Address(f"{rnd.choice(CITIES)}, {rnd.choice(STREETS)}, {rnd.randint(1, 200)}"))
+        address_book.add_record(record)
+    return address_book
+
+
+def generate_notes(size: int, seed: int = 42) -> Notes:
+    """
+    :return: notebook with `size` notes of 5-60 words and 0-3 tags
+    """
+    rnd = random.Random(seed)
+    notebook = Notes()
+    for i in range(size):
+        notebook.add_note(" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 60))))
+        for tag in rnd.sample(TAGS, rnd.randrange(4)):
+            notebook.add_tag(i + 1, tag)
+    return notebook
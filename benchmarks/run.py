@@ -0,0 +1,283 @@
+"""
+Times every command of the bot plus loading, saving and birthday lookup on generated data.
+
+    python benchmarks/run.py --sizes 10000 100000 --out results.json
+    python benchmarks/run.py --sizes 10000 --compare baseline.json --threshold 0.5
+
+Operations are timed in rounds, and regressions are found by the fastest of the timed runs, which is the least
+disturbed by other work on the machine, and only if it grew by more than --min-delta too, since the fastest
+operations take about as long as the noise. Even the fastest runs of identical code vary by up to 40% between
+runs on a busy or virtual machine, so smaller thresholds need a quiet machine.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from generate import generate_address_book, generate_notes
+
+import commands  # noqa: E402  (bot_cli is put on sys.path by generate)
+from constants import FILE_PATH_CONTACTS, FILE_PATH_NOTES  # noqa: E402
+from notes_classes import Notes  # noqa: E402
+from address_book_classes import AddressBook, Record, Name, Phone  # noqa: E402
+from backups import contact_backups, note_backups  # noqa: E402
+from profiling import PROFILER  # noqa: E402
+from tenants import BookManager  # noqa: E402
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))]
+
+
+def traced_mem_report(book: AddressBook, notebook: Notes):
+    """
+    mem-report as with --trace-memory, the tracing is stopped again so it doesn't slow down the other operations
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        commands.mem_report(book, notebook)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+
+def profiled_show_phones(book: AddressBook, name: str, path: str):
+    """
+    profile start, a profiled show-phone command and profile stop
+    """
+    commands.profile(["start"])
+    PROFILER.run(commands.show_phones, book, [name])
+    commands.profile(["stop", path])
+
+
+def tenant_manager(work_dir: str) -> BookManager:
+    """
+    :return: manager of two tenants with copies of the generated books and a budget for only one of them,
+    so every switch loads a tenant from its files
+    """
+    for tenant in ("first", "second"):
+        os.makedirs(os.path.join(work_dir, "tenants", tenant))
+        for path in (FILE_PATH_CONTACTS, FILE_PATH_NOTES):
+            shutil.copy(path, os.path.join(work_dir, "tenants", tenant, path))
+    return BookManager(os.path.join(work_dir, "tenants"), memory_budget=0)
+
+
+def operations(book: AddressBook, names: list[str], notebook: Notes, manager: BookManager):
+    """
+    Every operation is a function of the repetition number, so mutating commands work on a different record each time
+    """
+    n = len(names)
+    yield "help", lambda i: commands.help()
+    yield "get_matching_commands", lambda i: commands.get_matching_commands("shwo-phone")
+    yield "parse_input", lambda i: commands.parse_input("add-contact John 1234567890")
+    yield "add_contact", lambda i: commands.add_contact(book, [f"Benchmark{i}", "1234567890"])
+    yield "show_phones", lambda i: commands.show_phones(book, [names[i % n]])
+    yield "add_email", lambda i: commands.add_email(book, [names[i % n], f"bench{i}@example.com"])
+    yield "show_email", lambda i: commands.show_email(book, [names[i % n]])
+    yield "add_birthday", lambda i: commands.add_birthday(book, [names[i % n], "01.02.1990"])
+    yield "show_birthday", lambda i: commands.show_birthday(book, [names[i % n]])
+    yield "add_address", lambda i: commands.add_address(book, [names[i % n], "Kyiv,", "Main", "St", "1"])
+    yield "show_address", lambda i: commands.show_address(book, [names[i % n]])
+    yield "change_phone", lambda i: commands.change_phone(
+        book, [names[i % n], book.data[names[i % n]].phones[0].value, f"{i:010d}"])
+    yield "search_contacts", lambda i: (commands.query_cache.clear(), commands.search_contacts(book, ["kyiv"]))
+    yield "search_contacts_cached", lambda i: commands.search_contacts(book, ["kyiv"])
+    yield "show_all_contacts", lambda i: commands.show_all_contacts(book, [])
+    yield "show_all_contacts_page", lambda i: commands.show_all_contacts(book, ["--page", str(i + 1), "--size", "20"])
+    yield "birthdays", lambda i: (commands.query_cache.clear(), commands.birthdays(book, ["30"]))
+    yield "get_birthdays_per_period", lambda i: book.get_birthdays_per_period(30)
+    yield "find", lambda i: (commands.query_cache.clear(), commands.find_contacts(book, ["city~Kyiv", "phones>0"]))
+    yield "find_duplicates", lambda i: commands.find_duplicates(book)
+    yield "merge_contacts", lambda i: (book.add_record(Record(Name(f"MergeA{i}"), Phone("1234567890"))),
+                                       book.add_record(Record(Name(f"MergeB{i}"), Phone("0987654321"))),
+                                       commands.merge_contacts(book, [f"MergeA{i}", f"MergeB{i}"]))
+    yield "delete_contact", lambda i: commands.delete_contact(book, [f"Benchmark{i}"])
+    yield "show_reminders", lambda i: commands.show_reminders(book, ["30"])
+    yield "add_note", lambda i: commands.add_note(notebook, ["benchmark", "note", str(i)])
+    yield "show_note", lambda i: commands.show_note(notebook, [str(i + 1)])
+    yield "change_note", lambda i: commands.change_note(notebook, [str(i + 1), "changed", "note", "text"])
+    yield "add_tag", lambda i: commands.add_tag(notebook, [str(i + 1), "benchmark"])
+    yield "delete_tag", lambda i: commands.delete_tag(notebook, [str(i + 1), "benchmark"])
+    yield "search_note", lambda i: (commands.query_cache.clear(), commands.search_note(notebook, ["звіт", "project"]))
+    yield "show_all_notes", lambda i: commands.show_all_notes(notebook, [])
+    yield "show_all_notes_page", lambda i: commands.show_all_notes(notebook, ["--page", str(i + 1)])
+    yield "append_note", lambda i: commands.append_note(notebook, [str(i + 1), "appended", "text"])
+    yield "similar_notes", lambda i: commands.similar_notes(notebook, [str(i + 1)])
+    yield "dedupe_notes", lambda i: commands.dedupe_notes(notebook)
+    yield "merge_notes", lambda i: (commands.add_note(notebook, ["benchmark", "merged", "note", str(i)]),
+                                    commands.add_note(notebook, ["benchmark", "merged", "note", str(i)]),
+                                    commands.merge_notes(notebook, [str(len(notebook.data["notes"]) - 1),
+                                                                    str(len(notebook.data["notes"]))]))
+    yield "tags", lambda i: commands.show_tags(notebook, [])
+    # renames the tag back and forth, so every run finds it
+    yield "rename_tag", lambda i: commands.rename_tag(notebook, ["work", "job"] if i % 2 == 0 else ["job", "work"])
+    yield "remove_note", lambda i: commands.remove_note(notebook, [str(len(notebook.data["notes"]))])
+    yield "sync", lambda i: commands.sync_replicas(book, notebook, ["replica"])
+    # the export is written by a thread, which is waited for
+    yield "export", lambda i: (commands.export(book, notebook, [f"export{i}"]), commands.exports[-1].thread.join(),
+                               commands.finished_exports())
+    yield "restore_contacts", lambda i: commands.restore(
+        book, notebook, ["contacts", str(book.backups.versions[-1]["version"])])
+    yield "restore_notes", lambda i: commands.restore(
+        book, notebook, ["notes", str(notebook.backups.versions[-1]["version"])])
+    yield "cache_stats", lambda i: commands.cache_stats(book, notebook)
+    yield "stats", lambda i: commands.stats()
+    yield "mem_report", lambda i: traced_mem_report(book, notebook)
+    yield "profile", lambda i: profiled_show_phones(book, names[i % n], "profile.pstats")
+    yield "use", lambda i: commands.use_tenant(manager, ["first" if i % 2 == 0 else "second"])
+    yield "save_contacts", lambda i: book.save_contacts(FILE_PATH_CONTACTS)
+    yield "load_contacts", lambda i: AddressBook().load_contacts(FILE_PATH_CONTACTS)
+    yield "save_notes", lambda i: notebook.save_notes(FILE_PATH_NOTES)
+    yield "load_notes", lambda i: Notes().load_notes(FILE_PATH_NOTES)
+
+
+def time_runs(operation, first: int, repeat: int) -> list[float]:
+    """
+    The garbage collector is stopped as by timeit, so its passes don't fall on random runs
+    :return: durations in ms of `repeat` runs numbered from `first`
+    """
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for i in range(first, first + repeat):
+            start = time.perf_counter()
+            operation(i)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        gc.enable()
+    return timings
+
+
+def peak_memory(operation, i: int) -> int:
+    """
+    Memory is measured in a separate run, tracing would distort the timings
+    :return: peak of memory allocated by the run in bytes
+    """
+    tracemalloc.start()
+    operation(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def summary(timings: list[float], peak: int) -> dict:
+    return {
+        "min_ms": round(min(timings), 4),
+        "p50_ms": round(percentile(timings, 50), 4),
+        "p99_ms": round(percentile(timings, 99), 4),
+        "peak_kib": round(peak / 1024, 1),
+        "repeat": len(timings),
+    }
+
+
+def run(sizes: list[int], repeat: int, rounds: int, seed: int) -> dict:
+    """
+    Every round runs every operation `repeat` times, so a slow spell of the machine
+    slows down a part of the runs of many operations instead of all runs of a few
+    """
+    results = {}
+    cwd = os.getcwd()
+    for size in sizes:
+        print(f"Generating {size} contacts and notes...", file=sys.stderr)
+        book = generate_address_book(size, seed)
+        notebook = generate_notes(size, seed)
+        names = list(book.data.keys())
+        results[str(size)] = {}
+        with tempfile.TemporaryDirectory() as work_dir:
+            # commands save to files in the working directory
+            os.chdir(work_dir)
+            try:
+                # the saves are recorded as versions, as when the assistant runs, which the restores bring back
+                contact_backups(book, FILE_PATH_CONTACTS)
+                note_backups(notebook, FILE_PATH_NOTES)
+                book.save_contacts(FILE_PATH_CONTACTS)
+                notebook.save_notes(FILE_PATH_NOTES)
+                operations_ = list(operations(book, names, notebook, tenant_manager(work_dir)))
+                timings = {name: [] for name, _ in operations_}
+                with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                    for round_ in range(rounds):
+                        print(f"Round {round_ + 1} of {rounds}...", file=sys.stderr)
+                        for name, operation in operations_:
+                            timings[name] += time_runs(operation, round_ * repeat, repeat)
+                for name, operation in operations_:
+                    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                        result = summary(timings[name], peak_memory(operation, rounds * repeat))
+                    results[str(size)][name] = result
+                    print(f"{size:>8} {name:<28} min {result['min_ms']:>10.3f} ms  p50 {result['p50_ms']:>10.3f} ms  "
+                          f"p99 {result['p99_ms']:>10.3f} ms  peak {result['peak_kib']:>10.1f} KiB", file=sys.stderr)
+            finally:
+                os.chdir(cwd)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float) -> list[str]:
+    """
+    Compares the fastest runs, or p50 of baselines saved without them
+    :return: descriptions of operations whose time grew by more than `threshold` (0.5 is 50%) and `min_delta` ms
+    """
+    regressions = []
+    for size, operations_ in results.items():
+        for name, result in operations_.items():
+            before = baseline.get(size, {}).get(name)
+            if not before:
+                continue
+            key = "min_ms" if "min_ms" in before else "p50_ms"
+            if before[key] <= 0:
+                continue
+            change = result[key] / before[key] - 1
+            if change > threshold and result[key] - before[key] > min_delta:
+                regressions.append(f"{size} {name}: {key[:-3]} {before[key]} ms -> {result[key]} ms (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000], help="numbers of contacts and notes")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs of every operation in every round")
+    parser.add_argument("--rounds", type=int, default=3, help="rounds of runs of all operations")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="benchmark_results.json", help="where to save the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.5, help="allowed growth of the fastest run, 0.5 is 50%%")
+    parser.add_argument("--min-delta", type=float, default=0.05, metavar="MS",
+                        help="growth in ms below which a change is noise, whatever its share")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.rounds, args.seed)
+    with open(args.out, "w") as file:
+        json.dump({
+            "meta": {
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+            },
+            "results": results,
+        }, file, indent=4)
+    print(f"Results were saved to '{args.out}'", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions found", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
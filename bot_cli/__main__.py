@@ -1,95 +1,316 @@
+import argparse
 import os.path
+import time
+import tracemalloc
 
 import commands
-from constants import FILE_PATH_CONTACTS, FILE_PATH_NOTES
-from print_util import print_error, print_info, print_warn
+from backups import contact_backups, note_backups, keep_damaged
+from completion import Completer, setup_completion
+from constants import FILE_PATH_CONTACTS, FILE_PATH_NOTES, TENANT_MEMORY_BUDGET, REMINDER_LEAD_DAYS
+from instrumentation import METRICS
+from parallel_scan import SCANNER
+from profiling import PROFILER
+from reminders import birthday_scheduler
+from startup import DeferredLoad, StartupTimings
+from tenants import BookManager
+from validation import VALIDATOR, format_errors
+from watcher import DataWatcher
+from print_util import print_error, print_info, print_warn, print_magenta
 
 
-def main(address_book, notebook):
+def dispatch(command: str, args: list, address_book, notebook) -> bool:
     """
-    Assistant bot helps to collect and manage user contacts.
+    Runs one command entered by the user
+    :return: False when the user wants to close the assistant
+    """
+    match command:
+        case "help":
+            commands.help()
+        case "hello":
+            print_info("How can I help you?")
+        case "add-contact":
+            commands.add_contact(address_book, args)
+        case "add-note":
+            commands.add_note(notebook, args)
+        case "append-note":
+            commands.append_note(notebook, args)
+        case "change-note":
+            commands.change_note(notebook, args)
+        case "delete-note":
+            commands.remove_note(notebook, args)
+        case "search-note":
+            commands.search_note(notebook, args)
+        case "add-address":
+            commands.add_address(address_book, args)
+        case "show-address":
+            commands.show_address(address_book, args)
+        case "add-email":
+            commands.add_email(address_book, args)
+        case "show-email":
+            commands.show_email(address_book, args)
+        case "show-note":
+            commands.show_note(notebook, args)
+        case "add-tag":
+            commands.add_tag(notebook, args)
+        case "delete-tag":
+            commands.delete_tag(notebook, args)
+        case "tags":
+            commands.show_tags(notebook, args)
+        case "rename-tag":
+            commands.rename_tag(notebook, args)
+        case "all-notes" | "all-note":
+            commands.show_all_notes(notebook, args)
+        case "delete-contact":
+            commands.delete_contact(address_book, args)
+        case "change-phone":
+            commands.change_phone(address_book, args)
+        case "show-phone" | "phone":
+            commands.show_phones(address_book, args)
+        case "all-contacts" | "all-contact":
+            commands.show_all_contacts(address_book, args)
+        case "add-birthday":
+            commands.add_birthday(address_book, args)
+        case "show-birthday":
+            commands.show_birthday(address_book, args)
+        case "search-contacts" | "search-contact":
+            commands.search_contacts(address_book, args)
+        case "find":
+            commands.find_contacts(address_book, args)
+        case "find-duplicates":
+            commands.find_duplicates(address_book)
+        case "merge-contacts":
+            commands.merge_contacts(address_book, args)
+        case "similar-notes":
+            commands.similar_notes(notebook, args)
+        case "dedupe-notes":
+            commands.dedupe_notes(notebook)
+        case "merge-notes":
+            commands.merge_notes(notebook, args)
+        case "reminders":
+            commands.show_reminders(address_book, args)
+        case "birthdays":
+            commands.birthdays(address_book, args)
+        case "cache-stats":
+            commands.cache_stats(address_book, notebook)
+        case "stats":
+            commands.stats()
+        case "sync":
+            commands.sync_replicas(address_book, notebook, args)
+        case "export":
+            commands.export(address_book, notebook, args)
+        case "restore":
+            commands.restore(address_book, notebook, args)
+        case "profile":
+            commands.profile(args)
+        case "mem-report":
+            commands.mem_report(address_book, notebook)
+        case "close" | "exit":
+            print_info("Goodbye!")
+            return False
+        case _:
+            matching_commands = commands.get_matching_commands(command)
+            if len(matching_commands) > 0:
+                print_info("Did you mean this?")
+                print_info("\n".join(matching_commands))
+            else:
+                print_error("Invalid command. Please try again")
+    return True
 
-    To see available commands enter 'help' command
+
+def run_command(command: str, args: list, address_book, notebook) -> bool:
+    """
+    Dispatches the command inside the profiler while profiling is running
     """
+    if PROFILER.active:
+        return PROFILER.run(dispatch, command, args, address_book, notebook)
+    return dispatch(command, args, address_book, notebook)
 
+
+# commands that read or change notes, the first of them loads the notebook
+NOTE_COMMANDS = {
+    "add-note", "append-note", "change-note", "delete-note", "search-note", "show-note", "add-tag", "delete-tag",
+    "tags", "rename-tag", "all-notes", "similar-notes", "dedupe-notes", "merge-notes", "sync", "export", "restore",
+    "mem-report",
+}
+
+
+def load_notebook(notebook) -> str:
+    """
+    Loads notes from the file in the working directory, run by a DeferredLoad
+    :return: message about the loaded notebook
+    """
+    try:
+        if not os.path.exists(FILE_PATH_NOTES):
+            return "New notebook was created"
+        notebook.load_notes(FILE_PATH_NOTES)
+        note_backups(notebook, FILE_PATH_NOTES).verify()
+        return f"Notes were loaded from '{FILE_PATH_NOTES}' file"
+    finally:
+        # every save is recorded as a version that the restore command can bring back
+        note_backups(notebook, FILE_PATH_NOTES)
+
+
+def finish_notes_load(notes_load: DeferredLoad, notebook, watcher: DataWatcher, timings: bool):
+    """
+    Loads the notebook, reports it and starts watching its file
+    """
+    notes_load.run()
+    if notes_load.error is None:
+        print_info(notes_load.message)
+    elif isinstance(notes_load.error, ValueError):
+        print_error(f"'{FILE_PATH_NOTES}' file is damaged ({notes_load.error}), it was copied to "
+                    f"'{keep_damaged(FILE_PATH_NOTES)}', enter 'restore notes' to see its backups")
+    else:
+        print_error(f"Notes couldn't be loaded: {notes_load.error}")
+    if timings:
+        print_info(f"Notes were loaded in {notes_load.seconds * 1000:.1f} ms")
+    watcher.watch_notes(notebook)
+
+
+def load_books(address_book, notebook, startup: StartupTimings) -> DeferredLoad:
+    """
+    Loads contacts from the working directory. Notes are loaded by the first note command,
+    so the prompt doesn't wait for them and sessions that only use contacts don't read them
+    :return: loading of the notes, run by the first note command
+    """
+    start = time.perf_counter()
     if os.path.exists(FILE_PATH_CONTACTS):
-        address_book.load_contacts(FILE_PATH_CONTACTS)
-        print_info(f"Contacts were loaded from '{FILE_PATH_CONTACTS}' file")
+        try:
+            address_book.load_contacts(FILE_PATH_CONTACTS)
+            contact_backups(address_book, FILE_PATH_CONTACTS).verify()
+            print_info(f"Contacts were loaded from '{FILE_PATH_CONTACTS}' file")
+            if address_book.load_errors:
+                print_warn(f"{len(address_book.load_errors)} invalid values are not used, saves keep them as they are:\n"
+                           + format_errors(address_book.load_errors))
+        except ValueError as e:
+            print_error(f"'{FILE_PATH_CONTACTS}' file is damaged ({e}), it was copied to "
+                        f"'{keep_damaged(FILE_PATH_CONTACTS)}', enter 'restore contacts' to see its backups")
     else:
         print_info("New address book was created")
+    contact_backups(address_book, FILE_PATH_CONTACTS)
+    startup.step("contacts", start)
+    return DeferredLoad("notes", load_notebook, notebook)
 
-    if os.path.exists(FILE_PATH_NOTES):
-        notebook.load_notes(FILE_PATH_NOTES)
-        print_info(f"Notes were loaded from '{FILE_PATH_NOTES}' file")
+
+def main(address_book, notebook, metrics_file: str = None, manager: BookManager = None, tenant: str = None,
+         reminder_lead: int = REMINDER_LEAD_DAYS, timings: bool = False):
+    """
+    Assistant bot helps to collect and manage user contacts.
+
+    To see available commands enter 'help' command
+    """
+
+    startup = StartupTimings()
+    notes_load = None
+    if manager is not None:
+        current = manager.get(tenant)
+        address_book, notebook = current.address_book, current.notebook
+        print_info(f"Tenant '{tenant}' was loaded from '{current.directory}' directory")
+        startup.step("tenant", startup.start)
     else:
-        print_info("New notebook was created")
+        notes_load = load_books(address_book, notebook, startup)
+
+    start = time.perf_counter()
+    completer = Completer(commands.command_index, address_book, notebook)
+    setup_completion(completer)
+    watcher = DataWatcher(address_book, notebook if notes_load is None else None)
+    startup.step("completion and file watchers", start)
+    if timings:
+        print_info(str(startup))
 
     print_warn(
         "Welcome to the assistant bot!\nEnter a command or 'help' to see available commands."
     )
 
     while True:
-        user_input: str = input("Enter a command: ")
+        # the poll before waiting for input takes note of the files saved by the previous command
+        for change in watcher.poll():
+            print_info(f"Data files were changed by another program: {change}")
+        for name, birthday in birthday_scheduler(address_book, reminder_lead).tick():
+            print_magenta(f"Reminder: {name} has a birthday on {birthday.strftime('%A, %d %B')}")
+        for export in commands.finished_exports():
+            print_info(str(export))
+        try:
+            user_input: str = input("Enter a command: ")
+        except EOFError:
+            # end of commands piped to the bot
+            break
         command, *args = commands.parse_input(user_input)
+        if notes_load is not None and commands.command_index.resolve(command) in NOTE_COMMANDS:
+            finish_notes_load(notes_load, notebook, watcher, timings)
+            notes_load = None
+
+        for change in watcher.poll():
+            print_info(f"Data files were changed by another program: {change}")
+
+        if command == "use":
+            current = commands.use_tenant(manager, args)
+            if current is not None:
+                address_book, notebook = current.address_book, current.notebook
+                completer.address_book, completer.notebook = address_book, notebook
+                watcher = DataWatcher(address_book, notebook)
+            continue
+
+        if METRICS.enabled:
+            start = time.perf_counter()
+            running = run_command(command, args, address_book, notebook)
+            METRICS.observe(commands.command_index.resolve(command) or "unknown",
+                            (time.perf_counter() - start) * 1000)
+        else:
+            running = run_command(command, args, address_book, notebook)
+        if not running:
+            break
+
+    for export in commands.exports:
+        # exports are written by daemon threads, which would be stopped at exit
+        export.thread.join()
+        print_info(str(export))
+
+    if manager is not None:
+        manager.flush_all()
+    else:
+        address_book.scheduler.save_state()
+
+    if metrics_file:
+        METRICS.dump(metrics_file)
+        print_info(f"Metrics were saved to '{metrics_file}' file")
+
 
-        match command:
-            case "help":
-                commands.help()
-            case "hello":
-                print_info("How can I help you?")
-            case "add-contact":
-                commands.add_contact(args)
-            case "add-note":
-                commands.add_note(notebook, args)
-            case "change-note":
-                commands.change_note(notebook, args)
-            case "delete-note":
-                commands.remove_note(notebook, args)
-            case "search-note":
-                commands.search_note(notebook, args)
-            case "add-address":
-                commands.add_address(args)
-            case "show-address":
-                commands.show_address(args)
-            case "add-email":
-                commands.add_email(args)
-            case "show-email":
-                commands.show_email(args)
-            case "show-note":
-                commands.show_note(notebook, args)
-            case "add-tag":
-                commands.add_tag(notebook, args)
-            case "delete-tag":
-                commands.delete_tag(notebook, args)
-            case "all-notes" | "all-note":
-                commands.show_all_notes(notebook)
-            case "delete-contact":
-                commands.delete_contact(args)
-            case "change-phone":
-                commands.change_phone(args)
-            case "show-phone" | "phone":
-                commands.show_phones(args)
-            case "all-contacts" | "all-contact":
-                commands.show_all_contacts()
-            case "add-birthday":
-                commands.add_birthday(args)
-            case "show-birthday":
-                commands.show_birthday(args)
-            case "search-contacts" | "search-contact":
-                commands.search_contacts(args)
-            case "birthdays":
-                commands.birthdays(args)
-            case "close" | "exit":
-                print_info("Goodbye!")
-                break
-            case _:
-                matching_commands = commands.get_matching_commands(command)
-                if len(matching_commands) > 0:
-                    print_info("Did you mean this?")
-                    print_info("\n".join(matching_commands))
-                else:
-                    print_error("Invalid command. Please try again")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Assistant bot helps to collect and manage user contacts.")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record command latency, I/O and errors, shown by the 'stats' command")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="save metrics on exit as JSON, or in Prometheus textfile format if PATH ends with .prom")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="trace memory allocations from the start, reported by the 'mem-report' command")
+    parser.add_argument("--data-dir", metavar="DIR",
+                        help="keep address books and notes of many tenants in DIR/<tenant>, see the 'use' command")
+    parser.add_argument("--tenant", default="default", help="tenant to start with when --data-dir is set")
+    parser.add_argument("--scan-workers", type=int, metavar="N",
+                        help="processes used to search and to validate large books and notebooks, all CPU cores by default")
+    parser.add_argument("--max-resident", type=int, metavar="BYTES",
+                        help="keep about BYTES of contacts and BYTES of notes in memory, spilling the rest to disk")
+    parser.add_argument("--spill-dir", metavar="DIR", help="where spilled contacts and notes are kept, see --max-resident")
+    parser.add_argument("--reminder-lead", type=int, default=REMINDER_LEAD_DAYS, metavar="DAYS",
+                        help="show birthday reminders DAYS days in advance")
+    parser.add_argument("--timings", action="store_true",
+                        help="show how long the startup steps took, and the notes once a note command loads them")
+    parser.add_argument("--memory-budget", type=int, default=TENANT_MEMORY_BUDGET, metavar="BYTES",
+                        help="memory for loaded tenants, least recently used ones are unloaded above it")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    main(commands.address_book, commands.notebook)
+    options = parse_args()
+    if options.trace_memory:
+        tracemalloc.start()
+    METRICS.enabled = options.metrics or options.metrics_file is not None
+    if options.scan_workers:
+        SCANNER.workers = VALIDATOR.workers = options.scan_workers
+    if options.max_resident:
+        commands.address_book.bound_memory(options.max_resident, options.spill_dir)
+        commands.notebook.bound_memory(options.max_resident, options.spill_dir)
+    manager = BookManager(options.data_dir, options.memory_budget) if options.data_dir else None
+    main(commands.address_book, commands.notebook, options.metrics_file, manager, options.tenant,
+         options.reminder_lead, options.timings)
@@ -1,15 +1,31 @@
-import re
+import time
 from datetime import datetime
-import json
 import os.path
 from collections import defaultdict, UserDict
-from constants import FILE_PATH_CONTACTS
+from constants import FILE_PATH_CONTACTS, RECORD_MEMORY_ESTIMATE, VALIDATION_BATCH_ROWS
+from indexes import SortedIndex
+from names import fold, name_key
+from spill import SpillStore, SpillingDict, iter_json_batches, write_json_items
+from storage import atomic_write
+from caching import RENDER_STATS, next_generation
+from instrumentation import instrument_io
+from validation import (VALIDATOR, PHONE_PATTERN, EMAIL_PATTERN, MIN_ADDRESS_LEN, PHONE_ERROR, EMAIL_ERROR,
+                        ADDRESS_ERROR, parse_birthday, validate_chunk)
 
 
 class Field:
     def __init__(self, value):
         self.value = value
 
+    @classmethod
+    def from_valid(cls, value):
+        """
+        Creates the field from a value already checked by the validation engine
+        """
+        field = cls.__new__(cls)
+        field.value = value
+        return field
+
     def __str__(self):
         return self.value
 
@@ -29,19 +45,14 @@ class Name(Field):
 
 class Phone(Field):
     def __init__(self, phone: str):
-        if not re.match(r'\b\d{10}\b', phone):
-            raise ValueError(
-                f"'{phone}' doesn't match the phone format XXXXXXXXXX(10 digits)")
+        if not PHONE_PATTERN.match(phone):
+            raise ValueError(PHONE_ERROR.format(phone))
         super().__init__(phone)
 
 
 class Birthday(Field):
     def __init__(self, birthday):
-        if not re.match(r'\b\d{2}\.\d{2}\.\d{4}\b', birthday):
-            raise ValueError(
-                f"'{birthday}' doesn't match the birthday format DD.MM.YYYY")
-        birthday = datetime.strptime(birthday, '%d.%m.%Y').date()
-        super().__init__(birthday)
+        super().__init__(parse_birthday(birthday))
 
     def __str__(self):
         return datetime.strftime(self.value, '%d.%m.%Y')
@@ -49,22 +60,27 @@ class Birthday(Field):
 
 class Email(Field):
     def __init__(self, email):
-        if not re.match(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b', email):
-            raise ValueError(
-                f"'{email}' is not valid email address")
+        if not EMAIL_PATTERN.match(email):
+            raise ValueError(EMAIL_ERROR.format(email))
         self.email = email
         super().__init__(email)
 
+    @classmethod
+    def from_valid(cls, value):
+        field = super().from_valid(value)
+        field.email = value
+        return field
+
     def __str__(self):
         return str(self.email)
 
 
 class Address(Field):
     def __init__(self, value):
-        if len(value.strip()) > 4:
+        if len(value.strip()) >= MIN_ADDRESS_LEN:
             super().__init__(value)
         else:
-            raise ValueError("Address must be at least 5 symbols")
+            raise ValueError(ADDRESS_ERROR)
 
 
 class Record:
@@ -74,23 +90,48 @@ class Record:
         self.birthday = None
         self.address = None
         self.email = None
+        # values of the file that failed validation, {"phones": [...], field: value}, see validation.validate_chunk.
+        # They are written back by to_json, so a save keeps them for the user to fix, until a valid value replaces them
+        self.rejected = None
+        # cached result of __str__, reset by every method changing the record
+        self._rendered = None
+        # address book the record belongs to, notified about changes
+        self._owner = None
+        # time of the last change, used to resolve sync conflicts
+        self.updated = time.time()
         if phone:
             self.phones.append(phone)
 
+    def _changing(self):
+        if self._owner is not None:
+            self._owner._before_change(self.name.value)
+
+    def _changed(self):
+        self._rendered = None
+        self.updated = time.time()
+        if self._owner is not None:
+            self._owner._record_changed(self)
+
     def add_phone(self, phone: Phone):
         if not phone in self.phones:
+            self._changing()
             self.phone = phone
             self.phones.append(self.phone)
+            self._changed()
 
     def remove_phone(self, phone: Phone):
         for p in self.phones:
             if p.value == phone:
+                self._changing()
                 self.phones.remove(phone)
+                self._changed()
 
     def edit_phone(self, old_phone: Phone, new_phone: Phone):
         for p in self.phones:
             if p.value == old_phone.value:
+                self._changing()
                 p.value = new_phone.value
+                self._changed()
                 return
         raise ValueError(f"Phone '{old_phone}' not found in the record")
 
@@ -103,17 +144,30 @@ class Record:
     def get_phones(self):
         return [phone.value for phone in self.phones]
 
+    def _replace_rejected(self, field: str):
+        if self.rejected is not None:
+            self.rejected.pop(field, None)
+
     def add_birthday(self, birthday: Birthday):
+        self._changing()
         self.birthday = birthday
+        self._replace_rejected("birthday")
+        self._changed()
 
     def show_birthday(self):
         return self.birthday
 
     def add_email(self, email: Email):
+        self._changing()
         self.email = email
+        self._replace_rejected("email")
+        self._changed()
 
     def add_address(self, address: Address):
+        self._changing()
         self.address = address
+        self._replace_rejected("address")
+        self._changed()
 
     def show_address(self):
         return self.address
@@ -121,23 +175,210 @@ class Record:
     def show_email(self):
         return self.email
 
+    def to_json(self) -> dict:
+        rejected = self.rejected or {}
+        return {
+            'name': self.name.value,
+            'phones': [phone.value for phone in self.phones] + rejected.get('phones', []),
+            'birthday': str(self.birthday) if self.birthday else rejected.get('birthday'),
+            'address': self.address.value if self.address else rejected.get('address'),
+            'email': str(self.email) if self.email else rejected.get('email'),
+            'updated': self.updated,
+        }
+
+    @classmethod
+    def from_json(cls, record_data: dict):
+        """
+        Creates a record from its serialized form, invalid values are kept as rejected ones
+        """
+        contacts, _ = validate_chunk([record_data])
+        return cls.from_valid(contacts[0])
+
+    @classmethod
+    def from_valid(cls, contact: dict):
+        """
+        Creates a record from a contact returned by the validation engine, without validating it again
+        """
+        record = cls(Name(contact["name"]))
+        record.phones = [Phone.from_valid(phone) for phone in contact["phones"]]
+        if contact["birthday"]:
+            record.birthday = Birthday.from_valid(contact["birthday"])
+        if contact["email"]:
+            record.email = Email.from_valid(contact["email"])
+        if contact["address"]:
+            record.address = Address.from_valid(contact["address"])
+        record.rejected = contact["rejected"]
+        record.updated = contact["updated"]
+        return record
+
     def __str__(self):
+        if self._rendered is not None:
+            RENDER_STATS.hit()
+            return self._rendered
+        RENDER_STATS.miss()
         address_str = f", address: {self.address.value}" if self.address is not None else ""
         birthday_str = f", birthday: {datetime.strftime(self.birthday.value, '%d.%m.%Y')}" if self.birthday is not None else ""
         email_str = f", email: {self.email}" if self.email is not None else ""
-        return f"Name: {self.name.value}, phones: {'; '.join(p.value for p in self.phones)}{birthday_str}{email_str}{address_str}"
+        self._rendered = f"Name: {self.name.value}, phones: {'; '.join(p.value for p in self.phones)}{birthday_str}{email_str}{address_str}"
+        return self._rendered
 
 
 class AddressBook(UserDict[str, Record]):
 
+    def __init__(self, *args, **kwargs):
+        # sorted contact names, used to list contacts in order
+        self.name_index = SortedIndex()
+        # canonical name keys of the contacts, see names.name_key, used to look names up regardless of their spelling.
+        # Contacts whose names share a key are all kept: the first one is in keys, the others in shadowed
+        self.keys = {}
+        self.shadowed = {}
+        # sorted canonical name keys, used for completion and name prefix queries
+        self.key_index = SortedIndex()
+        # folded texts of the records searched by search-contacts and the generation they were made at
+        self._search_texts = None
+        # changes on every modification of the book or of its records, used to validate cached queries
+        self.generation = next_generation()
+        # file the book is loaded from and saved to, and its generation at that moment
+        self.path = FILE_PATH_CONTACTS
+        self.saved_generation = None
+        # callables notified with (key, record) when a record is added or changed, with (key, None)
+        # when it is deleted and with (None, None) when the whole book is replaced
+        self.observers = []
+        # Merkle tree of record digests, built by sync on first use
+        self.merkle_tree = None
+        # secondary indexes used by the find command, built on first use
+        self.query_indexes = None
+        # birthday reminders, see reminders.birthday_scheduler
+        self.scheduler = None
+        # open snapshots, which keep the records changed while they are read, see snapshots.Snapshot
+        self.snapshots = []
+        # versions of the contacts file, recorded by every save, see backups.contact_backups
+        self.backups = None
+        # invalid values left out by the last load, see validation.RowError
+        self.load_errors = []
+        super().__init__(*args, **kwargs)
+
+    def _notify(self, key: str | None, record: Record | None):
+        self.generation = next_generation()
+        for observer in self.observers:
+            observer(key, record)
+
+    def _before_change(self, key: str | None):
+        if self.snapshots:
+            self.snapshots = [snapshot for snapshot in self.snapshots if not snapshot.closed]
+            for snapshot in self.snapshots:
+                snapshot.preserve(key)
+
+    def __setitem__(self, key: str, record: Record):
+        self._before_change(key)
+        if key not in self.data:
+            self.name_index.add(key)
+            self._index_key(key)
+        self.data[key] = record
+        record._owner = self
+        self._notify(key, record)
+
+    def __delitem__(self, key: str):
+        self._before_change(key)
+        self.data[key]._owner = None
+        del self.data[key]
+        self.name_index.remove(key)
+        self._unindex_key(key)
+        self._notify(key, None)
+
+    def _index_key(self, key: str):
+        canonical = name_key(key)
+        indexed = self.keys.get(canonical)
+        if indexed is None:
+            self.keys[canonical] = key
+            self.key_index.add(canonical)
+        elif indexed != key:
+            self.shadowed.setdefault(canonical, []).append(key)
+
+    def _unindex_key(self, key: str):
+        canonical = name_key(key)
+        others = self.shadowed.get(canonical)
+        if self.keys.get(canonical) == key:
+            if others:
+                self.keys[canonical] = others.pop(0)
+            else:
+                del self.keys[canonical]
+                self.key_index.remove(canonical)
+        elif others and key in others:
+            others.remove(key)
+        if others == []:
+            del self.shadowed[canonical]
+
+    def _rebuild_keys(self):
+        self.keys, self.shadowed = {}, {}
+        for key in self.data.keys():
+            canonical = name_key(key)
+            if canonical in self.keys:
+                self.shadowed.setdefault(canonical, []).append(key)
+            else:
+                self.keys[canonical] = key
+        self.key_index = SortedIndex(self.keys)
+
+    def name_keys(self, canonical: str) -> list[str]:
+        """
+        :return: keys of the contacts with the canonical name key
+        """
+        key = self.keys.get(canonical)
+        if key is None:
+            return []
+        return [key, *self.shadowed.get(canonical, ())]
+
+    def search_texts(self):
+        """
+        Folded texts of the records in the order of get_records, made once per generation of the book.
+        In bounded memory mode they are made on every call and not kept, since they would hold a copy of every record
+        """
+        if isinstance(self.data, SpillingDict):
+            return (fold(str(record)) for record in self.data.values())
+        if self._search_texts is None or self._search_texts[0] != self.generation:
+            self._search_texts = (self.generation, [fold(str(record)) for record in self.data.values()])
+        return self._search_texts[1]
+
+    def _record_changed(self, record: Record):
+        if isinstance(self.data, SpillingDict):
+            # the record may have been spilled to disk while it was being changed
+            self.data[record.name.value] = record
+        self._notify(record.name.value, record)
+
+    def bound_memory(self, max_bytes: int, directory: str = None):
+        """
+        Keeps about max_bytes of records in memory, the least recently used ones are spilled
+        to a file in the directory and read back when they are accessed
+        """
+        data = SpillingDict(SpillStore("contacts", max_bytes, Record.to_json, self._load_record,
+                                       lambda record: RECORD_MEMORY_ESTIMATE, directory))
+        for key, record in self.data.items():
+            data[key] = record
+        self.data = data
+
+    def _load_record(self, record_data: dict) -> Record:
+        record = Record.from_json(record_data)
+        record._owner = self
+        return record
+
     def add_record(self, record: Record):
-        self.data[record.name.value] = record
+        self[record.name.value] = record
+
+    def key_of(self, name: Name) -> str | None:
+        """
+        :return: key of the contact with the name spelled exactly so, otherwise of the first contact
+        with the same canonical key, see names.name_key
+        """
+        if name.value in self.data:
+            return name.value
+        return self.keys.get(name_key(name.value))
 
     def find(self, name: Name) -> Record | None:
-        return self.get(name.value)
+        key = self.key_of(name)
+        return None if key is None else self.data[key]
 
     def delete(self, name: Name):
-        self.__delitem__(name.value)
+        self.__delitem__(self.key_of(name))
 
     def get_records(self) -> list[Record]:
         return self.data.values()
@@ -145,51 +386,45 @@ class AddressBook(UserDict[str, Record]):
     @classmethod
     def from_json(cls, data):
         address_book = cls()
-        for name, record_data in data.items():
-            name_field = Name(record_data['name'])
-            record = Record(name_field)
-
-            phones = [Phone(phone) for phone in record_data['phones']]
-            for phone in phones:
-                record.add_phone(phone)
-
-            if record_data['birthday']:
-                birthday = Birthday(record_data['birthday'])
-                record.add_birthday(birthday)
-
-            if record_data["address"]:
-                address = Address(record_data['address'])
-                record.add_address(address)
-
-            if record_data['email']:
-                email = Email(record_data['email'])
-                record.add_email(email)
-
-            address_book.add_record(record)
+        contacts, address_book.load_errors = VALIDATOR.validate(list(data.values()))
+        for contact in contacts:
+            address_book.add_record(Record.from_valid(contact))
 
         return address_book
 
+    @instrument_io("read")
     def load_contacts(self, path):
         with open(path, "r") as file:
-            data = json.load(file)
-            address_book = AddressBook.from_json(data)
-            self.data = address_book.data
-
+            self._before_change(None)
+            bounded = isinstance(self.data, SpillingDict)
+            if bounded:
+                self.data.clear()
+            else:
+                self.data = {}
+            # records are validated in batches; in bounded memory mode they are also read in batches,
+            # so the file is never held in memory
+            self.load_errors = []
+            for start, batch in iter_json_batches(file, VALIDATION_BATCH_ROWS, stream=bounded):
+                contacts, errors = VALIDATOR.validate(batch, start)
+                self.load_errors.extend(errors)
+                for contact in contacts:
+                    record = Record.from_valid(contact)
+                    record._owner = self
+                    self.data[record.name.value] = record
+            self.name_index = SortedIndex(self.data.keys())
+            self._rebuild_keys()
+            self._notify(None, None)
+        self.path = path
+        self.saved_generation = self.generation
+
+    @instrument_io("written")
     def save_contacts(self, path):
-        with open(path, "w") as file:
-            def custom_serializer(obj):
-                if isinstance(obj, Record):
-                    return {
-                        'name': obj.name.value,
-                        'phones': [phone.value for phone in obj.phones],
-                        'birthday': str(obj.birthday) if obj.birthday else None,
-                        'address': obj.address.value if obj.address else None,
-                        'email': str(obj.email) if obj.email else None,
-
-                    }
-                return obj
-
-            json.dump(self.data, file, default=custom_serializer, indent=4)
+        with atomic_write(path) as file:
+            write_json_items(file, ((key, record.to_json()) for key, record in self.data.items()))
+        self.path = path
+        self.saved_generation = self.generation
+        if self.backups is not None and os.path.abspath(path) == self.backups.path:
+            self.backups.record(file.crc)
 
     def get_birthdays_per_period(self, period: int = 7) -> dict | None:
         upcoming_birthdays = defaultdict(list)
@@ -0,0 +1,282 @@
+import json
+import os
+import shutil
+import time
+import zlib
+
+from address_book_classes import AddressBook
+from constants import BACKUP_CRC_CHUNK_SIZE, BACKUP_DIRECTORY, BACKUP_VERSIONS, BACKUP_FULL_EVERY
+from notes_classes import Notes, note_log_path, read_note_log
+from spill import write_json_items
+from storage import atomic_write
+from sync import file_signature
+
+
+class BackupError(ValueError):
+    pass
+
+
+class Backups:
+    """
+    Versions of a contacts or notes file, kept in BACKUP_DIRECTORY next to it.
+    As an observer of the book it collects the keys changed since the previous version,
+    and every save stores only those records, so it costs as much as the change.
+    Every BACKUP_FULL_EVERY-th version is stored whole, so a restore reads at most that many backups.
+    The manifest lists the versions with the CRC of their backups and the CRC and signature of the file they restore
+    """
+
+    def __init__(self, book, path: str):
+        self.book = book
+        self.path = os.path.abspath(path)
+        self.directory = os.path.join(os.path.dirname(self.path), BACKUP_DIRECTORY)
+        self.manifest_path = os.path.join(self.directory, f"{os.path.basename(self.path)}.manifest.json")
+        try:
+            with open(self.manifest_path, "r") as file:
+                self.versions = json.load(file)["versions"]
+        except FileNotFoundError:
+            self.versions = []
+        # keys changed since the last version; a key deleted or added again moves to the end,
+        # so new keys are in the order of the book, to which they are added at the end
+        self.dirty = {}
+        # keys deleted since the last version, including the ones added again
+        self.deleted = set()
+        # the next version is stored whole: the book was replaced, or the file isn't the last version,
+        # e.g. it was changed by another program, so the changes since then are unknown
+        self.reloaded = not self.versions or self.versions[-1].get("signature") != file_signature(self.path)
+        book.observers.append(self)
+
+    def __call__(self, key, value):
+        if key is None:
+            self.reloaded = True
+            self.dirty.clear()
+            self.deleted.clear()
+            return
+        if value is None or key in self.deleted:
+            self.dirty.pop(key, None)
+        if value is None:
+            self.deleted.add(key)
+        self.dirty[key] = None
+
+    def record(self, data_crc: int):
+        """
+        Stores the changes since the last version as a new version, called after the book was saved to the file
+        :param data_crc: CRC-32 of the saved file
+        """
+        if not self.reloaded and not self.dirty:
+            # the file was saved without changes, the last version still matches it
+            self.versions[-1]["signature"] = file_signature(self.path)
+            self._write_manifest()
+            return
+
+        version = self.versions[-1]["version"] + 1 if self.versions else 1
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{os.path.basename(self.path)}.{version}.json"
+        with atomic_write(os.path.join(self.directory, name)) as file:
+            if self.reloaded or self.diffs_since_full() + 1 >= BACKUP_FULL_EVERY:
+                kind, changes = "full", len(self)
+                # written item by item, so it doesn't need another copy of the book in memory
+                file.write('{"full": [')
+                for index, item in enumerate(self.items()):
+                    file.write((", " if index else "") + json.dumps(item))
+                file.write("]}")
+            else:
+                changed, deleted = [], []
+                for key in self.dirty:
+                    value = self.value(key)
+                    # a key deleted and added again is deleted first, so it is restored at the end as in the book
+                    if key in self.deleted:
+                        deleted.append(key)
+                    if value is not None:
+                        changed.append([key, value])
+                kind, changes = "diff", len(changed) + len(deleted)
+                file.write(json.dumps({"set": changed, "deleted": deleted}))
+        self.versions.append({"version": version, "time": time.time(), "kind": kind, "file": name,
+                              "crc": file.crc, "data_crc": data_crc, "signature": file_signature(self.path),
+                              "changes": changes})
+        pruned = self.prune()
+        self._write_manifest()
+        # backups are deleted only after the manifest stopped listing them
+        for entry in pruned:
+            path = os.path.join(self.directory, entry["file"])
+            if os.path.exists(path):
+                os.remove(path)
+        self.dirty.clear()
+        self.deleted.clear()
+        self.reloaded = False
+
+    def _write_manifest(self):
+        with atomic_write(self.manifest_path) as file:
+            file.write(json.dumps({"versions": self.versions}, indent=4))
+
+    def verify(self):
+        """
+        Checks the file against the CRC-32 recorded when it was saved, if it still has the size and
+        modification time of that save; a file changed by another program can't be checked
+        :raise BackupError: the content differs from the saved one
+        """
+        if not self.versions or "data_crc" not in self.versions[-1]:
+            return
+        if self.versions[-1]["signature"] != file_signature(self.path):
+            return
+        crc = 0
+        with open(self.path, "rb") as file:
+            while chunk := file.read(BACKUP_CRC_CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+        if crc != self.versions[-1]["data_crc"]:
+            raise BackupError(f"its CRC-32 doesn't match the one of version {self.versions[-1]['version']}")
+
+    def diffs_since_full(self) -> int:
+        count = 0
+        for entry in reversed(self.versions):
+            if entry["kind"] == "full":
+                return count
+            count += 1
+        return count
+
+    def prune(self) -> list:
+        """
+        Drops the versions older than the last BACKUP_VERSIONS ones and the full backup they start from
+        :return: dropped versions
+        """
+        keep = len(self.versions) - BACKUP_VERSIONS
+        while keep > 0 and self.versions[keep]["kind"] != "full":
+            keep -= 1
+        pruned = self.versions[:max(keep, 0)]
+        del self.versions[:max(keep, 0)]
+        return pruned
+
+    def read(self, entry: dict) -> dict:
+        path = os.path.join(self.directory, entry["file"])
+        with open(path, "rb") as file:
+            content = file.read()
+        if zlib.crc32(content) != entry["crc"]:
+            raise BackupError(f"Backup of version {entry['version']} is damaged")
+        return json.loads(content)
+
+    def rebuild(self, version: int) -> dict:
+        """
+        Applies the diffs of the version and the versions before it to their full backup
+        :return: records of the version by key, in the order of the file
+        """
+        index = next((index for index, entry in enumerate(self.versions) if entry["version"] == version), None)
+        if index is None:
+            raise BackupError(f"There is no backup of version {version}")
+        start = index
+        while self.versions[start]["kind"] != "full":
+            start -= 1
+            if start < 0:
+                raise BackupError(f"Full backup before version {version} is missing")
+        records = {}
+        for entry in self.versions[start:index + 1]:
+            content = self.read(entry)
+            if "full" in content:
+                records = dict(content["full"])
+                continue
+            for key in content["deleted"]:
+                records.pop(key, None)
+            # changed records keep their place, new ones are added at the end
+            for key, value in content["set"]:
+                records[key] = value
+        return records
+
+    def restore(self, version: int) -> int:
+        """
+        Replaces the file and the book with the version, which is then recorded as the newest version
+        :return: number of restored records
+        """
+        records = self.rebuild(version)
+        entry = next(entry for entry in self.versions if entry["version"] == version)
+        with atomic_write(self.path) as file:
+            self.write(file, records)
+            # raised before the file is replaced, so a damaged rebuild doesn't overwrite it
+            if "data_crc" in entry and file.crc != entry["data_crc"]:
+                raise BackupError(f"Version {version} rebuilt from the backups doesn't match its CRC-32, "
+                                  f"the backups are damaged")
+        self.load()
+        self.record(file.crc)
+        return len(records)
+
+    def __str__(self):
+        if not self.versions:
+            return f"There are no backups of '{os.path.basename(self.path)}'"
+        lines = [f"Backups of '{os.path.basename(self.path)}':"]
+        for entry in reversed(self.versions):
+            saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"]))
+            lines.append(f"{entry['version']:>6}  {saved}  {entry['kind']:<4}  {entry['changes']} records")
+        return "\n".join(lines)
+
+
+class ContactBackups(Backups):
+    def __len__(self):
+        return len(self.book.data)
+
+    def value(self, key: str) -> dict | None:
+        record = self.book.data.get(key)
+        return None if record is None else record.to_json()
+
+    def items(self):
+        return ([key, record.to_json()] for key, record in self.book.data.items())
+
+    def write(self, file, records: dict):
+        write_json_items(file, records.items())
+
+    def load(self):
+        self.book.load_contacts(self.path)
+
+
+class NoteBackups(Backups):
+    """
+    Notes added since the previous version are stored in the order they were added,
+    and a restore adds them at the end, so restored notes keep the notebook order
+    """
+
+    def __init__(self, notebook: Notes, path: str):
+        super().__init__(notebook, path)
+        if not self.reloaded:
+            # the loaded notes include the appends logged since the notes file was saved
+            for delta in read_note_log(self.path):
+                self.dirty[delta["uid"]] = None
+
+    def __len__(self):
+        return len(self.book.data["notes"])
+
+    def value(self, uid: str) -> dict | None:
+        data = self.book.uids.get(uid)
+        return None if data is None else Notes.entry_to_json(data)
+
+    def items(self):
+        return ([data["uid"], Notes.entry_to_json(data)] for data in self.book.data["notes"])
+
+    def write(self, file, records: dict):
+        write_json_items(file, records.values(), array=True)
+
+    def load(self):
+        # appends logged after the restored version don't belong to it
+        if os.path.exists(note_log_path(self.path)):
+            os.remove(note_log_path(self.path))
+        self.book.load_notes(self.path)
+
+
+def keep_damaged(path: str) -> str:
+    """
+    Copies a damaged data file to BACKUP_DIRECTORY next to it, so the next save doesn't destroy what is left of it
+    :return: path of the copy
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(path)), BACKUP_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    name, extension = os.path.splitext(os.path.basename(path))
+    copy = os.path.join(directory, f"{name}.damaged-{time.strftime('%Y%m%d-%H%M%S')}{extension}")
+    shutil.copy2(path, copy)
+    return copy
+
+
+def contact_backups(address_book: AddressBook, path: str) -> ContactBackups:
+    if address_book.backups is None:
+        address_book.backups = ContactBackups(address_book, path)
+    return address_book.backups
+
+
+def note_backups(notebook: Notes, path: str) -> NoteBackups:
+    if notebook.backups is None:
+        notebook.backups = NoteBackups(notebook, path)
+    return notebook.backups
@@ -0,0 +1,109 @@
+import sys
+from collections import OrderedDict
+from itertools import count
+
+# generation numbers are unique across all address books and notebooks of the process
+_GENERATIONS = count(1)
+
+
+def next_generation() -> int:
+    """
+    :return: a new generation number, taken by AddressBook and Notes on every change
+    """
+    return next(_GENERATIONS)
+
+
+def estimate_size(obj, seen: set = None) -> int:
+    """
+    Approximate memory used by strings, numbers and tuples, lists, sets and dicts of them.
+    Objects reached more than once are counted once, other objects only by their own size
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(value, seen) for key, value in obj.items())
+    return size
+
+
+class CacheStats:
+    """
+    Hit and miss counters of a cache, shown by the 'cache-stats' command
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        self.hits += 1
+
+    def miss(self):
+        self.misses += 1
+
+    def __str__(self):
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0
+        return f"{self.name}: {self.hits} hits, {self.misses} misses ({ratio:.0%} hit rate)"
+
+
+class QueryCache:
+    """
+    LRU cache of query results limited by their approximate size in bytes.
+    Every result is stored with the generation of the data it was computed from
+    and is only returned while the data still has that generation
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+        self.stats = CacheStats("query cache")
+
+    def get(self, key: tuple, generation: int):
+        """
+        :return: cached result or None if it is missing or outdated
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != generation:
+            self.stats.miss()
+            return None
+        self.entries.move_to_end(key)
+        self.stats.hit()
+        return entry[1]
+
+    def put(self, key: tuple, generation: int, result):
+        size = estimate_size(key) + estimate_size(result)
+        if size > self.max_bytes:
+            return
+        self.remove(key)
+        self.entries[key] = (generation, result, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def remove(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def __str__(self):
+        return (f"{self.stats}, {len(self.entries)} entries, "
+                f"{self.size} of {self.max_bytes} bytes, {self.evictions} evictions")
+
+
+# shared by Record.__str__ and the rows of the notes table
+RENDER_STATS = CacheStats("render cache")
@@ -0,0 +1,145 @@
+from constants import MAX_SUGGEST_DISTANCE, MAX_SUGGESTIONS
+
+
+class TrieNode:
+    __slots__ = ("children", "names", "words")
+
+    def __init__(self):
+        self.children = {}
+        # command names reachable by a key that ends in this node
+        self.names = set()
+        # full command names and aliases ending in this node, used for completion
+        self.words = set()
+
+
+class CommandIndex:
+    """
+    Prefix trie over bare command names, their aliases and their hyphen-separated parts.
+    Lookups walk the trie once, so their cost depends on the query length, not on the number of commands.
+    """
+
+    def __init__(self):
+        self.root = TrieNode()
+        self.usages = {}
+        self.aliases = {}
+
+    @classmethod
+    def from_commands(cls, commands: dict, aliases: dict = None):
+        """
+        Builds the index from the help dictionary, whose keys start with the bare command name
+        :param commands: dict of usage strings to descriptions (see constants.COMMANDS)
+        :param aliases: dict of alias to command name
+        """
+        index = cls()
+        for usage in commands.keys():
+            index.add(usage.split()[0], usage)
+        for alias, name in (aliases or {}).items():
+            index.add_alias(alias, name)
+        return index
+
+    def add(self, name: str, usage: str = None):
+        """
+        Registers a command, e.g. 'add-contact' is reachable by 'add-contact' and by 'contact'
+        """
+        self.usages[name] = usage or name
+        self._insert(name, name).words.add(name)
+        parts = name.split("-")
+        for i in range(1, len(parts)):
+            self._insert("-".join(parts[i:]), name)
+
+    def add_alias(self, alias: str, name: str):
+        self.aliases[alias] = name
+        self._insert(alias, name).words.add(alias)
+
+    def resolve(self, command: str) -> str | None:
+        """
+        :return: command name for a known command or alias, None otherwise
+        """
+        if command in self.usages:
+            return command
+        return self.aliases.get(command)
+
+    def usage(self, name: str) -> str:
+        return self.usages.get(name, name)
+
+    def _insert(self, key: str, name: str):
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, TrieNode())
+        node.names.add(name)
+        return node
+
+    def _find_node(self, prefix: str) -> TrieNode | None:
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def complete(self, prefix: str) -> list[str]:
+        """
+        Used for tab completion
+        :return: sorted command names and aliases starting with the prefix
+        """
+        node = self._find_node(prefix)
+        if node is None:
+            return []
+        matches = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            matches.extend(current.words)
+            stack.extend(current.children.values())
+        return sorted(matches)
+
+    def suggest(self, query: str, limit: int = MAX_SUGGESTIONS) -> list[str]:
+        """
+        Ranks command names for an unknown or incomplete command.
+        Prefix matches come first, then matches within MAX_SUGGEST_DISTANCE edits
+        :return: at most `limit` command names, best match first
+        """
+        ranks = {}
+
+        def rank(name, score):
+            if name not in ranks or score < ranks[name]:
+                ranks[name] = score
+
+        node = self._find_node(query)
+        if node is not None:
+            stack = [(node, 0)]
+            while stack:
+                current, depth = stack.pop()
+                for name in current.names:
+                    # a hit on the full name beats a hit on one of its parts
+                    rank(name, (0, 0 if name.startswith(query) else 1, depth))
+                for child in current.children.values():
+                    stack.append((child, depth + 1))
+
+        first_row = list(range(len(query) + 1))
+        for char, child in self.root.children.items():
+            self._search_distance(child, char, query, first_row, rank)
+
+        ordered = sorted(ranks.items(), key=lambda item: (item[1], len(item[0]), item[0]))
+        return [name for name, _ in ordered[:limit]]
+
+    def _search_distance(self, node, char, query, previous_row, rank):
+        """
+        Levenshtein distance computed along the trie, one row per node.
+        Branches are pruned as soon as every cell of the row exceeds MAX_SUGGEST_DISTANCE
+        """
+        row = [previous_row[0] + 1]
+        for column in range(1, len(query) + 1):
+            cost = 0 if query[column - 1] == char else 1
+            row.append(min(row[column - 1] + 1,
+                           previous_row[column] + 1,
+                           previous_row[column - 1] + cost))
+
+        distance = row[-1]
+        if distance <= MAX_SUGGEST_DISTANCE:
+            for name in node.names:
+                rank(name, (1, distance, 0))
+
+        if min(row) <= MAX_SUGGEST_DISTANCE:
+            for next_char, child in node.children.items():
+                self._search_distance(child, next_char, query, row, rank)
@@ -1,3 +1,10 @@
+import re
+import tracemalloc
+from datetime import date
+from itertools import chain
+
+from colorama import Fore
+
 from address_book_classes import (
     Name,
     Phone,
@@ -27,11 +34,17 @@ from error_handlers import (
     show_email_error,
     note_error_handler,
     tag_error_handler,
+    page_error,
+    profile_error,
+    use_tenant_error,
+    sync_error,
+    export_error,
+    restore_error,
+    merge_contacts_error,
+    find_error,
 )
-from notes_classes import Notes
+from notes_classes import Notes, NOTE_BODIES
 from constants import (
-    FILE_PATH_CONTACTS,
-    FILE_PATH_NOTES,
     MAX_PERIOD,
     MIN_PERIOD,
     DEFAULT_PERIOD,
@@ -39,12 +52,35 @@ from constants import (
     MIN_NOTE_LEN,
     TABLE_NOTE_LEN,
     COMMAND_LOOKUP,
+    COMMAND_ALIASES,
     MIN_SEARCH_STR_LEN,
+    DEFAULT_PAGE_SIZE,
+    QUERY_CACHE_MAX_BYTES,
+    TOP_TAGS,
 )
-from print_util import print_warn, print_info, print_success, print_magenta
+from command_index import CommandIndex
+from caching import RENDER_STATS, QueryCache
+from instrumentation import METRICS
+from profiling import PROFILER, memory_report
+from tenants import BookManager
+from sync import sync
+from parallel_scan import SCANNER
+from spill import SpillingDict, SpillingList
+from reminders import birthday_scheduler
+from snapshots import Export
+from names import fold
+from backups import contact_backups, note_backups
+import duplicates
+import note_duplicates
+import query
+from print_util import print_warn, print_info, print_success, print_magenta, print_lines
 
 address_book = AddressBook()
 notebook = Notes()
+command_index = CommandIndex.from_commands(COMMANDS, COMMAND_ALIASES)
+query_cache = QueryCache(QUERY_CACHE_MAX_BYTES)
+# exports still running in the background
+exports: list[Export] = []
 
 
 def help():
@@ -64,13 +100,165 @@ def get_matching_commands(command):
     """
     For incomplete or wrong user input checks if it matches existing commands
     :param command: command entered by the user
-    :return: list of matching commands
+    :return: list of at most MAX_SUGGESTIONS matching commands, best match first
+    """
+    return [">>> " + command_index.usage(name) for name in command_index.suggest(command)]
+
+
+def cache_stats(address_book: AddressBook, notebook: Notes):
+    """
+    Prints hit and miss counters of the caches, and of the spill stores of the books in use
+    """
+    lines = [str(RENDER_STATS), str(query_cache), str(NOTE_BODIES.stats)]
+    for container in (address_book.data, notebook.data["notes"]):
+        if isinstance(container, (SpillingDict, SpillingList)):
+            lines.append(str(container.store))
+    print_info("\n".join(lines))
+
+
+def stats():
+    """
+    Prints latency, I/O and error counters recorded since the start
+    """
+    if METRICS.enabled:
+        print_info(METRICS.report())
+    else:
+        print_warn("Metrics are disabled, start the assistant with --metrics to record them")
+
+
+@profile_error
+def profile(args):
+    """
+    Starts profiling of the following commands, or stops it and saves pstats to a file
+    :param args: 'start' or 'stop <file>'
+    """
+    match args:
+        case ["start"]:
+            if PROFILER.active:
+                print_warn("Profiling is already running")
+            else:
+                PROFILER.start()
+                print_success("Profiling started")
+        case ["stop", path]:
+            if not PROFILER.active:
+                print_warn("Profiling is not running")
+            else:
+                print_info(PROFILER.stop(path))
+                print_success(f"Profile was saved to '{path}' file")
+        case _:
+            raise CommandError
+
+
+def mem_report(address_book: AddressBook, notebook: Notes):
+    """
+    Prints memory used by contacts, notes and indexes, and by the lines that allocated it
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        print_warn("Memory tracing started now, only later allocations will be attributed to lines. "
+                   "Start the assistant with --trace-memory to trace from the start")
+    print_info(memory_report(address_book, notebook, query_cache))
+
+
+@use_tenant_error
+def use_tenant(manager: BookManager, args):
     """
-    matching_commands = []
-    for c in COMMANDS.keys():
-        if c.find(command) >= 0:
-            matching_commands.append(">>> " + c)
-    return matching_commands
+    Switches to the address book and notes of another tenant
+    :param args: expects a tenant name
+    :return: the tenant, or None if it can't be used
+    """
+    if manager is None:
+        print_warn("Start the assistant with --data-dir to use tenants")
+        return None
+    try:
+        name, = args
+    except ValueError:
+        raise CommandError
+    tenant = manager.get(name)
+    print_success(f"Using tenant '{name}': {len(tenant.address_book)} contacts, "
+                  f"{len(tenant.notebook.data['notes'])} notes")
+    return tenant
+
+
+@sync_error
+def sync_replicas(address_book: AddressBook, notebook: Notes, args):
+    """
+    Synchronizes contacts and notes with a replica stored in another directory
+    :param args: expects a directory path
+    """
+    try:
+        directory, = args
+    except ValueError:
+        raise CommandError
+    report = sync(address_book, notebook, directory)
+    print_success(f"Synchronized with '{directory}'")
+    print_info(str(report))
+
+
+@export_error
+def export(address_book: AddressBook, notebook: Notes, args):
+    """
+    Starts writing snapshots of contacts and notes to another directory in the background,
+    the following commands can change them meanwhile
+    :param args: expects a directory path
+    """
+    try:
+        directory, = args
+    except ValueError:
+        raise CommandError
+    exports.append(Export(address_book, notebook, directory))
+    print_success(f"Export to '{directory}' started")
+
+
+def finished_exports() -> list[Export]:
+    """
+    :return: exports finished since the previous call
+    """
+    done = [export_ for export_ in exports if export_.done]
+    exports[:] = [export_ for export_ in exports if not export_.done]
+    return done
+
+
+@restore_error
+def restore(address_book: AddressBook, notebook: Notes, args):
+    """
+    Lists the versions of contacts or notes kept by backups, or restores one of them
+    :param args: expects 'contacts' or 'notes' and an optional version
+    """
+    if not 0 < len(args) <= 2 or args[0] not in ("contacts", "notes"):
+        raise CommandError
+    backups = contact_backups(address_book, address_book.path) if args[0] == "contacts" \
+        else note_backups(notebook, notebook.path)
+    if len(args) == 1:
+        print_info(str(backups))
+        return
+    try:
+        version = int(args[1])
+    except ValueError:
+        raise CommandError
+    restored = backups.restore(version)
+    print_success(f"Version {version} of {args[0]} was restored, {restored} records")
+
+
+def parse_page_args(args) -> tuple[int, int | None]:
+    """
+    Parses optional paging arguments '--page N --size K', N and K > 0
+    :return: start and stop positions, stop is None when no page is requested
+    """
+    options = {}
+    try:
+        for option, value in zip(args[::2], args[1::2], strict=True):
+            if option not in ("--page", "--size") or int(value) < 1:
+                raise ValueError
+            options[option] = int(value)
+    except ValueError:
+        raise CommandError
+
+    if not options:
+        return 0, None
+    page = options.get("--page", 1)
+    size = options.get("--size", DEFAULT_PAGE_SIZE)
+    return (page - 1) * size, page * size
 
 
 def parse_input(user_input: str):
@@ -89,7 +277,7 @@ def parse_input(user_input: str):
 
 
 @add_contact_error
-def add_contact(args: list[str, str]):
+def add_contact(address_book: AddressBook, args: list[str, str]):
     """
     Adds a new contact with phone number or adds a new phone number to existing contact
     prints command result
@@ -116,13 +304,13 @@ def add_contact(args: list[str, str]):
         record: Record = Record(name, phone)
         address_book.add_record(record)
 
-    address_book.save_contacts(FILE_PATH_CONTACTS)
+    address_book.save_contacts(address_book.path)
     print_success(f"Contact added successfully: {name} {phone}")
 
 
 @contact_not_found_error
 @delete_contact_error
-def delete_contact(args):
+def delete_contact(address_book: AddressBook, args):
     """
     Deletes existing contact
     prints command result
@@ -137,13 +325,13 @@ def delete_contact(args):
     else:
         raise ContactNotFoundError
 
-    address_book.save_contacts(FILE_PATH_CONTACTS)
+    address_book.save_contacts(address_book.path)
     print_success(f"Contact '{name}' deleted successfully")
 
 
 @contact_not_found_error
 @add_email_error
-def add_email(args):
+def add_email(address_book: AddressBook, args):
     """
     Adds email to existing contact
     prints command result
@@ -163,13 +351,13 @@ def add_email(args):
     else:
         raise ContactNotFoundError
 
-    address_book.save_contacts(FILE_PATH_CONTACTS)
+    address_book.save_contacts(address_book.path)
     print_success("Email added successfully")
 
 
 @show_email_error
 @contact_not_found_error
-def show_email(args):
+def show_email(address_book: AddressBook, args):
     """
     Shows email of existing contact
     prints command result
@@ -195,7 +383,7 @@ def show_email(args):
 
 @contact_not_found_error
 @change_contact_error
-def change_phone(args: list[str, str, str]):
+def change_phone(address_book: AddressBook, args: list[str, str, str]):
     """
     Changes existing contact's phone number for a new one provided that new number is valid
     prints command result
@@ -219,37 +407,146 @@ def change_phone(args: list[str, str, str]):
         else:
             raise KeyError
 
-        address_book.save_contacts(FILE_PATH_CONTACTS)
+        address_book.save_contacts(address_book.path)
         print_success(f"Contact '{name}' updated successfully")
     else:
         raise ContactNotFoundError
 
 
 @search_error
-def search_contacts(args):
+def search_contacts(address_book: AddressBook, args):
     """
     Finds all records stored in the address book if any attribute of the record match the search string
     prints the search result
     """
     try:
         search_str = args[0]
-        search_result = []
         if search_str.isspace() or len(search_str) < MIN_SEARCH_STR_LEN:
             raise CommandError
-        for r in address_book.get_records():
-            if str(r).casefold().find(search_str) > 0:
-                search_result.append(r)
-        if len(search_result) > 0:
-            print_success("\n".join([str(r) for r in search_result]))
+        key = ("search-contacts", search_str)
+        output = query_cache.get(key, address_book.generation)
+        if output is None:
+            # only the keys are listed, so records spilled to disk in bounded memory mode are not all held at once
+            keys = list(address_book.data)
+            # records and the search string are folded the same way, see names.fold
+            rows = SCANNER.scan("contact-search", address_book.generation,
+                                address_book.search_texts, len(keys), fold(search_str))
+            output = "\n".join([str(address_book.data[keys[row]]) for row in rows])
+            query_cache.put(key, address_book.generation, output)
+        if len(output) > 0:
+            print_success(output)
         else:
             print_warn("No results found!")
     except (ValueError, IndexError) as e:
         raise CommandError
 
 
+@find_error
+def find_contacts(address_book: AddressBook, args):
+    """
+    Finds contacts matching all conditions, answered by the secondary indexes where possible
+    :param args: conditions like city~Kyiv, email@gmail.com, birthday<30d, phones>1
+    prints the search result
+    """
+    if not args:
+        raise CommandError
+    records = query.find(address_book, query.parse_query(args))
+    if print_lines((str(record) for record in records), Fore.BLUE) == 0:
+        print_warn("No results found!")
+
+
+def find_duplicates(address_book: AddressBook):
+    """
+    Lists groups of contacts that are probably the same person
+    prints command result
+    """
+    groups, not_compared = duplicates.find_duplicates(address_book)
+    if not_compared:
+        print_info(f"Names of {not_compared} contacts were not compared, they are too common")
+    if not groups:
+        print_info("No duplicate contacts found")
+        return
+    print_lines((f"{i}. {', '.join(group)}" for i, group in enumerate(groups, 1)), Fore.BLUE)
+    print_info(f"Use '{COMMAND_LOOKUP.get('merge-contacts')}' to merge a group")
+
+
+@merge_contacts_error
+def merge_contacts(address_book: AddressBook, args):
+    """
+    Merges phones, email, address and birthday of other contacts into the first one and deletes the others
+    prints command result
+    """
+    if len(args) < 2:
+        raise CommandError
+    try:
+        target, *others = [Name(name) for name in args]
+    except:
+        raise CommandError
+    record = duplicates.merge_contacts(address_book, target, others)
+    address_book.save_contacts(address_book.path)
+    print_success(f"Contacts merged: {record}")
+
+
+@note_error_handler
+def similar_notes(notebook: Notes, args):
+    """
+    Lists notes with nearly the same text as the note with a given id
+    :param args: note_id > 0
+    """
+    try:
+        index = int(args[0])
+    except (ValueError, IndexError):
+        raise CommandError("Expecting command in form " + COMMAND_LOOKUP.get("similar-notes"))
+    if index < 1:
+        raise IndexError
+    notes = notebook.data["notes"]
+    data = notes[index - 1]
+    similar = note_duplicates.note_similarity(notebook).similar(data["uid"])
+    if not similar:
+        print_info(f"No notes similar to note {index} found")
+        return
+    note_ids = notebook.note_ids()
+    print_lines((f"{note_ids[uid]}. {score:.0%} {notebook.uids[uid]['note'].head(TABLE_NOTE_LEN)}"
+                 for score, uid in similar), Fore.BLUE)
+
+
+def dedupe_notes(notebook: Notes):
+    """
+    Lists groups of notes with nearly the same text
+    prints command result
+    """
+    note_ids = notebook.note_ids()
+    groups = [sorted(note_ids[uid] for uid in group)
+              for group in note_duplicates.note_similarity(notebook).clusters()]
+    if not groups:
+        print_info("No duplicate notes found")
+        return
+    groups.sort(key=lambda group: (-len(group), group))
+    print_lines((f"{i}. {', '.join(map(str, group))}" for i, group in enumerate(groups, 1)), Fore.BLUE)
+    print_info(f"Use '{COMMAND_LOOKUP.get('merge-notes')}' to merge a group")
+
+
+@note_error_handler
+def merge_notes(notebook: Notes, args):
+    """
+    Adds tags of the other notes to the first one and deletes the other notes
+    :param args: note ids > 0, the first one is kept
+    """
+    try:
+        target, *others = [int(arg) for arg in args]
+    except ValueError:
+        raise CommandError("Expecting command in form " + COMMAND_LOOKUP.get("merge-notes"))
+    if not others:
+        raise CommandError("Expecting command in form " + COMMAND_LOOKUP.get("merge-notes"))
+    note_duplicates.merge_notes(notebook, target, others)
+    notebook.save_notes(notebook.path)
+    # the target moves up by the number of merged notes before it
+    print_success(f"Notes merged into note {target - len({index for index in others if index < target})}")
+
+
 @contact_not_found_error
 @show_phones_error
-def show_phones(args):
+def show_phones(address_book: AddressBook, args):
     """
     Show existing contact's phone number(s)
     prints command result
@@ -269,7 +566,7 @@ def show_phones(args):
 
 @contact_not_found_error
 @add_birthday_error
-def add_birthday(args):
+def add_birthday(address_book: AddressBook, args):
     """
     Adds birthday to existing contact
     replaces birthday if it already exists for this contact
@@ -292,13 +589,13 @@ def add_birthday(args):
     else:
         raise ContactNotFoundError
 
-    address_book.save_contacts(FILE_PATH_CONTACTS)
+    address_book.save_contacts(address_book.path)
     print_success("Birthday added successfully")
 
 
 @contact_not_found_error
 @show_birthday_error
-def show_birthday(args):
+def show_birthday(address_book: AddressBook, args):
     """
     Shows birthday of existing user
     prints command result
@@ -322,22 +619,28 @@ def show_birthday(args):
     print_success(f"{name} birthday: {birthday}")
 
 
-def show_all_contacts():
+@page_error("all-contacts")
+def show_all_contacts(address_book: AddressBook, args=()):
     """
-    Shows all existing contacts
+    Shows all existing contacts sorted by name, or one page of them
+    :param args: optional --page N and --size K
     prints command result
     """
-    if address_book.data:
-        result = list()
-        for record in address_book.data.values():
-            result.append(str(record))
-        print_info("\n".join(result))
-    else:
+    if not address_book.data:
         print_info("No contacts have been added yet")
+        return
+
+    start, stop = parse_page_args(args)
+    if stop is None:
+        names = iter(address_book.name_index)
+    else:
+        names = address_book.name_index.slice(start, stop)
+    if print_lines((str(address_book.data[name]) for name in names), Fore.BLUE) == 0:
+        print_warn("There are no contacts on this page")
 
 
 @max_period_error
-def birthdays(args):
+def birthdays(address_book: AddressBook, args):
     """
     Presents upcoming birthdays of the users in the address book for a given period
     default period is 7 days
@@ -352,27 +655,64 @@ def birthdays(args):
     else:
         period = DEFAULT_PERIOD
 
-    get_birthdays_per_period = address_book.get_birthdays_per_period(period)
-
-    if get_birthdays_per_period:
-        formatted_data = []
+    key = ("birthdays", period, date.today())
+    result = query_cache.get(key, address_book.generation)
+    if result is None:
+        result = format_birthdays(address_book.get_birthdays_per_period(period), period)
+        query_cache.put(key, address_book.generation, result)
 
-        for date, users in get_birthdays_per_period.items():
-            formatted_key = f'{date}: {", ".join(users)}'
-            formatted_data.append(formatted_key)
-
-        formatted_output = ",\n".join(formatted_data)
-        result = f"Birthdays for next {period} day(s):\n" + "-" * 10 + "\n"
-        result += formatted_output
-        result += "\n" + "-" * 10
+    if result:
         print_success(result)
     else:
         print_warn(f"There is no one to celebrate birthday for next {period} day(s)")
 
 
+@max_period_error
+def show_reminders(address_book: AddressBook, args):
+    """
+    Presents birthday reminders of the coming days, by default of the days reminders are shown in advance
+    """
+    scheduler = birthday_scheduler(address_book)
+    if args:
+        try:
+            days = int(args[0])
+            if (days < MIN_PERIOD) or (days > MAX_PERIOD):
+                raise ValueError
+        except:
+            raise ValueError
+    else:
+        days = scheduler.lead.days
+
+    upcoming = scheduler.upcoming(days)
+    if not upcoming:
+        print_warn(f"There are no birthday reminders for next {days} day(s)")
+        return
+    print_lines((f"{birthday.strftime('%A, %d %B')}: {name} (reminder on {remind_on.strftime('%d %B')})"
+                 for remind_on, birthday, name in upcoming), Fore.GREEN)
+
+
+def format_birthdays(get_birthdays_per_period: dict, period: int) -> str:
+    """
+    :return: printable list of upcoming birthdays or an empty string if there are none
+    """
+    if not get_birthdays_per_period:
+        return ""
+    formatted_data = []
+
+    for day, users in get_birthdays_per_period.items():
+        formatted_key = f'{day}: {", ".join(users)}'
+        formatted_data.append(formatted_key)
+
+    formatted_output = ",\n".join(formatted_data)
+    result = f"Birthdays for next {period} day(s):\n" + "-" * 10 + "\n"
+    result += formatted_output
+    result += "\n" + "-" * 10
+    return result
+
+
 @contact_not_found_error
 @add_address_error
-def add_address(args):
+def add_address(address_book: AddressBook, args):
     """
     Adds an address to existing contact
     Replaces the address if it already exists
@@ -389,13 +729,13 @@ def add_address(args):
         raise ContactNotFoundError
     record.add_address(Address(address))
 
-    address_book.save_contacts(FILE_PATH_CONTACTS)
+    address_book.save_contacts(address_book.path)
     print_success("Address added successfully")
 
 
 @contact_not_found_error
 @show_address_error
-def show_address(args):
+def show_address(address_book: AddressBook, args):
     """
     Shows address of existing user
     :param args: expects a name
@@ -428,7 +768,7 @@ def add_note(notebook: Notes, args):
             f"Note cannot be empty and must be more than {MIN_NOTE_LEN} characters long"
         )
     note_id, _ = notebook.add_note(text)
-    notebook.save_notes(FILE_PATH_NOTES)
+    notebook.save_notes(notebook.path)
     print_success(f"Note with id {note_id} created successfully")
 
 
@@ -455,27 +795,46 @@ def show_note(notebook: Notes, args):
         raise ValueError(f"We don't have a note with id {note_id}")
 
 
-@note_error_handler
-def show_all_notes(notebook: Notes):
-    """
-    Presents all notes stored in the notebook inside a table
-    """
-    all_notes = notebook.show_notes()
-    if len(all_notes) > 0:
-        ellipsis = "..."
-        index_width = 4
-        print(
-            f'{"id".upper():<{index_width}} | {"note".upper():^{TABLE_NOTE_LEN}} | {"tags".upper():^{TABLE_NOTE_LEN / 2}}')
-        print('-' * (round(TABLE_NOTE_LEN * 1.5) + index_width + len(ellipsis)))
-        for data in all_notes:
-            index = list(data.keys())[0]
-            note_text = list(data.values())[0].get('Note')
-            tags_text = ", ".join(list(data.values())[0].get('Tags'))
-            note_str = note_text[:TABLE_NOTE_LEN - 3] + '...' if len(note_text) > TABLE_NOTE_LEN else note_text
-            print(
-                f"{index:<5}| {note_str:<{TABLE_NOTE_LEN}} | {tags_text:<}")
+def format_note_row(index: int, data: dict) -> str:
+    """
+    Formats one row of the notes table
+    the row text after the id is cached in the note data until Notes changes the note
+    """
+    row = data.get("row")
+    if row is None:
+        RENDER_STATS.miss()
+        # only the beginning of the note is shown, so a note with appended pieces isn't joined here
+        note_text = data["note"].head(TABLE_NOTE_LEN + 1).capitalize()
+        tags_text = ", ".join(str(tag) for tag in data["tags"])
+        note_str = note_text[:TABLE_NOTE_LEN - 3] + '...' if len(note_text) > TABLE_NOTE_LEN else note_text
+        row = f"{note_str:<{TABLE_NOTE_LEN}} | {tags_text:<}"
+        data["row"] = row
     else:
+        RENDER_STATS.hit()
+    return f"{index:<5}| {row}"
+
+
+@page_error("all-notes")
+@note_error_handler
+def show_all_notes(notebook: Notes, args=()):
+    """
+    Presents all notes stored in the notebook inside a table, or one page of them
+    :param args: optional --page N and --size K
+    """
+    if len(notebook.data["notes"]) == 0:
         print_warn("We haven't stored any notes yet.")
+        return
+
+    start, stop = parse_page_args(args)
+    ellipsis = "..."
+    index_width = 4
+    header = [
+        f'{"id".upper():<{index_width}} | {"note".upper():^{TABLE_NOTE_LEN}} | {"tags".upper():^{TABLE_NOTE_LEN / 2}}',
+        '-' * (round(TABLE_NOTE_LEN * 1.5) + index_width + len(ellipsis)),
+    ]
+    rows = (format_note_row(index, data) for index, data in notebook.iter_notes(start, stop))
+    if print_lines(chain(header, rows)) == len(header):
+        print_warn("There are no notes on this page")
 
 
 @note_error_handler
@@ -486,10 +845,26 @@ def change_note(notebook: Notes, args):
     """
     index, text = args[0], " ".join(args[1:])
     notebook.change_note(int(index), text)
-    notebook.save_notes(FILE_PATH_NOTES)
+    notebook.save_notes(notebook.path)
     print_success("Note successfully replaced")
 
 
+@note_error_handler
+def append_note(notebook: Notes, args):
+    """
+    Appends text to the end of existing note, only the appended text is written to disk
+    :param args: note_id > 0 and non-empty text
+    """
+    if len(args) < 2:
+        raise CommandError("Expecting command in form " + COMMAND_LOOKUP.get("append-note"))
+    index, text = int(args[0]), " ".join(args[1:])
+    if index < 1:
+        raise IndexError
+    notebook.update_note(index, text)
+    notebook.save_appends(notebook.path)
+    print_success("Text successfully appended to the note")
+
+
 @note_error_handler
 def remove_note(notebook: Notes, args):
     """
@@ -498,7 +873,7 @@ def remove_note(notebook: Notes, args):
     """
     index = args[0]
     notebook.remove_note(int(index))
-    notebook.save_notes(FILE_PATH_NOTES)
+    notebook.save_notes(notebook.path)
     print_success("Note successfully removed")
 
 
@@ -507,24 +882,37 @@ def remove_note(notebook: Notes, args):
 def search_note(notebook: Notes, args):
     """
     Finds notes matching search string in the notebook and prints them
-    :param args: a valid search string
+    :param args: a valid search string, or --regex and a regular expression
     """
+    regex = bool(args) and args[0] == "--regex"
+    if regex:
+        args = args[1:]
     text = " ".join(args)
-    notes = notebook.find_note_by_subtext(text)
     if text.isspace() or len(text) < MIN_SEARCH_STR_LEN:
         raise CommandError
-    if not notes:
+    if regex:
+        try:
+            re.compile(text)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}")
+    key = ("search-note", regex, text)
+    output_string = query_cache.get(key, notebook.generation)
+    if output_string is None:
+        notes = notebook.find_note_by_subtext(text, regex)
+        output = []
+        for note in notes:
+            if note["Tags"]:
+                str_tags = " ".join(note["Tags"])
+                note_string = f"Note: {note['Note']}\n Tags:{str_tags}"
+            else:
+                note_string = f"Note: {note['Note']}"
+            output.append(note_string)
+        output_string = "\n".join(output)
+        query_cache.put(key, notebook.generation, output_string)
+    if not output_string:
         print_warn(f"No matches found for: '{text}'")
-    output = []
-    for note in notes:
-        if note["Tags"]:
-            str_tags = " ".join(note["Tags"])
-            note_string = f"Note: {note['Note']}\n Tags:{str_tags}"
-        else:
-            note_string = f"Note: {note['Note']}"
-        output.append(note_string)
-    output_string = "\n".join(output)
-    print_success(output_string)
+    else:
+        print_success(output_string)
 
 
 @tag_error_handler
@@ -541,7 +929,7 @@ def add_tag(notebook: Notes, args):
             f"Note cannot be empty and must be more than {MIN_NOTE_LEN} characters long"
         )
     notebook.add_tag(int(index), tag.casefold())
-    notebook.save_notes(FILE_PATH_NOTES)
+    notebook.save_notes(notebook.path)
     print_success(f"Note with id {index} successfully update tags")
 
 
@@ -558,5 +946,45 @@ def delete_tag(notebook: Notes, args):
     if result == "-1":
         print_warn("Tag not found.")
     else:
-        notebook.save_notes(FILE_PATH_NOTES)
+        notebook.save_notes(notebook.path)
         print_success("Tag successfully deleted")
+
+
+@tag_error_handler
+def show_tags(notebook: Notes, args):
+    """
+    Shows the most used tags with the number of notes using them
+    :param args: optional number of tags to show
+    """
+    try:
+        limit = int(args[0]) if args else TOP_TAGS
+    except ValueError:
+        raise CommandError("Expecting command in form " + COMMAND_LOOKUP.get("tags"))
+    if limit < 1:
+        raise CommandError("Expecting command in form " + COMMAND_LOOKUP.get("tags"))
+    stats = notebook.tag_stats(limit)
+    if not stats:
+        print_warn("We haven't stored any tags yet.")
+        return
+    print_lines((f"{tag}: {count} {'note' if count == 1 else 'notes'}" for tag, count in stats), Fore.BLUE)
+    if len(notebook.tag_notes) > limit:
+        print_info(f"{len(notebook.tag_notes) - limit} more tags")
+
+
+@tag_error_handler
+def rename_tag(notebook: Notes, args):
+    """
+    Renames the tag in all notes using it
+    :param args: tag and new tag
+    """
+    if len(args) != 2:
+        raise CommandError("Expecting command in form " + COMMAND_LOOKUP.get("rename-tag"))
+    tag, new_tag = args[0].casefold(), args[1].casefold()
+    if len(new_tag) < MIN_NOTE_LEN:
+        raise ValueError(f"must be more than {MIN_NOTE_LEN} characters long")
+    changed = notebook.change_tag(tag, new_tag)
+    if not changed:
+        print_warn("Tag not found.")
+        return
+    notebook.save_notes(notebook.path)
+    print_success(f"Tag renamed in {changed} {'note' if changed == 1 else 'notes'}")
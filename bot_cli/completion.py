@@ -0,0 +1,125 @@
+try:
+    import readline
+except ImportError:  # readline is not shipped with Python on Windows
+    readline = None
+
+from constants import COMPLETION_LIMIT
+from names import name_key
+
+# what kind of value every positional argument of a command expects
+ARGUMENT_KINDS: dict = {
+    "add-contact": ["name"],
+    "add-birthday": ["name"],
+    "add-email": ["name"],
+    "add-address": ["name"],
+    "delete-contact": ["name"],
+    "change-phone": ["name"],
+    "show-address": ["name"],
+    "show-birthday": ["name"],
+    "show-email": ["name"],
+    "show-phone": ["name"],
+    "show-note": ["note"],
+    "delete-note": ["note"],
+    "change-note": ["note"],
+    "append-note": ["note"],
+    "similar-notes": ["note"],
+    "merge-notes": ["note", "note"],
+    "add-tag": ["note", "tag"],
+    "delete-tag": ["note", "note-tag"],
+    "rename-tag": ["tag"],
+    "restore": ["book"],
+}
+
+
+def note_ids(prefix: str, count: int, limit: int = COMPLETION_LIMIT) -> list[str]:
+    """
+    Note ids are positions 1..count, so ids starting with the prefix are generated instead of searched
+    """
+    if prefix and (not prefix.isdigit() or prefix.startswith("0")):
+        return []
+    result = []
+    if not prefix:
+        return [str(i) for i in range(1, min(count, limit) + 1)]
+    start = int(prefix)
+    width = 1
+    while start <= count and len(result) < limit:
+        for note_id in range(start, min(start + width, count + 1)):
+            result.append(str(note_id))
+            if len(result) >= limit:
+                break
+        start *= 10
+        width *= 10
+    return result
+
+
+class Completer:
+    """
+    Completes commands, contact names, tags and note ids using the indexes kept by
+    CommandIndex, AddressBook and Notes, never by scanning the stored records
+    """
+
+    def __init__(self, command_index, address_book, notebook):
+        self.command_index = command_index
+        self.address_book = address_book
+        self.notebook = notebook
+        self.matches = []
+
+    def candidates(self, line: str, text: str) -> list[str]:
+        """
+        :param line: part of the input line before the word being completed
+        :param text: the word being completed
+        """
+        tokens = line.split()
+        if not tokens:
+            return self.command_index.complete(text.lower())
+
+        command = self.command_index.resolve(tokens[0].lower())
+        kinds = ARGUMENT_KINDS.get(command, [])
+        position = len(tokens) - 1
+        if position >= len(kinds):
+            return []
+
+        match kinds[position]:
+            case "name":
+                canonical_keys = self.address_book.key_index.prefix(name_key(text), COMPLETION_LIMIT)
+                return [key for canonical in canonical_keys for key in self.address_book.name_keys(canonical)]
+            case "note":
+                return note_ids(text, len(self.notebook.data["notes"]))
+            case "tag":
+                return self.notebook.tag_index.prefix(text.casefold(), COMPLETION_LIMIT)
+            case "book":
+                return [book for book in ("contacts", "notes") if book.startswith(text)]
+            case "note-tag":
+                try:
+                    tags = self.notebook.data["notes"][int(tokens[1]) - 1]["tags"]
+                except (ValueError, IndexError):
+                    return []
+                return sorted(str(tag) for tag in tags if str(tag).startswith(text.casefold()))
+        return []
+
+    def complete(self, text: str, state: int):
+        """
+        readline completer protocol: called with state 0, 1, 2... until it returns None
+        """
+        if state == 0:
+            line = readline.get_line_buffer()[:readline.get_begidx()]
+            self.matches = self.candidates(line, text)
+        if state < len(self.matches):
+            return self.matches[state] + " "
+        return None
+
+
+def setup_completion(completer: Completer) -> bool:
+    """
+    Binds the completer to the tab key
+    :return: False if readline isn't available on this platform
+    """
+    if readline is None:
+        return False
+    readline.set_completer(completer.complete)
+    readline.set_completer_delims(" \t\n")
+    if readline.__doc__ and "libedit" in readline.__doc__:
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+    return True
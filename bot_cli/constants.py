@@ -12,14 +12,38 @@ COMMAND_LOOKUP: dict = {
     "delete-contact": "delete-contact <name>",
     "delete-note": "delete-note <note_id>",
     "delete-tag": "delete-tag <note_id> <tag>",
+    "tags": "tags <count?>",
+    "rename-tag": "rename-tag <tag> <new_tag>",
     "birthdays": "birthdays <period?>",
     "change-phone": "change-phone <name> <old_phone> <new_phone>",
     "change-note": "change-note <note_id> <new_note_text>",
+    "append-note": "append-note <note_id> <text>",
     "show-address": "show-address <name>",
     "show-birthday": "show-birthday <name>",
     "show-email": "show-email <name>",
     "show-phone": "show-phone <name>",
     "show-note": "show-note <note_id>",
+    "search-note": "search-note [--regex] <search_string>",
+    "all-contacts": "all-contacts [--page N] [--size K]",
+    "all-notes": "all-notes [--page N] [--size K]",
+    "profile": "profile start|stop <file>",
+    "use": "use <tenant>",
+    "sync": "sync <other-path>",
+    "export": "export <directory>",
+    "restore": "restore contacts|notes <version?>",
+    "merge-contacts": "merge-contacts <name> <other_name> ...",
+    "similar-notes": "similar-notes <note_id>",
+    "merge-notes": "merge-notes <note_id> <other_note_id> ...",
+    "find": "find <condition> ...",
+    "reminders": "reminders <days?>",
+}
+
+COMMAND_ALIASES: dict = {
+    "all-note": "all-notes",
+    "all-contact": "all-contacts",
+    "phone": "show-phone",
+    "search-contact": "search-contacts",
+    "close": "exit",
 }
 
 
@@ -32,26 +56,120 @@ COMMANDS: dict = {
     COMMAND_LOOKUP["add-address"]: "adds address to a contact",
     COMMAND_LOOKUP["add-note"]: "adds a new note",
     COMMAND_LOOKUP["add-tag"]: "adds a tag to note",
-    "all-contacts": "shows all existing contacts",
-    "all-notes": "shows all saved notes",
+    COMMAND_LOOKUP["all-contacts"]: "shows all existing contacts sorted by name, or one page of them",
+    COMMAND_LOOKUP["all-notes"]: "shows all saved notes, or one page of them",
     COMMAND_LOOKUP["birthdays"]: "shows birthdays in coming days, or for next week by default",
+    COMMAND_LOOKUP["reminders"]: "shows birthday reminders for coming days, or for the reminder lead time by default",
+    COMMAND_LOOKUP["find"]: "shows contacts matching all conditions, e.g. city~Kyiv email@gmail.com birthday<30d phones>1",
+    "find-duplicates": "lists groups of contacts sharing a phone or an email, or having similar names",
+    COMMAND_LOOKUP["merge-contacts"]: "merges the other contacts into the first one and deletes them",
     COMMAND_LOOKUP["delete-contact"]: "deletes contact with the username",
     COMMAND_LOOKUP["delete-note"]: "deletes the note with id",
     COMMAND_LOOKUP["delete-tag"]: "Deletes the tag for note",
+    COMMAND_LOOKUP["tags"]: "shows the most used tags and how many notes use them, 10 by default",
+    COMMAND_LOOKUP["rename-tag"]: "renames the tag in all notes",
     COMMAND_LOOKUP["change-phone"]: "changes existing contact's phone number",
     COMMAND_LOOKUP["change-note"]: "replaces the text of the note with id with the new text",
+    COMMAND_LOOKUP["append-note"]: "adds the text to the end of the note with id, separated by '; '",
     COMMAND_LOOKUP["show-address"]: "shows contact's address",
     COMMAND_LOOKUP["show-birthday"]: "shows contact's birthday date",
     COMMAND_LOOKUP["show-email"]: "shows contact's email",
     COMMAND_LOOKUP["show-phone"]: "shows contact's phone(s)",
     COMMAND_LOOKUP["show-note"]: "shows note with id",
+    COMMAND_LOOKUP["similar-notes"]: "lists notes with nearly the same text as the note with id",
+    "dedupe-notes": "lists groups of notes with nearly the same text",
+    COMMAND_LOOKUP["merge-notes"]: "adds tags of the other notes to the first one and deletes them",
+    "cache-stats": "shows hit and miss counts and memory use of the caches",
+    "stats": "shows latency, I/O and error counters (start the assistant with --metrics)",
+    COMMAND_LOOKUP["profile"]: "profiles the following commands until stopped, then saves pstats to the file",
+    COMMAND_LOOKUP["use"]: "switches to the address book and notes of the tenant (needs --data-dir)",
+    COMMAND_LOOKUP["sync"]: "exchanges changed contacts and notes with the copy in another directory",
+    COMMAND_LOOKUP["export"]: "writes contacts and notes as they are now to the directory in the background",
+    COMMAND_LOOKUP["restore"]: "lists the backed up versions of contacts or notes, or restores the version",
+    "mem-report": "shows memory used by contacts, notes and indexes",
     "exit": "enter 'close' or 'exit' to close the assistant",
     "search-contacts <search_string>": "searches contact's names and phones, outputs contacts matching "
                                        "the search string (not empty, more than 2 letters)",
+    COMMAND_LOOKUP["search-note"]: "searches notes containing the search string, or matching the regular expression",
 }
 FILE_PATH_CONTACTS = "contacts.json"
 FILE_PATH_NOTES = "notes.json"
 
 MIN_NOTE_LEN = 2
+# tags shown by the tags command by default
+TOP_TAGS = 10
 TABLE_NOTE_LEN = 75
 MIN_SEARCH_STR_LEN = 2
+
+MAX_SUGGESTIONS = 3
+MAX_SUGGEST_DISTANCE = 2
+COMPLETION_LIMIT = 100
+
+DEFAULT_PAGE_SIZE = 20
+PRINT_BATCH_SIZE = 500
+
+QUERY_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# find intersects the key set of another indexed condition while it is at most this many times larger
+# than the candidates, since adding a key to a set is much cheaper than reading and checking a record
+QUERY_INTERSECT_FACTOR = 8
+
+TENANT_MEMORY_BUDGET = 256 * 1024 * 1024
+# rough memory use of one loaded contact and one note, used to fit tenants into the budget
+RECORD_MEMORY_ESTIMATE = 2048
+NOTE_MEMORY_ESTIMATE = 1024
+
+SYNC_BUCKETS = 256
+SYNC_STATE_FILE = ".sync-state.json"
+
+# names are compared only within phonetic blocks up to this size,
+# larger blocks are split by the first two letters and the length of the names in steps of NAME_LENGTH_STEP
+MAX_NAME_BLOCK = 50
+NAME_LENGTH_STEP = 4
+NAME_SIMILARITY = 0.85
+
+# unindexed searches over fewer rows run in the bot process, larger ones are split between worker processes
+PARALLEL_SCAN_MIN_ROWS = 50000
+PARALLEL_SCAN_CHUNKS_PER_WORKER = 4
+# shared memory columns a worker process keeps attached
+PARALLEL_SCAN_ATTACHED = 4
+
+# text read at once when loading contacts and notes item by item
+JSON_CHUNK_SIZE = 1024 * 1024
+
+# contacts validated at once while loading, and the smallest batch split between worker processes
+VALIDATION_BATCH_ROWS = 20000
+VALIDATION_PARALLEL_MIN_ROWS = 20000
+VALIDATION_CHUNKS_PER_WORKER = 2
+MAX_REPORTED_ERRORS = 5
+NOTES_BATCH_ROWS = 10000
+
+# days before a birthday its reminder is shown
+REMINDER_LEAD_DAYS = 3
+REMINDERS_STATE_FILE = ".reminders.json"
+
+# texts appended to notes are logged to the notes file path with this suffix until the log exceeds the size
+NOTES_LOG_SUFFIX = ".log"
+NOTES_LOG_MAX_BYTES = 1024 * 1024
+# smallest step between change times of a note, in seconds
+CHANGE_TIME_STEP = 1e-6
+
+# notes of at least this many characters are kept zlib-compressed in memory and in notes.json
+NOTE_COMPRESS_MIN_SIZE = 4096
+NOTE_COMPRESS_LEVEL = 6
+# decompressed texts of the recently read compressed notes
+NOTE_BODY_CACHE_SIZE = 32
+
+# notes are compared by MinHash signatures of their runs of NOTE_SHINGLE_WORDS words,
+# split into NOTE_LSH_BANDS bands; notes sharing a band are compared, NOTE_SIMILARITY of the signature must match
+NOTE_SHINGLE_WORDS = 3
+NOTE_SIGNATURE_SIZE = 64
+NOTE_LSH_BANDS = 16
+NOTE_SIMILARITY = 0.7
+
+# every save of contacts and notes is kept as a version in this directory next to the file,
+# the last BACKUP_VERSIONS ones can be restored; every BACKUP_FULL_EVERY-th version is stored whole, the rest as diffs
+BACKUP_DIRECTORY = ".backups"
+BACKUP_VERSIONS = 20
+BACKUP_FULL_EVERY = 10
+# data files are read in chunks of this size to check their CRC-32 on load
+BACKUP_CRC_CHUNK_SIZE = 1024 * 1024
@@ -0,0 +1,167 @@
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from address_book_classes import AddressBook, Record, Name
+from constants import MAX_NAME_BLOCK, NAME_LENGTH_STEP, NAME_SIMILARITY
+
+CYRILLIC_TO_LATIN = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "ie", "ж": "zh", "з": "z",
+    "и": "y", "і": "i", "ї": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+    "ь": "", "ю": "iu", "я": "ia", "ы": "y", "э": "e", "ё": "io", "ъ": "",
+})
+SOUNDEX_CODES = {**dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+                 "l": "4", **dict.fromkeys("mn", "5"), "r": "6"}
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        self.size.setdefault(item, 1)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+        if self.size[first] < self.size[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.size[first] += self.size[second]
+
+    def groups(self) -> list[list]:
+        groups = defaultdict(list)
+        for item in self.parent:
+            groups[self.find(item)].append(item)
+        return [group for group in groups.values() if len(group) > 1]
+
+
+def latin_name(name: str) -> str:
+    """
+    Lowercase latin letters and digits of a name: Cyrillic is transliterated, diacritics and other symbols are dropped
+    """
+    name = unicodedata.normalize("NFKD", name.casefold().translate(CYRILLIC_TO_LATIN))
+    return re.sub(r"[^a-z0-9]", "", name)
+
+
+def soundex(letters: str) -> str:
+    if not letters:
+        return ""
+    code = letters[0]
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char, "")
+        if digit and digit != previous:
+            code += digit
+        if char not in "hw":
+            previous = digit
+    return (code + "000")[:4]
+
+
+def normalize_email(email: str) -> str:
+    local, _, domain = email.casefold().partition("@")
+    return local.split("+")[0] + "@" + domain
+
+
+def union_similar_names(union_find: UnionFind, block: list, other: list):
+    """
+    Unites the contacts of two blocks of (letters, key) pairs, or of one block if they are the same, with similar names.
+    Names with different numbers, e.g. 'Office 1' and 'Office 2', are different contacts however similar they are
+    """
+    for i, (letters, key) in enumerate(block):
+        for other_letters, other_key in other[i + 1:] if other is block else other:
+            if (SequenceMatcher(None, letters, other_letters).ratio() >= NAME_SIMILARITY
+                    and re.findall(r"\d+", letters) == re.findall(r"\d+", other_letters)):
+                union_find.union(key, other_key)
+
+
+def find_duplicates(address_book: AddressBook) -> tuple[list[list[str]], int]:
+    """
+    Groups contacts that share a phone or an email or have very similar names.
+    Phones and emails are hash-joined, names are only compared inside small blocks of the same phonetic key,
+    so the work stays close to linear in the number of contacts. Blocks larger than MAX_NAME_BLOCK are split
+    by the first two letters and the length of the names, and names of neighbouring lengths are compared too
+    :return: lists of contact names, largest group first, and the number of contacts whose names
+    were not compared because they are too common even after the split
+    """
+    union_find = UnionFind()
+    first_by_key = {}
+    name_blocks = defaultdict(list)
+
+    for key, record in address_book.data.items():
+        join_keys = [("phone", phone.value) for phone in record.phones]
+        if record.email:
+            join_keys.append(("email", normalize_email(str(record.email))))
+        for join_key in join_keys:
+            if join_key in first_by_key:
+                union_find.union(first_by_key[join_key], key)
+            else:
+                first_by_key[join_key] = key
+        letters = latin_name(key)
+        if letters:
+            name_blocks[soundex(letters)].append((letters, key))
+
+    not_compared = 0
+    for block in name_blocks.values():
+        if len(block) <= MAX_NAME_BLOCK:
+            union_similar_names(union_find, block, block)
+            continue
+        split = defaultdict(list)
+        for letters, key in block:
+            split[(letters[:2], len(letters) // NAME_LENGTH_STEP)].append((letters, key))
+        for (prefix, length), part in split.items():
+            # a huge block means a common name, which is no evidence of a duplicate
+            if len(part) > MAX_NAME_BLOCK:
+                not_compared += len(part)
+                continue
+            union_similar_names(union_find, part, part)
+            longer = split.get((prefix, length + 1))
+            if longer is not None and len(longer) <= MAX_NAME_BLOCK:
+                union_similar_names(union_find, part, longer)
+
+    groups = sorted((sorted(group) for group in union_find.groups()), key=lambda group: (-len(group), group))
+    return groups, not_compared
+
+
+def merge_contacts(address_book: AddressBook, target: Name, others: list[Name]) -> Record:
+    """
+    Moves phones of the other contacts into the target contact, fills its missing email, address and birthday
+    from them and deletes the other contacts
+    """
+    record = address_book.find(target)
+    if record is None:
+        raise KeyError(target.value)
+    merged = []
+    # a contact named twice is merged once
+    seen = {id(record)}
+    for name in others:
+        other = address_book.find(name)
+        if other is None:
+            raise KeyError(name.value)
+        if id(other) not in seen:
+            seen.add(id(other))
+            merged.append((name, other))
+
+    for name, other in merged:
+        for phone in other.phones:
+            if phone.value not in record.get_phones():
+                record.add_phone(phone)
+        if record.email is None and other.email is not None:
+            record.add_email(other.email)
+        if record.address is None and other.address is not None:
+            record.add_address(other.address)
+        if record.birthday is None and other.birthday is not None:
+            record.add_birthday(other.birthday)
+        address_book.delete(name)
+    return record
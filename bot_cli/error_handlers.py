@@ -1,5 +1,9 @@
+from functools import wraps
+
+import print_util
 from print_util import print_error
 from constants import MIN_SEARCH_STR_LEN, COMMAND_LOOKUP
+from instrumentation import METRICS
 
 
 class ContactNotFoundError(Exception):
@@ -18,20 +22,48 @@ class EmailValidationError(Exception):
     pass
 
 
+def counted(handler, name: str = None):
+    """
+    Counts the errors reported by an error handler while metrics are enabled.
+    When handlers are nested, the error is counted by the innermost one that printed it
+    """
+    name = name or handler.__name__
+
+    def decorator(func):
+        handled = handler(func)
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            if not METRICS.enabled:
+                return handled(*args, **kwargs)
+            before = print_util.errors_printed
+            result = handled(*args, **kwargs)
+            if print_util.errors_printed > max(before, METRICS.attributed_errors):
+                METRICS.record_error(name)
+                METRICS.attributed_errors = print_util.errors_printed
+            return result
+
+        return inner
+
+    return decorator
+
+
+@counted
 def contact_not_found_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except ContactNotFoundError:
             print_error(f"Contact '{args[0]}' wasn't found")
 
     return inner
 
 
+@counted
 def add_contact_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('add-contact')}")
         except ValueError:
@@ -42,6 +74,7 @@ def add_contact_error(func):
     return inner
 
 
+@counted
 def delete_contact_error(func):
     def inner(*args):
         try:
@@ -52,10 +85,11 @@ def delete_contact_error(func):
     return inner
 
 
+@counted
 def change_contact_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('change-phone')}")
         except ValueError:
@@ -68,6 +102,7 @@ def change_contact_error(func):
     return inner
 
 
+@counted
 def search_error(func):
     def inner(*args, **kwargs):
         try:
@@ -80,6 +115,7 @@ def search_error(func):
     return inner
 
 
+@counted
 def note_error_handler(func):
     def inner(*args, **kwargs):
         try:
@@ -94,20 +130,22 @@ def note_error_handler(func):
     return inner
 
 
+@counted
 def show_phones_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('show-phone')}")
 
     return inner
 
 
+@counted
 def add_birthday_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('add-birthday')}")
         except ValueError:
@@ -116,10 +154,11 @@ def add_birthday_error(func):
     return inner
 
 
+@counted
 def show_birthday_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('show-birthday')}")
         except ValueError:
@@ -128,20 +167,22 @@ def show_birthday_error(func):
     return inner
 
 
+@counted
 def max_period_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except ValueError:
             print_error(f"Period should be int between 1 and 365")
 
     return inner
 
 
+@counted
 def add_address_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('add-address')}")
         except ValueError:
@@ -150,10 +191,11 @@ def add_address_error(func):
     return inner
 
 
+@counted
 def show_address_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('show-address')}")
         except ValueError:
@@ -162,10 +204,11 @@ def show_address_error(func):
     return inner
 
 
+@counted
 def add_email_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('add-email')}")
         except EmailValidationError:
@@ -174,10 +217,11 @@ def add_email_error(func):
     return inner
 
 
+@counted
 def show_email_error(func):
-    def inner(args):
+    def inner(address_book, args):
         try:
-            return func(args)
+            return func(address_book, args)
         except CommandError:
             print_error(f"Please use format: {COMMAND_LOOKUP.get('show-email')}")
         except ValueError:
@@ -186,6 +230,33 @@ def show_email_error(func):
     return inner
 
 
+@counted
+def merge_contacts_error(func):
+    def inner(address_book, args):
+        try:
+            return func(address_book, args)
+        except CommandError:
+            print_error(f"Please use format: {COMMAND_LOOKUP.get('merge-contacts')}")
+        except KeyError as e:
+            print_error(f"Contact '{e.args[0]}' wasn't found")
+
+    return inner
+
+
+@counted
+def find_error(func):
+    def inner(address_book, args):
+        try:
+            return func(address_book, args)
+        except CommandError:
+            print_error(f"Please use format: {COMMAND_LOOKUP.get('find')}")
+        except ValueError as e:
+            print_error(e.args[0])
+
+    return inner
+
+
+@counted
 def tag_error_handler(func):
     def inner(*args, **kwargs):
         try:
@@ -198,3 +269,77 @@ def tag_error_handler(func):
             print_error("Invalid note index.")
 
     return inner
+
+
+@counted
+def profile_error(func):
+    def inner(args):
+        try:
+            return func(args)
+        except CommandError:
+            print_error(f"Please use format: {COMMAND_LOOKUP.get('profile')}")
+
+    return inner
+
+
+@counted
+def use_tenant_error(func):
+    def inner(manager, args):
+        try:
+            return func(manager, args)
+        except CommandError:
+            print_error(f"Please use format: {COMMAND_LOOKUP.get('use')}")
+        except ValueError as e:
+            print_error(e.args[0])
+
+    return inner
+
+
+@counted
+def sync_error(func):
+    def inner(address_book, notebook, args):
+        try:
+            return func(address_book, notebook, args)
+        except CommandError:
+            print_error(f"Please use format: {COMMAND_LOOKUP.get('sync')}")
+        except (OSError, ValueError, KeyError) as e:
+            print_error(f"Synchronization failed: {e}")
+
+    return inner
+
+
+@counted
+def export_error(func):
+    def inner(address_book, notebook, args):
+        try:
+            return func(address_book, notebook, args)
+        except CommandError:
+            print_error(f"Please use format: {COMMAND_LOOKUP.get('export')}")
+
+    return inner
+
+
+@counted
+def restore_error(func):
+    def inner(address_book, notebook, args):
+        try:
+            return func(address_book, notebook, args)
+        except CommandError:
+            print_error(f"Please use format: {COMMAND_LOOKUP.get('restore')}")
+        except (OSError, ValueError) as e:
+            print_error(f"Restore failed: {e}")
+
+    return inner
+
+
+def page_error(command: str):
+    def decorator(func):
+        def inner(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except CommandError:
+                print_error(f"Please use format: {COMMAND_LOOKUP.get(command)}")
+
+        return inner
+
+    return counted(decorator, "page_error")
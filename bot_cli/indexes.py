@@ -0,0 +1,48 @@
+from bisect import bisect_left, insort
+
+
+class SortedIndex:
+    """
+    Keeps unique keys sorted, so prefix lookups and ordered slices don't need to sort or scan all keys
+    """
+
+    def __init__(self, keys=()):
+        self.keys = sorted(set(keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __contains__(self, key):
+        i = bisect_left(self.keys, key)
+        return i < len(self.keys) and self.keys[i] == key
+
+    def add(self, key):
+        if key not in self:
+            insort(self.keys, key)
+
+    def remove(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def slice(self, start: int, stop: int = None) -> list:
+        """
+        :return: keys at sorted positions start..stop
+        """
+        return self.keys[start:stop]
+
+    def prefix(self, prefix: str, limit: int = None) -> list:
+        """
+        :return: sorted keys starting with prefix, at most `limit` of them
+        """
+        result = []
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(self.keys[i])
+            i += 1
+        return result
@@ -0,0 +1,149 @@
+import json
+import os
+import time
+from collections import Counter
+from functools import wraps
+
+from storage import atomic_write
+
+# upper bounds of latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value_ms: float):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if value_ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value_ms
+
+    def percentile(self, p: float) -> float:
+        """
+        :return: upper bound of the bucket holding the p-th percentile
+        """
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return LATENCY_BUCKETS_MS[-1]
+
+    def to_json(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total, 3),
+            "buckets": {str(bound): bucket_count for bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.counts)},
+        }
+
+
+class Metrics:
+    """
+    Latency histograms, call, error and I/O counters of the bot.
+    Nothing is recorded while disabled, callers check `enabled` before measuring anything
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.latency = {}
+        self.calls = Counter()
+        self.errors = Counter()
+        self.bytes_read = Counter()
+        self.bytes_written = Counter()
+        # number of printed errors already attributed to an error handler
+        self.attributed_errors = 0
+
+    def observe(self, name: str, elapsed_ms: float):
+        self.calls[name] += 1
+        self.latency.setdefault(name, Histogram()).observe(elapsed_ms)
+
+    def record_io(self, name: str, elapsed_ms: float, read: int = 0, written: int = 0):
+        self.observe(name, elapsed_ms)
+        self.bytes_read[name] += read
+        self.bytes_written[name] += written
+
+    def record_error(self, handler: str):
+        self.errors[handler] += 1
+
+    def report(self) -> str:
+        lines = [f"{'operation':<24} {'calls':>7} {'avg ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'read':>10} {'written':>10}"]
+        for name in sorted(self.latency):
+            histogram = self.latency[name]
+            lines.append(
+                f"{name:<24} {self.calls[name]:>7} {histogram.total / histogram.count:>9.3f} "
+                f"{histogram.percentile(50):>8} {histogram.percentile(99):>8} "
+                f"{self.bytes_read[name]:>10} {self.bytes_written[name]:>10}"
+            )
+        for handler, count in sorted(self.errors.items()):
+            lines.append(f"errors in {handler}: {count}")
+        return "\n".join(lines)
+
+    def to_json(self) -> dict:
+        return {
+            "latency_ms": {name: histogram.to_json() for name, histogram in self.latency.items()},
+            "calls": dict(self.calls),
+            "errors": dict(self.errors),
+            "bytes_read": dict(self.bytes_read),
+            "bytes_written": dict(self.bytes_written),
+        }
+
+    def to_prometheus(self) -> str:
+        lines = ["# TYPE bot_latency_seconds histogram"]
+        for name, histogram in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS_MS, histogram.counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound / 1000:g}"
+                lines.append(f'bot_latency_seconds_bucket{{operation="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'bot_latency_seconds_sum{{operation="{name}"}} {histogram.total / 1000:g}')
+            lines.append(f'bot_latency_seconds_count{{operation="{name}"}} {histogram.count}')
+        lines.append("# TYPE bot_io_bytes_total counter")
+        for name in sorted(set(self.bytes_read) | set(self.bytes_written)):
+            lines.append(f'bot_io_bytes_total{{operation="{name}",direction="read"}} {self.bytes_read[name]}')
+            lines.append(f'bot_io_bytes_total{{operation="{name}",direction="written"}} {self.bytes_written[name]}')
+        lines.append("# TYPE bot_errors_total counter")
+        for handler, count in sorted(self.errors.items()):
+            lines.append(f'bot_errors_total{{handler="{handler}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """
+        Saves the metrics in Prometheus textfile format if the path ends with .prom, as JSON otherwise
+        """
+        with atomic_write(path) as file:
+            if path.endswith(".prom"):
+                file.write(self.to_prometheus())
+            else:
+                file.write(json.dumps(self.to_json(), indent=4))
+
+
+METRICS = Metrics()
+
+
+def instrument_io(direction: str):
+    """
+    Records latency and file size of a load ('read') or save ('written') method called with a file path
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def inner(self, path, *args, **kwargs):
+            if not METRICS.enabled:
+                return func(self, path, *args, **kwargs)
+            start = time.perf_counter()
+            result = func(self, path, *args, **kwargs)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            METRICS.record_io(func.__name__, elapsed_ms, **{direction: size})
+            return result
+
+        return inner
+
+    return decorator
@@ -0,0 +1,33 @@
+import unicodedata
+
+# apostrophes and the letters used for them, Ukrainian names are written with any of them
+APOSTROPHES = str.maketrans({"’": "'", "ʼ": "'", "‘": "'", "`": "'", "´": "'", "ʹ": "'", "＇": "'"})
+
+
+def is_cyrillic(char: str) -> bool:
+    return "Ѐ" <= char <= "ԯ"
+
+
+def fold(text: str) -> str:
+    """
+    Text compared regardless of case, diacritics, compatibility forms and apostrophe variants:
+    NFKC, casefolded, with the marks of Latin and other letters dropped ('José' -> 'jose', 'ＡＢ' -> 'ab').
+    Marks of Cyrillic letters are kept, since 'й' and 'ї' are letters of their own and not 'и' and 'і' with a mark
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().translate(APOSTROPHES)
+    if text.isascii():
+        return text
+    chars = []
+    for char in unicodedata.normalize("NFD", text):
+        if unicodedata.combining(char) and chars and not is_cyrillic(chars[-1]):
+            continue
+        chars.append(char)
+    return unicodedata.normalize("NFC", "".join(chars))
+
+
+def name_key(name: str) -> str:
+    """
+    Canonical key of a contact name, the same for all spellings of the name that differ only by
+    case, diacritics, apostrophes or spacing, e.g. "O’Brien", "o'brien" and "Ó'BRIEN"
+    """
+    return " ".join(fold(name).split())
@@ -0,0 +1,204 @@
+import re
+from collections import defaultdict
+
+from constants import NOTE_SHINGLE_WORDS, NOTE_SIGNATURE_SIZE, NOTE_LSH_BANDS, NOTE_SIMILARITY
+from duplicates import UnionFind
+from notes_classes import Notes
+
+WORD = re.compile(r"\w+")
+HASH_SPACE = 1 << 64
+ROWS_PER_BAND = NOTE_SIGNATURE_SIZE // NOTE_LSH_BANDS
+# estimated similarities are checked against the exact ones down to this much below the threshold
+ESTIMATE_MARGIN = 0.1
+
+
+def shingles(text: str) -> set:
+    """
+    :return: all runs of NOTE_SHINGLE_WORDS consecutive words of the text, ignoring case and punctuation
+    """
+    words = WORD.findall(text.casefold())
+    if len(words) <= NOTE_SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return set(zip(*(words[i:] for i in range(NOTE_SHINGLE_WORDS))))
+
+
+def minhash(text: str) -> tuple | None:
+    """
+    One permutation MinHash: every shingle is hashed once into one of NOTE_SIGNATURE_SIZE bins,
+    which keeps the minimum hash of its shingles. An empty bin takes the minimum of the next non-empty one shifted by the distance,
+    so two texts agree on a bin about as often as their shingle sets overlap
+    :return: minimums of the bins, None for a text without words
+    """
+    bins = [None] * NOTE_SIGNATURE_SIZE
+    for shingle in shingles(text):
+        value = hash(shingle) % HASH_SPACE
+        bin_ = value % NOTE_SIGNATURE_SIZE
+        if bins[bin_] is None or value < bins[bin_]:
+            bins[bin_] = value
+    filled = [bin_ for bin_, value in enumerate(bins) if value is not None]
+    if not filled:
+        return None
+    next_filled = filled[0] + NOTE_SIGNATURE_SIZE
+    for bin_ in range(NOTE_SIGNATURE_SIZE - 1, -1, -1):
+        if bins[bin_] is None:
+            bins[bin_] = bins[next_filled % NOTE_SIGNATURE_SIZE] + (next_filled - bin_) * HASH_SPACE
+        else:
+            next_filled = bin_
+    return tuple(bins)
+
+
+def similarity(signature: tuple, other: tuple) -> float:
+    """
+    :return: estimated Jaccard similarity of the shingles of two texts
+    """
+    return sum(1 for value, other_value in zip(signature, other) if value == other_value) / len(signature)
+
+
+def jaccard(text: str, other: str) -> float:
+    first, second = shingles(text), shingles(other)
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+def bands(signature: tuple) -> list:
+    return [(band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]) for band in range(NOTE_LSH_BANDS)]
+
+
+class NoteSimilarity:
+    """
+    MinHash signatures of all notes, with their bands hashed into LSH buckets.
+    Notes sharing a bucket are candidates, only they are compared,
+    so a lookup doesn't depend on the number of notes that aren't similar.
+    Signatures of short notes are inexact, so candidates close enough by signature are compared by their texts.
+    Kept up to date as a Notes observer, which only marks changed notes; they are signed again on the next query
+    """
+
+    def __init__(self, notebook: Notes):
+        self.notebook = notebook
+        self.signatures = {}
+        self.buckets = defaultdict(set)
+        # notes changed since the previous query, signed again by refresh
+        self.dirty_uids = set()
+        self.rebuild_needed = False
+        self.rebuild()
+
+    def add(self, uid: str, text: str):
+        self.remove(uid)
+        signature = minhash(text)
+        if signature is None:
+            return
+        self.signatures[uid] = signature
+        for band in bands(signature):
+            self.buckets[band].add(uid)
+
+    def remove(self, uid: str):
+        signature = self.signatures.pop(uid, None)
+        if signature is None:
+            return
+        for band in bands(signature):
+            bucket = self.buckets[band]
+            bucket.discard(uid)
+            if not bucket:
+                del self.buckets[band]
+
+    def rebuild(self):
+        self.signatures.clear()
+        self.buckets.clear()
+        for data in self.notebook.data["notes"]:
+            self.add(data["uid"], str(data["note"]))
+
+    def _similarity(self, uid: str, other: str, threshold: float) -> float:
+        """
+        :return: exact similarity of the notes, 0 without reading them if their signatures are far apart
+        """
+        if similarity(self.signatures[uid], self.signatures[other]) < threshold - ESTIMATE_MARGIN:
+            return 0.0
+        return jaccard(str(self.notebook.uids[uid]["note"]), str(self.notebook.uids[other]["note"]))
+
+    def __call__(self, uid, data):
+        if uid is None:
+            self.rebuild_needed = True
+        else:
+            self.dirty_uids.add(uid)
+
+    def refresh(self):
+        """
+        Signs again the notes changed since the previous query, so changing a note doesn't read its whole text
+        """
+        if self.rebuild_needed:
+            self.rebuild()
+            self.rebuild_needed = False
+            self.dirty_uids.clear()
+        for uid in self.dirty_uids:
+            data = self.notebook.uids.get(uid)
+            if data is None:
+                self.remove(uid)
+            else:
+                self.add(uid, str(data["note"]))
+        self.dirty_uids.clear()
+        return self
+
+    def similar(self, uid: str, threshold: float = NOTE_SIMILARITY) -> list[tuple[float, str]]:
+        """
+        :return: (similarity, uid) of the other notes at least `threshold` similar to the note, most similar first
+        """
+        signature = self.signatures.get(uid)
+        if signature is None:
+            return []
+        candidates = set().union(*(self.buckets[band] for band in bands(signature)))
+        candidates.discard(uid)
+        result = [(self._similarity(uid, other, threshold), other) for other in candidates]
+        return sorted(((score, other) for score, other in result if score >= threshold), reverse=True)
+
+    def clusters(self, threshold: float = NOTE_SIMILARITY) -> list[list[str]]:
+        """
+        Groups notes connected by pairs at least `threshold` similar.
+        Every note of a bucket is compared only with its first note, so a bucket of many copies costs linear time;
+        similar notes missed that way almost always share another bucket
+        :return: lists of note uids
+        """
+        union_find = UnionFind()
+        compared = set()
+        for bucket in self.buckets.values():
+            if len(bucket) < 2:
+                continue
+            first, *others = bucket
+            for other in others:
+                pair = (first, other) if first < other else (other, first)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                if self._similarity(first, other, threshold) >= threshold:
+                    union_find.union(first, other)
+        return union_find.groups()
+
+
+def note_similarity(notebook: Notes) -> NoteSimilarity:
+    if notebook.similarity is None:
+        notebook.similarity = NoteSimilarity(notebook)
+        notebook.observers.append(notebook.similarity)
+    return notebook.similarity.refresh()
+
+
+def merge_notes(notebook: Notes, target: int, others: list[int]) -> dict:
+    """
+    Adds tags of the other notes to the target note and deletes the other notes
+    :param target: id of the note that is kept
+    :param others: ids of the notes merged into it
+    :return: data of the target note
+    """
+    notes = notebook.data["notes"]
+    for index in [target, *others]:
+        if not 0 < index <= len(notes):
+            raise IndexError(index)
+    data = notes[target - 1]
+    # notes are removed by their uids, because removing shifts the ids of the following notes
+    merged = [notes[index - 1] for index in others if index != target]
+    tags = [str(tag) for tag in data["tags"]]
+    for other in merged:
+        for tag in other["tags"]:
+            if str(tag) not in tags:
+                tags.append(str(tag))
+                # the target keeps its id until the other notes are removed
+                notebook.add_tag(target, str(tag))
+    notebook.remove_uids(other["uid"] for other in merged)
+    return data
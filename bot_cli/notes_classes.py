@@ -1,21 +1,146 @@
-from collections import UserDict
+import heapq
+import threading
+import zlib
+from base64 import b64decode, b64encode
+from collections import OrderedDict, UserDict
 from address_book_classes import Field
-from constants import FILE_PATH_NOTES
+from constants import (
+    CHANGE_TIME_STEP,
+    FILE_PATH_NOTES,
+    NOTE_MEMORY_ESTIMATE,
+    NOTES_BATCH_ROWS,
+    NOTES_LOG_SUFFIX,
+    NOTES_LOG_MAX_BYTES,
+    NOTE_COMPRESS_MIN_SIZE,
+    NOTE_COMPRESS_LEVEL,
+    NOTE_BODY_CACHE_SIZE,
+)
+from indexes import SortedIndex
+from caching import CacheStats, next_generation
+from instrumentation import instrument_io
+from parallel_scan import SCANNER
+from spill import SpillStore, SpillingList, iter_json_batches, write_json_items
+from storage import atomic_write
 import os
 import json
+import time
+from uuid import uuid4
+
+
+class NoteBodyCache:
+    """
+    LRU of the decompressed texts of recently read compressed notes.
+    Notes are also read by snapshots in another thread, so the cache and the joining of notes are locked
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+        self.stats = CacheStats("note body cache")
+        self.lock = threading.RLock()
+
+    def get(self, note, compressed: bytes) -> str:
+        with self.lock:
+            entry = self.entries.get(id(note))
+            if entry is not None and entry[0] is note:
+                self.entries.move_to_end(id(note))
+                self.stats.hit()
+                return entry[1]
+            self.stats.miss()
+            text = zlib.decompress(compressed).decode()
+            self.put(note, text)
+            return text
+
+    def put(self, note, text: str):
+        with self.lock:
+            # the note is kept with its text, so its id can't be reused while it is cached
+            self.entries[id(note)] = (note, text)
+            self.entries.move_to_end(id(note))
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+NOTE_BODIES = NoteBodyCache(NOTE_BODY_CACHE_SIZE)
 
 
 class Note(Field):
+    """
+    Note text kept as a list of pieces, so appending to a long note doesn't copy it.
+    The pieces are joined when the whole text is read.
+    Texts of COMPRESS_MIN_SIZE characters or more are kept zlib-compressed and decompressed when read
+    """
+    COMPRESS_MIN_SIZE = NOTE_COMPRESS_MIN_SIZE
+
     def __init__(self, value):
         super().__init__(value)
 
+    @classmethod
+    def from_compressed(cls, compressed: bytes):
+        note = cls.__new__(cls)
+        note.__compressed = compressed
+        note.__pieces = []
+        return note
+
+    @property
+    def compressed(self) -> bytes | None:
+        """
+        :return: zlib-compressed text, None if the text isn't compressed
+        """
+        self._join()
+        return self.__compressed
+
     @property
     def value(self):
-        return self.__value
+        self._join()
+        if self.__compressed is None:
+            return self.__pieces[0]
+        return NOTE_BODIES.get(self, self.__compressed)
 
     @value.setter
     def value(self, value):
-        self.__value = value
+        if len(value) >= self.COMPRESS_MIN_SIZE:
+            self.__compressed = zlib.compress(value.encode(), NOTE_COMPRESS_LEVEL)
+            self.__pieces = []
+            NOTE_BODIES.put(self, value)
+        else:
+            self.__compressed = None
+            self.__pieces = [value]
+
+    def _join(self):
+        """
+        Joins appended pieces to the text, which may get compressed then
+        """
+        with NOTE_BODIES.lock:
+            if self.__compressed is not None and self.__pieces:
+                self.value = NOTE_BODIES.get(self, self.__compressed) + "".join(self.__pieces)
+            elif len(self.__pieces) > 1:
+                self.value = "".join(self.__pieces)
+
+    def append(self, text: str):
+        self.__pieces.append(text)
+
+    def head(self, length: int) -> str:
+        """
+        :return: first `length` characters of the text, decompressing and joining only the parts they come from
+        """
+        result = []
+        if self.__compressed is not None:
+            # a character takes at most 4 bytes, a character cut at the end is dropped by decode
+            data = zlib.decompressobj().decompress(self.__compressed, length * 4)
+            result.append(data.decode(errors="ignore")[:length])
+            length -= len(result[-1])
+        for piece in self.__pieces:
+            if length <= 0:
+                break
+            result.append(piece[:length])
+            length -= len(result[-1])
+        return "".join(result)
+
+    def stored_size(self) -> int:
+        """
+        :return: approximate memory used by the text as it is stored
+        """
+        return len(self.__compressed or b"") + sum(len(piece) for piece in self.__pieces)
 
 
 class Tag(Field):
@@ -31,28 +156,235 @@ class Tag(Field):
         self.__value = value
 
 
+def note_log_path(path: str) -> str:
+    return path + NOTES_LOG_SUFFIX
+
+
+def read_note_log(path: str) -> list[dict]:
+    """
+    :param path: path of the notes file
+    :return: appends logged since the notes were last saved in full, a line cut off by a crash is left out
+    """
+    log_path = note_log_path(path)
+    if not os.path.exists(log_path):
+        return []
+    deltas = []
+    with open(log_path, "r") as file:
+        for line in file:
+            try:
+                deltas.append(json.loads(line))
+            except ValueError:
+                break
+    return deltas
+
+
+def apply_note_log(data: list[dict], path: str) -> list[dict]:
+    """
+    Applies the logged appends to notes read from the notes file as JSON
+    """
+    deltas = read_note_log(path)
+    if deltas:
+        notes = {note_data.get("uid"): note_data for note_data in data}
+        for delta in deltas:
+            note_data = notes.get(delta["uid"])
+            # a save interrupted before the log was removed leaves appends the notes file already includes
+            if note_data is not None and delta["updated"] > note_data.get("updated", 0):
+                if "note_zlib" in note_data:
+                    note_data["note"] = zlib.decompress(b64decode(note_data.pop("note_zlib"))).decode()
+                note_data["note"] += delta["text"]
+                note_data["updated"] = delta["updated"]
+        # the appended notes are stored the way Notes saves them, compressed if they grew large
+        for note_data in {id(notes[delta["uid"]]): notes[delta["uid"]] for delta in deltas if delta["uid"] in notes}.values():
+            normalized = Notes.entry_to_json(Notes.entry_from_json(note_data))
+            note_data.clear()
+            note_data.update(normalized)
+    return data
+
+
 class Notes(UserDict):
     def __init__(self):
         super().__init__()
         self.data = {"notes": []}
+        # posting list of every tag: ids of the notes using it and how many times they do,
+        # and the sorted tags, used for completion
+        self.tag_notes = {}
+        self.tag_index = SortedIndex()
+        # changes on every modification of the notebook, used to validate cached queries
+        self.generation = next_generation()
+        # file the notebook is loaded from and saved to, and its generation at that moment
+        self.path = FILE_PATH_NOTES
+        self.saved_generation = None
+        # notes by their stable id, which unlike the note index doesn't change when other notes are removed.
+        # Notes are added to and removed from it together with the list, so it keeps the notebook order
+        self.uids = {}
+        # callables notified with (uid, note data) when a note is added or changed, with (uid, None)
+        # when it is removed and with (None, None) when the whole notebook is replaced
+        self.observers = []
+        # Merkle tree of note digests, built by sync on first use
+        self.merkle_tree = None
+        # MinHash index of the note texts, built by similar-notes and dedupe-notes on first use
+        self.similarity = None
+        # open snapshots, which keep the notes changed while they are read, see snapshots.Snapshot
+        self.snapshots = []
+        # versions of the notes file, recorded by every full save, see backups.note_backups
+        self.backups = None
+        # appends made by update_note since the last save
+        self.pending_appends = []
+
+    @staticmethod
+    def new_entry(note, tags=(), uid=None, updated=None) -> dict:
+        return {
+            "note": note if isinstance(note, Note) else Note(note),
+            "tags": [Tag(tag) for tag in tags],
+            "uid": uid or uuid4().hex,
+            "updated": updated if updated is not None else time.time(),
+        }
+
+    def _notify(self, uid, data):
+        if data is not None and isinstance(self.data["notes"], SpillingList):
+            # the note may have been spilled to disk while it was being changed
+            self.data["notes"].refresh(data)
+        self.generation = next_generation()
+        for observer in self.observers:
+            observer(uid, data)
+
+    def _before_change(self, uid):
+        if self.snapshots:
+            self.snapshots = [snapshot for snapshot in self.snapshots if not snapshot.closed]
+            for snapshot in self.snapshots:
+                snapshot.preserve(uid)
+
+    def _changed(self, data):
+        # drops the cached table row of the note
+        data.pop("row", None)
+        # change times of a note only grow, so a logged append tells by its time whether the saved note includes it
+        data["updated"] = max(time.time(), data["updated"] + CHANGE_TIME_STEP)
+        self._notify(data["uid"], data)
+
+    def bound_memory(self, max_bytes: int, directory: str = None):
+        """
+        Keeps about max_bytes of notes in memory, the least recently used ones are spilled
+        to a file in the directory and read back when they are accessed
+        """
+        notes = SpillingList(SpillStore("notes", max_bytes, self.entry_to_json, self.entry_from_json,
+                                        lambda data: NOTE_MEMORY_ESTIMATE + data["note"].stored_size(), directory))
+        for data in self.data["notes"]:
+            notes.append(data)
+        self.data["notes"] = notes
+        self.uids = notes.uids
+
+    def _count_tag(self, tag: str, uid, delta: int):
+        notes = self.tag_notes.get(tag)
+        if notes is None:
+            notes = self.tag_notes[tag] = {}
+            self.tag_index.add(tag)
+        count = notes.get(uid, 0) + delta
+        if count > 0:
+            notes[uid] = count
+        else:
+            notes.pop(uid, None)
+            if not notes:
+                del self.tag_notes[tag]
+                self.tag_index.remove(tag)
+
+    def tag_stats(self, limit: int = None) -> list[tuple[str, int]]:
+        """
+        :return: (tag, number of notes using it) of the `limit` most used tags, or of all tags, most used first
+        """
+        counts = ((-len(notes), tag) for tag, notes in self.tag_notes.items())
+        top = sorted(counts) if limit is None else heapq.nsmallest(limit, counts)
+        return [(tag, -count) for count, tag in top]
 
     def add_note(self, note):
         notes_ = self.data["notes"]
-        n = Note(note)
-        notes_.append({"note": n, "tags": []})
-        return len(notes_), n
+        data = self.new_entry(note)
+        notes_.append(data)
+        self.uids[data["uid"]] = data
+        self._notify(data["uid"], data)
+        return len(notes_), data["note"]
+
+    def append_entry(self, data):
+        """
+        Adds note data created by new_entry, keeping its id and tags
+        """
+        self.data["notes"].append(data)
+        self.uids[data["uid"]] = data
+        for tag in data["tags"]:
+            self._count_tag(str(tag), data["uid"], 1)
+        self._notify(data["uid"], data)
+
+    def merge_entry(self, note_data: dict):
+        """
+        Stores a serialized note received from another replica, replacing the note with the same id if there is one
+        """
+        entry = self.entry_from_json(note_data)
+        data = self.uids.get(entry["uid"])
+        if data is None:
+            self.append_entry(entry)
+            return
+        self._before_change(data["uid"])
+        for tag in data["tags"]:
+            self._count_tag(str(tag), data["uid"], -1)
+        for tag in entry["tags"]:
+            self._count_tag(str(tag), data["uid"], 1)
+        data.pop("row", None)
+        data.update(entry)
+        self._notify(data["uid"], data)
+
+    def note_ids(self) -> dict:
+        """
+        :return: note ids (positions from 1) by the stable ids of the notes, read from the order of uids,
+        so it is made in one pass without reading the notes
+        """
+        return {uid: index for index, uid in enumerate(self.uids, 1)}
+
+    def remove_uids(self, uids) -> int:
+        """
+        Removes the notes with the stable ids in one pass over the notebook, ids of missing notes are skipped
+        :return: number of removed notes
+        """
+        removed = {uid: self.uids[uid] for uid in uids if uid in self.uids}
+        if not removed:
+            return 0
+        for uid in removed:
+            self._before_change(uid)
+        notes = self.data["notes"]
+        if isinstance(notes, SpillingList):
+            notes.remove_uids(removed.keys())
+        else:
+            notes[:] = [data for data in notes if data["uid"] not in removed]
+        for uid, data in removed.items():
+            del self.uids[uid]
+            for tag in data["tags"]:
+                self._count_tag(str(tag), uid, -1)
+            self._notify(uid, None)
+        return len(removed)
 
     def remove_note(self, index):
+        removed = self.data["notes"][index - 1]
+        self._before_change(removed["uid"])
         del self.data["notes"][index - 1]
+        del self.uids[removed["uid"]]
+        for tag in removed["tags"]:
+            self._count_tag(str(tag), removed["uid"], -1)
+        self._notify(removed["uid"], None)
 
     def change_note(self, index, new_note):
-        self.data["notes"][index - 1]["note"] = Note(new_note)
+        data = self.data["notes"][index - 1]
+        self._before_change(data["uid"])
+        data["note"] = Note(new_note)
+        self._changed(data)
 
     def update_note(self, index, add_note_text):
-        current_note = self.find_note_by_index(index)
-        current_note_text = str(current_note["Note"])
-        update_note_text = current_note_text + "; " + add_note_text
-        self.change_note(index, update_note_text)
+        """
+        Appends text to the note, separated by '; '. The append is kept until it is saved by save_appends
+        """
+        data = self.data["notes"][index - 1]
+        text = "; " + add_note_text
+        self._before_change(data["uid"])
+        data["note"].append(text)
+        self._changed(data)
+        self.pending_appends.append({"uid": data["uid"], "text": text, "updated": data["updated"]})
 
     def find_note_by_index(self, index):
         data = self.data["notes"][index - 1]
@@ -60,13 +392,24 @@ class Notes(UserDict):
         tags = [str(tag) for tag in data["tags"]]
         return {"Note": note.capitalize(), "Tags": tags}
 
-    def find_note_by_subtext(self, sub_text):
+    def find_note_by_subtext(self, sub_text, regex=False):
+        """
+        Finds notes containing the text, or matching it as a regular expression if regex is set.
+        Large notebooks are scanned by worker processes
+        """
+        notes = self.data["notes"]
+        if regex:
+            rows = SCANNER.scan("note-text", self.generation, lambda: [str(data["note"]) for data in notes],
+                                len(notes), sub_text, regex=True)
+        else:
+            rows = SCANNER.scan("note-search", self.generation, lambda: [str(data["note"]).casefold() for data in notes],
+                                len(notes), sub_text.casefold())
         searched_note = []
-        for data in self.data["notes"]:
+        for row in rows:
+            data = notes[row]
             note = str(data["note"]).casefold()
             tags = [str(tag) for tag in data["tags"]]
-            if sub_text.casefold() in note:
-                searched_note.append({"Note": note.capitalize(), "Tags": tags})
+            searched_note.append({"Note": note.capitalize(), "Tags": tags})
         return searched_note
 
     def show_notes(self):
@@ -78,8 +421,21 @@ class Notes(UserDict):
 
         return notes
 
+    def iter_notes(self, start=0, stop=None):
+        """
+        Lazily yields (note_id, note data) pairs for positions start..stop without copying the notebook
+        """
+        notes = self.data["notes"]
+        stop = len(notes) if stop is None else min(stop, len(notes))
+        for index in range(start, stop):
+            yield index + 1, notes[index]
+
     def add_tag(self, index, tag):
-        self.data["notes"][index - 1]["tags"].append(Tag(tag))
+        data = self.data["notes"][index - 1]
+        self._before_change(data["uid"])
+        data["tags"].append(Tag(tag))
+        self._changed(data)
+        self._count_tag(tag, data["uid"], 1)
 
     def remove_tag(self, note_index, tag):
         tags = [str(tag) for tag in self.data["notes"][note_index - 1]["tags"]]
@@ -87,7 +443,11 @@ class Notes(UserDict):
         if tag_index == -1:
             return "-1"
         else:
-            del self.data["notes"][note_index - 1]["tags"][tag_index]
+            data = self.data["notes"][note_index - 1]
+            self._before_change(data["uid"])
+            del data["tags"][tag_index]
+            self._changed(data)
+            self._count_tag(tag, data["uid"], -1)
             return "200"
 
     def find_notes_by_tag(self, tag):
@@ -99,18 +459,54 @@ class Notes(UserDict):
                 searched_note.append({"Note": note.capitalize(), "Tags": tags})
         return searched_note
 
-    def change_tag(self):
-        pass  # зробити редагування конретного тега? не впевнений шо треба
+    def change_tag(self, tag, new_tag) -> int:
+        """
+        Renames the tag in all notes using it, found by its posting list.
+        A note already having the new tag just loses the old one
+        :return: number of changed notes
+        """
+        notes = self.tag_notes.get(tag)
+        if not notes or tag == new_tag:
+            return 0
+        uids = list(notes)
+        for uid in uids:
+            data = self.uids[uid]
+            self._before_change(uid)
+            tags = [str(note_tag) for note_tag in data["tags"]]
+            kept = [note_tag for note_tag in data["tags"] if str(note_tag) != tag]
+            if new_tag not in tags:
+                kept.append(Tag(new_tag))
+                self._count_tag(new_tag, uid, 1)
+            self._count_tag(tag, uid, -notes[uid])
+            data["tags"] = kept
+            self._changed(data)
+        return len(uids)
+
+    @staticmethod
+    def entry_to_json(data) -> dict:
+        """
+        Compressed notes are saved as base64 of their compressed text under 'note_zlib' instead of 'note'
+        """
+        note = data["note"]
+        compressed = note.compressed
+        return {
+            **({"note": str(note.value)} if compressed is None else {"note_zlib": b64encode(compressed).decode()}),
+            "tags": [str(tag.value) for tag in data["tags"]],
+            "uid": data["uid"],
+            "updated": data["updated"],
+        }
+
+    @classmethod
+    def entry_from_json(cls, note_data) -> dict:
+        if "note_zlib" in note_data:
+            note = Note.from_compressed(b64decode(note_data["note_zlib"]))
+        else:
+            note = note_data["note"]
+        return cls.new_entry(note, note_data["tags"], note_data.get("uid"), note_data.get("updated", 0))
 
     def to_json(self):
         serialized_data = {
-            "notes": [
-                {
-                    "note": str(data["note"].value),
-                    "tags": [str(tag.value) for tag in data["tags"]],
-                }
-                for data in self.data["notes"]
-            ]
+            "notes": [self.entry_to_json(data) for data in self.data["notes"]]
         }
         return serialized_data
 
@@ -120,24 +516,78 @@ class Notes(UserDict):
         notes_instance.data = {"notes": []}
 
         for note_data in data:
-            note_value = note_data["note"]
-            tags = note_data["tags"]
-            notes_instance.data["notes"].append(
-                {"note": Note(note_value), "tags": [Tag(tag) for tag in tags]}
-            )
+            entry = cls.entry_from_json(note_data)
+            notes_instance.data["notes"].append(entry)
+            notes_instance.uids[entry["uid"]] = entry
+            for tag in note_data["tags"]:
+                notes_instance._count_tag(tag, entry["uid"], 1)
 
         return notes_instance
 
+    @instrument_io("written")
     def save_notes(self, path):
-        serialized_data = self.to_json()
-        with open(path, "w") as file:
-            json.dump(serialized_data["notes"], file, indent=4)
+        with atomic_write(path) as file:
+            write_json_items(file, (self.entry_to_json(data) for data in self.data["notes"]), array=True)
+        # the saved notes include all logged appends. If the log is left by a crash before it is removed,
+        # its appends are skipped on load, they are not newer than the change times of the saved notes
+        if os.path.exists(note_log_path(path)):
+            os.remove(note_log_path(path))
+        self.pending_appends = []
+        self.path = path
+        self.saved_generation = self.generation
+        if self.backups is not None and os.path.abspath(path) == self.backups.path:
+            self.backups.record(file.crc)
+
+    def save_appends(self, path):
+        """
+        Writes only the texts appended by update_note to the log next to the notes file,
+        or saves all notes once the log grows over NOTES_LOG_MAX_BYTES
+        """
+        log_path = note_log_path(path)
+        if path != self.path or not os.path.exists(path) or (
+                os.path.exists(log_path) and os.path.getsize(log_path) > NOTES_LOG_MAX_BYTES):
+            self.save_notes(path)
+            return
+        with open(log_path, "a") as file:
+            file.writelines(json.dumps(delta) + "\n" for delta in self.pending_appends)
+            # an append is reported as saved only once it is on disk
+            file.flush()
+            os.fsync(file.fileno())
+        self.pending_appends = []
+        self.saved_generation = self.generation
 
+    @instrument_io("read")
     def load_notes(self, path):
         with open(path, "r") as file:
-            data = json.load(file)
-            notes = Notes.from_json(data)
-            self.data = notes.data
+            self._before_change(None)
+            notes = self.data["notes"]
+            bounded = isinstance(notes, SpillingList)
+            if bounded:
+                notes.clear()
+            else:
+                notes = self.data["notes"] = []
+                self.uids = {}
+            self.tag_notes = {}
+            self.tag_index = SortedIndex()
+            # in bounded memory mode notes are read in batches, so the file is never held in memory
+            for _, batch in iter_json_batches(file, NOTES_BATCH_ROWS, stream=bounded):
+                for note_data in batch:
+                    entry = self.entry_from_json(note_data)
+                    notes.append(entry)
+                    self.uids[entry["uid"]] = entry
+                    for tag in entry["tags"]:
+                        self._count_tag(str(tag), entry["uid"], 1)
+            for delta in read_note_log(path):
+                entry = self.uids.get(delta["uid"])
+                if entry is not None and delta["updated"] > entry["updated"]:
+                    entry["note"].append(delta["text"])
+                    entry["updated"] = delta["updated"]
+                    # puts the entry back in bounded memory mode
+                    self.uids[entry["uid"]] = entry
+            self.pending_appends = []
+            self._notify(None, None)
+        self.path = path
+        self.saved_generation = self.generation
 
     def __str__(self):
         notes = []
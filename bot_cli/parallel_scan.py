@@ -0,0 +1,151 @@
+import atexit
+import os
+import re
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from constants import PARALLEL_SCAN_MIN_ROWS, PARALLEL_SCAN_CHUNKS_PER_WORKER, PARALLEL_SCAN_ATTACHED
+
+OFFSET_SIZE = array("q").itemsize
+
+
+class TextColumn:
+    """
+    Texts of one column packed into a shared memory block, so worker processes read them without pickling:
+    row count, row_count + 1 offsets of the rows in the text and the UTF-8 encoded text of all rows
+    """
+
+    def __init__(self, texts: list[str]):
+        encoded = [text.encode() for text in texts]
+        offsets = array("q", [0])
+        total = 0
+        for row in encoded:
+            total += len(row)
+            offsets.append(total)
+        self.rows = len(encoded)
+        header = array("q", [self.rows]).tobytes() + offsets.tobytes()
+        self.shm = shared_memory.SharedMemory(create=True, size=len(header) + total)
+        self.shm.buf[:len(header)] = header
+        self.shm.buf[len(header):len(header) + total] = b"".join(encoded)
+        self.name = self.shm.name
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def read_column(buf) -> tuple[array, memoryview]:
+    """
+    :return: row offsets and the text of a column packed by TextColumn
+    """
+    header = array("q")
+    header.frombytes(buf[:OFFSET_SIZE])
+    end = OFFSET_SIZE * (header[0] + 2)
+    offsets = array("q")
+    offsets.frombytes(buf[OFFSET_SIZE:end])
+    return offsets, buf[end:]
+
+
+def scan_rows(buf, start: int, stop: int, needle: str, regex: bool = False) -> list[int]:
+    """
+    :return: numbers of rows start..stop of the column containing the needle, or matching it as a regular expression
+    """
+    offsets, text = read_column(buf)
+    if regex:
+        pattern = re.compile(needle, re.IGNORECASE)
+        return [row for row in range(start, stop)
+                if pattern.search(bytes(text[offsets[row]:offsets[row + 1]]).decode())]
+
+    encoded = needle.encode()
+    if not encoded:
+        return list(range(start, stop))
+    # the needle is searched in the bytes of all rows at once, and every hit is mapped back to its row
+    base = offsets[start]
+    chunk = bytes(text[base:offsets[stop]])
+    result = []
+    position = chunk.find(encoded)
+    while position != -1:
+        row = bisect_right(offsets, base + position, start, stop) - 1
+        row_end = offsets[row + 1] - base
+        if position + len(encoded) <= row_end:
+            result.append(row)
+            position = chunk.find(encoded, row_end)
+        else:
+            # the hit spans two rows
+            position = chunk.find(encoded, position + 1)
+    return result
+
+
+# columns attached by a worker process, kept between tasks of the same scan
+_attached: dict = {}
+
+
+def _scan_chunk(name: str, start: int, stop: int, needle: str, regex: bool) -> list[int]:
+    shm = _attached.get(name)
+    if shm is None:
+        if len(_attached) >= PARALLEL_SCAN_ATTACHED:
+            _attached.pop(next(iter(_attached))).close()
+        shm = _attached[name] = shared_memory.SharedMemory(name=name)
+    return scan_rows(shm.buf, start, stop, needle, regex)
+
+
+class ParallelScanner:
+    """
+    Scans text columns that no index can answer, split into chunks handled by a pool of worker processes.
+    A column is packed into shared memory once per generation of its data and reused by later scans
+    """
+
+    def __init__(self, workers: int = None, min_rows: int = PARALLEL_SCAN_MIN_ROWS):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.columns = {}
+        self.executor = None
+
+    def column(self, name: str, generation: int, texts) -> TextColumn:
+        cached = self.columns.get(name)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        if cached is not None:
+            cached[1].close()
+        column = TextColumn(texts())
+        self.columns[name] = (generation, column)
+        return column
+
+    def scan(self, name: str, generation: int, texts, rows: int, needle: str, regex: bool = False) -> list[int]:
+        """
+        :param name: column name, e.g. 'notes'
+        :param generation: generation of the data the column is built from
+        :param texts: callable returning the texts of all rows, called only when the column has to be built
+        :param rows: number of rows
+        :return: sorted numbers of the matching rows
+        """
+        if self.workers < 2 or rows < self.min_rows:
+            if regex:
+                pattern = re.compile(needle, re.IGNORECASE)
+                return [row for row, text in enumerate(texts()) if pattern.search(text)]
+            return [row for row, text in enumerate(texts()) if needle in text]
+
+        column = self.column(name, generation, texts)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers)
+        chunk = -(-column.rows // (self.workers * PARALLEL_SCAN_CHUNKS_PER_WORKER))
+        futures = [self.executor.submit(_scan_chunk, column.name, start, min(start + chunk, column.rows), needle, regex)
+                   for start in range(0, column.rows, chunk)]
+        result = []
+        for future in futures:
+            result.extend(future.result())
+        return result
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        for _, column in self.columns.values():
+            column.close()
+        self.columns.clear()
+
+
+SCANNER = ParallelScanner()
+atexit.register(SCANNER.shutdown)
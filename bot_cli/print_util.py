@@ -1,11 +1,21 @@
+import sys
+from itertools import islice
+
 import colorama
 from colorama import Fore
 
+from constants import PRINT_BATCH_SIZE
+
 # Initialize colorama
 colorama.init(autoreset=True)
 
+# number of errors printed so far, used to count errors per error handler
+errors_printed = 0
+
 
 def print_error(msg: str):
+    global errors_printed
+    errors_printed += 1
     print(Fore.RED + msg)
 
 
@@ -23,3 +33,18 @@ def print_warn(msg: str):
 
 def print_magenta(msg: str):
     print(Fore.MAGENTA + msg)
+
+
+def print_lines(lines, color: str = "", batch_size: int = PRINT_BATCH_SIZE):
+    """
+    Writes lines in batches, one coloured write per batch instead of one print per line
+    :param lines: any iterable of strings, consumed lazily
+    :return: number of lines written
+    """
+    lines = iter(lines)
+    written = 0
+    while batch := list(islice(lines, batch_size)):
+        sys.stdout.write(color + "\n".join(batch) + "\n")
+        written += len(batch)
+    sys.stdout.flush()
+    return written
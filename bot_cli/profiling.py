@@ -0,0 +1,113 @@
+import cProfile
+import gc
+import io
+import os
+import pstats
+import sys
+import tracemalloc
+
+from address_book_classes import Record, Name, Phone, Birthday, Email, Address
+from caching import estimate_size
+from notes_classes import Note, Tag
+
+PROFILED_CLASSES = (Record, Name, Phone, Birthday, Email, Address, Note, Tag)
+TOP_LINES = 10
+
+
+class CommandProfiler:
+    """
+    cProfile session wrapping the dispatch of every command between 'profile start' and 'profile stop'
+    """
+
+    def __init__(self):
+        self.profile = None
+
+    @property
+    def active(self) -> bool:
+        return self.profile is not None
+
+    def start(self):
+        self.profile = cProfile.Profile()
+
+    def run(self, func, *args):
+        return self.profile.runcall(func, *args)
+
+    def stop(self, path: str) -> str:
+        """
+        Saves pstats of the session to the path
+        :return: summary of the most expensive functions
+        """
+        profile, self.profile = self.profile, None
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(TOP_LINES)
+        return summary.getvalue()
+
+
+PROFILER = CommandProfiler()
+
+
+def object_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def query_indexes_size(indexes) -> int:
+    if indexes is None:
+        return 0
+    return estimate_size([indexes.tokens.keys] + [(index.keys_by_value, index.values_by_key) for index in indexes.indexes])
+
+
+def merkle_tree_size(tree) -> int:
+    return 0 if tree is None else estimate_size((tree.leaves, tree.hashes, tree.dirty_keys))
+
+
+def memory_report(address_book, notebook, query_cache) -> str:
+    """
+    Attributes live memory to the bot's classes and index structures,
+    and, if tracemalloc is tracing, to the lines of the bot that allocated it
+    """
+    counts = {cls.__name__: [0, 0] for cls in PROFILED_CLASSES}
+    for obj in gc.get_objects():
+        if isinstance(obj, PROFILED_CLASSES):
+            entry = counts[type(obj).__name__]
+            entry[0] += 1
+            entry[1] += object_size(obj)
+
+    lines = [f"{'objects':<24} {'count':>10} {'KiB':>12}"]
+    for name, (count, size) in counts.items():
+        lines.append(f"{name:<24} {count:>10} {size / 1024:>12.1f}")
+
+    # the records and notes themselves are counted in the objects above, the structures with everything else they hold
+    structures = {
+        "address book dict": sys.getsizeof(address_book.data),
+        "name index": estimate_size(address_book.name_index.keys),
+        "name key index": estimate_size((address_book.keys, address_book.shadowed, address_book.key_index.keys)),
+        "notes list": sys.getsizeof(notebook.data["notes"]),
+        "tag index": estimate_size((notebook.tag_index.keys, notebook.tag_notes)),
+        "query cache": query_cache.size,
+        "query indexes": query_indexes_size(address_book.query_indexes),
+        "search texts": estimate_size(address_book._search_texts),
+        "merkle trees": sum(merkle_tree_size(book.merkle_tree) for book in (address_book, notebook)),
+        "note similarity": 0 if notebook.similarity is None else estimate_size(
+            (notebook.similarity.signatures, notebook.similarity.buckets)),
+        "snapshots": sum(estimate_size((snapshot.keys, snapshot.pending, snapshot.saved))
+                         for book in (address_book, notebook) for snapshot in book.snapshots if not snapshot.closed),
+    }
+    lines.append(f"{'structures':<24} {'':>10} {'KiB':>12}")
+    for name, size in structures.items():
+        lines.append(f"{name:<24} {'':>10} {size / 1024:>12.1f}")
+
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(f"traced memory: {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB")
+        lines.append(f"{'allocated at':<24} {'blocks':>10} {'KiB':>12}")
+        bot_dir = os.path.dirname(os.path.abspath(__file__))
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, os.path.join(bot_dir, "*"))])
+        for stat in snapshot.statistics("lineno")[:TOP_LINES]:
+            frame = stat.traceback[0]
+            location = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+            lines.append(f"{location:<24} {stat.count:>10} {stat.size / 1024:>12.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,257 @@
+import re
+from collections import defaultdict
+from datetime import date, timedelta
+
+from address_book_classes import AddressBook, Record
+from constants import QUERY_INTERSECT_FACTOR
+from indexes import SortedIndex
+from names import name_key
+from reminders import next_occurrence
+
+PREDICATE = re.compile(r"^(?P<field>[a-z]+)(?P<op>[~^@<>=])(?P<value>.+)$")
+FIELD_ALIASES = {"city": "address", "street": "address"}
+WORD = re.compile(r"\w+")
+
+
+def address_tokens(record: Record) -> set[str]:
+    return set(WORD.findall(record.address.value.casefold())) if record.address else set()
+
+
+def email_domain(record: Record) -> str | None:
+    return str(record.email).rpartition("@")[2].casefold() if record.email else None
+
+
+def birthday_day(record: Record) -> tuple | None:
+    return (record.birthday.value.month, record.birthday.value.day) if record.birthday else None
+
+
+class SecondaryIndex:
+    """
+    Maps values of one attribute to the keys of the records having them.
+    The values indexed for every key are remembered, so a changed record is re-indexed without a scan
+    """
+
+    def __init__(self, extract):
+        self.extract = extract
+        self.keys_by_value = defaultdict(set)
+        self.values_by_key = {}
+
+    def remove(self, key):
+        for value in self.values_by_key.pop(key, ()):
+            keys = self.keys_by_value[value]
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_value[value]
+
+    def add(self, key, record):
+        values = self.extract(record)
+        if values is None:
+            return
+        if not isinstance(values, set):
+            values = {values}
+        self.values_by_key[key] = values
+        for value in values:
+            self.keys_by_value[value].add(key)
+
+    def get(self, value) -> set:
+        return self.keys_by_value.get(value, set())
+
+
+class ContactIndexes:
+    """
+    Secondary indexes of an address book, kept up to date as one of its observers
+    """
+
+    def __init__(self, address_book: AddressBook):
+        self.address_book = address_book
+        self.email_domain = SecondaryIndex(email_domain)
+        self.address_token = SecondaryIndex(address_tokens)
+        self.birthday = SecondaryIndex(birthday_day)
+        self.phone_count = SecondaryIndex(lambda record: len(record.phones))
+        self.indexes = (self.email_domain, self.address_token, self.birthday, self.phone_count)
+        # sorted address tokens for prefix lookups
+        self.tokens = SortedIndex()
+        self.rebuild()
+
+    def rebuild(self):
+        for index in self.indexes:
+            index.keys_by_value.clear()
+            index.values_by_key.clear()
+        for key, record in self.address_book.data.items():
+            for index in self.indexes:
+                index.add(key, record)
+        self.tokens = SortedIndex(self.address_token.keys_by_value.keys())
+
+    def add(self, key, record):
+        for index in self.indexes:
+            index.add(key, record)
+        for token in self.address_token.values_by_key.get(key, ()):
+            self.tokens.add(token)
+
+    def __call__(self, key, record):
+        if key is None:
+            self.rebuild()
+            return
+        for token in self.address_token.values_by_key.get(key, ()):
+            if len(self.address_token.get(token)) == 1:
+                self.tokens.remove(token)
+        for index in self.indexes:
+            index.remove(key)
+        if record is not None:
+            self.add(key, record)
+
+
+def contact_indexes(address_book: AddressBook) -> ContactIndexes:
+    if address_book.query_indexes is None:
+        address_book.query_indexes = ContactIndexes(address_book)
+        address_book.observers.append(address_book.query_indexes)
+    return address_book.query_indexes
+
+
+def compare(actual: int, op: str, expected: int) -> bool:
+    return {"<": actual < expected, ">": actual > expected, "=": actual == expected}[op]
+
+
+class Predicate:
+    """
+    One condition of a query, e.g. 'city~Kyiv', 'email@gmail.com', 'birthday<30d' or 'phones>1'
+    """
+
+    def __init__(self, text: str):
+        match = PREDICATE.match(text)
+        if not match:
+            raise ValueError(f"'{text}' is not a valid condition")
+        self.text = text
+        self.field = FIELD_ALIASES.get(match["field"], match["field"])
+        self.op = match["op"]
+        # names are compared by their canonical keys, see names.name_key
+        self.value = name_key(match["value"]) if self.field == "name" else match["value"].casefold()
+
+        if self.field == "birthday" and self.op == "<":
+            if not re.fullmatch(r"\d+d?", self.value):
+                raise ValueError(f"'{text}': expecting number of days, e.g. birthday<30d")
+            self.days = int(self.value.rstrip("d"))
+        elif self.field == "phones" and self.op in "<>=":
+            if not self.value.isdigit():
+                raise ValueError(f"'{text}': expecting number of phones, e.g. phones>1")
+            self.count = int(self.value)
+        elif (self.field, self.op) not in (("address", "~"), ("email", "@"), ("email", "~"),
+                                           ("name", "~"), ("name", "^"), ("phone", "~")):
+            raise ValueError(f"'{text}' is not a supported condition")
+
+    def _buckets(self, indexes: ContactIndexes) -> list[set] | None:
+        """
+        :return: index buckets whose union holds exactly the matching keys, None if no index can answer the condition
+        """
+        match self.field, self.op:
+            case "address", "~":
+                return [indexes.address_token.get(token) for token in indexes.tokens.prefix(self.value)]
+            case "email", "@":
+                return [indexes.email_domain.get(self.value)]
+            case "birthday", "<":
+                today = date.today()
+                buckets = []
+                for offset in range(min(self.days, 366)):
+                    day = today + timedelta(days=offset)
+                    buckets.append(indexes.birthday.get((day.month, day.day)))
+                    # birthdays on 29 February fall on 28 February in common years, as in days_until
+                    if (day.month, day.day) == (2, 28) and (day + timedelta(days=1)).month == 3:
+                        buckets.append(indexes.birthday.get((2, 29)))
+                return buckets
+            case "phones", _:
+                return [keys for count, keys in indexes.phone_count.keys_by_value.items()
+                        if compare(count, self.op, self.count)]
+            case "name", "^":
+                address_book = indexes.address_book
+                return [set(address_book.name_keys(canonical)) for canonical in address_book.key_index.prefix(self.value)]
+            case "name", "~":
+                # canonical keys are already normalized, so only the query is
+                address_book = indexes.address_book
+                return [{key for canonical in address_book.keys if self.value in canonical
+                         for key in address_book.name_keys(canonical)}]
+        return None
+
+    def estimate(self, indexes: ContactIndexes) -> int | None:
+        """
+        :return: number of matching records counted from index bucket sizes, None if no index can answer
+        """
+        buckets = self._buckets(indexes)
+        return None if buckets is None else sum(len(keys) for keys in buckets)
+
+    def candidates(self, indexes: ContactIndexes) -> set:
+        keys = set()
+        for bucket in self._buckets(indexes):
+            keys |= bucket
+        return keys
+
+    def matches(self, record: Record) -> bool:
+        match self.field, self.op:
+            case "address", "~":
+                return any(token.startswith(self.value) for token in address_tokens(record))
+            case "email", "@":
+                return email_domain(record) == self.value
+            case "email", "~":
+                return record.email is not None and self.value in str(record.email).casefold()
+            case "birthday", "<":
+                return birthday_day(record) is not None and days_until(record) < self.days
+            case "phones", _:
+                return compare(len(record.phones), self.op, self.count)
+            case "name", "~":
+                return self.value in name_key(record.name.value)
+            case "name", "^":
+                return name_key(record.name.value).startswith(self.value)
+            case "phone", "~":
+                return any(self.value in phone.value for phone in record.phones)
+        return False
+
+
+def days_until(record: Record) -> int:
+    """
+    :return: days until the next birthday, which is on 28 February in common years for birthdays on 29 February
+    """
+    today = date.today()
+    return (next_occurrence(record.birthday.value, today) - today).days
+
+
+def parse_query(args: list[str]) -> list[Predicate]:
+    if not args:
+        raise ValueError("Expecting at least one condition")
+    return [Predicate(arg) for arg in args]
+
+
+def plan(predicates: list[Predicate], indexes: ContactIndexes) -> tuple[set | None, list[Predicate]]:
+    """
+    Drives the query by the most selective indexed condition, then intersects the key sets of the other indexed
+    conditions from the smallest one while a set is at most QUERY_INTERSECT_FACTOR times larger than the candidates.
+    Larger sets cost more to build than checking their conditions on the candidates
+    :return: candidate keys (None means every record) and the conditions left to verify on them
+    """
+    estimates = [(predicate.estimate(indexes), predicate) for predicate in predicates]
+    indexed = sorted(((size, predicate) for size, predicate in estimates if size is not None), key=lambda item: item[0])
+    remaining = [predicate for size, predicate in estimates if size is None]
+    if not indexed:
+        return None, remaining
+
+    candidates = indexed[0][1].candidates(indexes)
+    for position, (size, predicate) in enumerate(indexed[1:], 1):
+        if not candidates or size > len(candidates) * QUERY_INTERSECT_FACTOR:
+            # the following sets are larger still
+            remaining.extend(predicate for _, predicate in indexed[position:])
+            break
+        candidates &= predicate.candidates(indexes)
+    return candidates, remaining
+
+
+def find(address_book: AddressBook, predicates: list[Predicate]) -> list[Record]:
+    """
+    :return: records matching all conditions, sorted by name
+    """
+    candidates, remaining = plan(predicates, contact_indexes(address_book))
+    if candidates is None:
+        records = address_book.data.values()
+    else:
+        records = (address_book.data[key] for key in sorted(candidates))
+    result = [record for record in records if all(predicate.matches(record) for predicate in remaining)]
+    if candidates is None:
+        result.sort(key=lambda record: record.name.value)
+    return result
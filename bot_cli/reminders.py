@@ -0,0 +1,142 @@
+import heapq
+import json
+import os
+from datetime import date, timedelta
+
+from address_book_classes import AddressBook, Record
+from constants import REMINDER_LEAD_DAYS, REMINDERS_STATE_FILE
+from storage import atomic_write
+from sync import file_signature
+
+
+def next_occurrence(birthday: date, since: date) -> date:
+    """
+    :return: first birthday on or after `since`, 28 February in common years for birthdays on 29 February
+    """
+    for year in (since.year, since.year + 1):
+        try:
+            occurrence = birthday.replace(year=year)
+        except ValueError:
+            occurrence = date(year, 2, 28)
+        if occurrence >= since:
+            return occurrence
+
+
+class BirthdayScheduler:
+    """
+    Min-heap of reminder dates, one for the next birthday of every contact, kept up to date as an AddressBook
+    observer. Entries replaced by a change stay in the heap and are skipped when they reach its top,
+    so a tick costs O(log n) per due reminder and nothing when none are due
+    """
+
+    def __init__(self, address_book: AddressBook, lead_days: int = REMINDER_LEAD_DAYS):
+        self.address_book = address_book
+        self.lead = timedelta(days=lead_days)
+        # birthday of every contact and its next occurrence that wasn't reminded yet
+        self.birthdays = {}
+        self.occurrences = {}
+        # (reminder date, name, occurrence)
+        self.heap = []
+        self.state_path = os.path.join(os.path.dirname(os.path.abspath(address_book.path)), REMINDERS_STATE_FILE)
+        if not self.load_state():
+            self.rebuild()
+        address_book.observers.append(self)
+
+    def _push(self, name: str, occurrence: date):
+        self.occurrences[name] = occurrence
+        heapq.heappush(self.heap, (occurrence - self.lead, name, occurrence))
+        if len(self.heap) > 2 * len(self.occurrences) + 64:
+            self.heap = [(occurrence - self.lead, name, occurrence) for name, occurrence in self.occurrences.items()]
+            heapq.heapify(self.heap)
+
+    def schedule(self, name: str, record: Record | None):
+        birthday = record.birthday.value if record is not None and record.birthday else None
+        if birthday == self.birthdays.get(name):
+            # other fields changed, or the birthday was already reminded this year
+            return
+        if birthday is None:
+            del self.birthdays[name]
+            del self.occurrences[name]
+            return
+        self.birthdays[name] = birthday
+        self._push(name, next_occurrence(birthday, date.today()))
+
+    def rebuild(self):
+        for name in [name for name in self.birthdays if name not in self.address_book]:
+            self.schedule(name, None)
+        for name, record in self.address_book.data.items():
+            self.schedule(name, record)
+
+    def __call__(self, key, record):
+        if key is None:
+            self.rebuild()
+        else:
+            self.schedule(key, record)
+
+    def tick(self, today: date = None) -> list[tuple[str, date]]:
+        """
+        :return: (name, birthday) of the reminders due since the previous tick, missed birthdays are skipped
+        """
+        today = today or date.today()
+        due = []
+        while self.heap and self.heap[0][0] <= today:
+            _, name, occurrence = heapq.heappop(self.heap)
+            if self.occurrences.get(name) != occurrence:
+                continue
+            if occurrence >= today:
+                due.append((name, occurrence))
+            self._push(name, next_occurrence(self.birthdays[name], occurrence + timedelta(days=1)))
+        return due
+
+    def upcoming(self, days: int, today: date = None) -> list[tuple[date, date, str]]:
+        """
+        :return: sorted (reminder date, birthday, name) of the birthdays in the next `days` days
+        """
+        today = today or date.today()
+        last = today + timedelta(days=days)
+        # reminded birthdays are already scheduled for the next year, so the next occurrences are computed again
+        occurrences = ((next_occurrence(birthday, today), name) for name, birthday in self.birthdays.items())
+        return sorted((occurrence - self.lead, occurrence, name) for occurrence, name in occurrences if occurrence <= last)
+
+    def save_state(self):
+        """
+        Saves the schedule with the signature of the contacts file it matches,
+        so the next start doesn't have to read the birthdays of all contacts
+        """
+        book = self.address_book
+        signature = file_signature(book.path)
+        if signature is None or book.generation != book.saved_generation:
+            return
+        state = {
+            "signature": signature,
+            "contacts": {name: [self.birthdays[name].isoformat(), occurrence.isoformat()]
+                         for name, occurrence in self.occurrences.items()},
+        }
+        with atomic_write(self.state_path) as file:
+            file.write(json.dumps(state))
+
+    def load_state(self) -> bool:
+        """
+        :return: False if there is no saved schedule for the current contacts file
+        """
+        try:
+            with open(self.state_path, "r") as file:
+                state = json.load(file)
+            if state["signature"] != file_signature(self.address_book.path):
+                return False
+            for name, (birthday, occurrence) in state["contacts"].items():
+                self.birthdays[name] = date.fromisoformat(birthday)
+                self.occurrences[name] = date.fromisoformat(occurrence)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.birthdays.clear()
+            self.occurrences.clear()
+            return False
+        self.heap = [(occurrence - self.lead, name, occurrence) for name, occurrence in self.occurrences.items()]
+        heapq.heapify(self.heap)
+        return True
+
+
+def birthday_scheduler(address_book: AddressBook, lead_days: int = REMINDER_LEAD_DAYS) -> BirthdayScheduler:
+    if address_book.scheduler is None:
+        address_book.scheduler = BirthdayScheduler(address_book, lead_days)
+    return address_book.scheduler
@@ -0,0 +1,121 @@
+import abc
+import os
+import threading
+
+from address_book_classes import AddressBook
+from constants import FILE_PATH_CONTACTS, FILE_PATH_NOTES
+from notes_classes import Notes
+from spill import write_json_items
+from storage import atomic_write
+
+
+class Snapshot(abc.ABC):
+    """
+    State of a book at the moment the snapshot is taken, read by another thread while commands keep changing the book.
+    Only the keys are copied when it is taken. Records are read from the book itself, and the book calls preserve
+    before it changes or deletes a record, which then keeps the serialized record as it was until it is read.
+    So a snapshot costs memory only for the records changed while it is being read, and none once it is closed
+    """
+
+    def __init__(self, book, keys):
+        self.book = book
+        self.keys = list(keys)
+        # keys not read yet, only they have to be preserved
+        self.pending = set(self.keys)
+        # serialized records changed or deleted in the book since the snapshot was taken
+        self.saved = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        book.snapshots.append(self)
+
+    @abc.abstractmethod
+    def read(self, key):
+        """
+        :return: serialized current record of the book, None if there is none
+        """
+
+    def preserve(self, key):
+        """
+        Called by the book before the record of the key is changed or deleted, with None before the whole book is
+        """
+        with self.lock:
+            for pending in self.pending if key is None else [key]:
+                if pending in self.pending and pending not in self.saved:
+                    self.saved[pending] = self.read(pending)
+
+    def items(self):
+        """
+        Yields (key, serialized record) pairs in the order of the keys
+        """
+        for key in self.keys:
+            with self.lock:
+                self.pending.discard(key)
+                value = self.saved.pop(key) if key in self.saved else self.read(key)
+            if value is not None:
+                yield key, value
+
+    def close(self):
+        self.closed = True
+        self.saved = {}
+
+
+class ContactSnapshot(Snapshot):
+    """
+    Contacts are listed in the address book order, the order save_contacts writes them in
+    """
+
+    def __init__(self, address_book: AddressBook):
+        super().__init__(address_book, address_book.data)
+
+    def read(self, key: str):
+        record = self.book.data.get(key)
+        return None if record is None else record.to_json()
+
+
+class NoteSnapshot(Snapshot):
+    """
+    Notes are listed in the notebook order
+    """
+
+    def __init__(self, notebook: Notes):
+        super().__init__(notebook, notebook.uids)
+
+    def read(self, uid: str):
+        data = self.book.uids.get(uid)
+        return None if data is None else Notes.entry_to_json(data)
+
+
+class Export:
+    """
+    Writes snapshots of contacts and notes to a directory in a background thread
+    """
+
+    def __init__(self, address_book: AddressBook, notebook: Notes, directory: str):
+        self.directory = directory
+        self.contacts = ContactSnapshot(address_book)
+        self.notes = NoteSnapshot(notebook)
+        self.error = None
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def _write(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with atomic_write(os.path.join(self.directory, os.path.basename(FILE_PATH_CONTACTS))) as file:
+                write_json_items(file, self.contacts.items())
+            with atomic_write(os.path.join(self.directory, os.path.basename(FILE_PATH_NOTES))) as file:
+                write_json_items(file, (data for _, data in self.notes.items()), array=True)
+        except OSError as e:
+            self.error = e
+        finally:
+            self.contacts.close()
+            self.notes.close()
+
+    @property
+    def done(self) -> bool:
+        return not self.thread.is_alive()
+
+    def __str__(self):
+        if self.error is not None:
+            return f"Export to '{self.directory}' failed: {self.error}"
+        return f"{len(self.contacts.keys)} contacts and {len(self.notes.keys)} notes were exported to '{self.directory}'"
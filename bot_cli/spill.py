@@ -0,0 +1,350 @@
+import atexit
+import dbm
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from caching import CacheStats
+from constants import JSON_CHUNK_SIZE
+
+VALUE_END = re.compile(r"[\s,\]}]")
+WHITESPACE = re.compile(r"[ \t\r\n]*")
+
+
+class SpillStore:
+    """
+    LRU of materialized objects limited by their estimated size in bytes.
+    Objects evicted from it are serialized to a dbm file and read back on the next access,
+    so changed objects have to be put back to be saved.
+    Objects may be read by a snapshot in another thread, so the store is locked while it is used
+    """
+
+    def __init__(self, name: str, max_bytes: int, dump, load, size_of, directory: str = None):
+        """
+        :param dump: converts an object to JSON compatible data
+        :param load: creates an object from the data returned by dump
+        :param size_of: estimated memory used by an object
+        :param directory: where the dbm file is created, the system temporary directory by default
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.dump = dump
+        self.load = load
+        self.size_of = size_of
+        self.directory = tempfile.mkdtemp(prefix=f"bot-{name}-", dir=directory)
+        self.db = dbm.open(os.path.join(self.directory, name), "n")
+        # key -> [object, size, changed since it was read from the file]
+        self.hot = OrderedDict()
+        self.size = 0
+        self.writes = 0
+        self.stats = CacheStats(f"{name} resident cache")
+        self.lock = threading.RLock()
+        atexit.register(self.close)
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.hot.get(key)
+            if entry is not None:
+                self.hot.move_to_end(key)
+                self.stats.hit()
+                return entry[0]
+            self.stats.miss()
+            value = self.load(json.loads(self.db[key]))
+            self._keep(key, value, False)
+            return value
+
+    def put(self, key: str, value):
+        with self.lock:
+            self._drop(key)
+            self._keep(key, value, True)
+
+    def delete(self, key: str):
+        with self.lock:
+            self._drop(key)
+            if key in self.db:
+                del self.db[key]
+
+    def _keep(self, key: str, value, changed: bool):
+        size = self.size_of(value)
+        self.hot[key] = [value, size, changed]
+        self.size += size
+        # the object just accessed stays even if it alone exceeds the budget
+        while self.size > self.max_bytes and len(self.hot) > 1:
+            evicted, (evicted_value, evicted_size, evicted_changed) = self.hot.popitem(last=False)
+            self.size -= evicted_size
+            if evicted_changed:
+                self.db[evicted] = json.dumps(self.dump(evicted_value))
+                self.writes += 1
+
+    def _drop(self, key: str):
+        entry = self.hot.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.hot.clear()
+            self.size = 0
+            self.db.close()
+            self.db = dbm.open(os.path.join(self.directory, self.name), "n")
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __str__(self):
+        return (f"{self.stats}, {len(self.hot)} resident, {self.size} of {self.max_bytes} bytes, "
+                f"{self.writes} written to disk")
+
+
+class SpillingDict(MutableMapping):
+    """
+    Dict keeping only its keys in memory, the values live in a SpillStore
+    """
+
+    def __init__(self, store: SpillStore):
+        self.store = store
+        self.keys_ = {}
+
+    def __getitem__(self, key):
+        if key not in self.keys_:
+            raise KeyError(key)
+        return self.store.get(key)
+
+    def __setitem__(self, key, value):
+        self.keys_[key] = None
+        self.store.put(key, value)
+
+    def __delitem__(self, key):
+        del self.keys_[key]
+        self.store.delete(key)
+
+    def __contains__(self, key):
+        return key in self.keys_
+
+    def __iter__(self):
+        return iter(self.keys_)
+
+    def __len__(self):
+        return len(self.keys_)
+
+    def clear(self):
+        self.keys_.clear()
+        self.store.clear()
+
+
+class SpillingList:
+    """
+    List of note entries keeping only their ids in memory, the entries live in a SpillStore
+    """
+
+    def __init__(self, store: SpillStore):
+        self.store = store
+        self.order = []
+        self.members = set()
+        self.uids = SpilledUids(self)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.get(uid) for uid in self.order[index]]
+        return self.store.get(self.order[index])
+
+    def __delitem__(self, index):
+        uid = self.order[index]
+        del self.order[index]
+        self.members.discard(uid)
+        self.store.delete(uid)
+
+    def __iter__(self):
+        for uid in self.order:
+            yield self.store.get(uid)
+
+    def append(self, entry: dict):
+        self.order.append(entry["uid"])
+        self.members.add(entry["uid"])
+        self.store.put(entry["uid"], entry)
+
+    def index(self, entry: dict) -> int:
+        return self.order.index(entry["uid"])
+
+    def remove_uids(self, uids):
+        """
+        Removes the entries with the ids in one pass
+        """
+        uids = set(uids)
+        self.order = [uid for uid in self.order if uid not in uids]
+        self.members -= uids
+        for uid in uids:
+            self.store.delete(uid)
+
+    def refresh(self, entry: dict):
+        """
+        Puts back a changed entry, which may have been evicted while it was being changed
+        """
+        if entry["uid"] in self.members:
+            self.store.put(entry["uid"], entry)
+
+    def clear(self):
+        self.order.clear()
+        self.members.clear()
+        self.store.clear()
+
+
+class SpilledUids(MutableMapping):
+    """
+    Notes.uids of a SpillingList: entries are added and removed through the list,
+    so assigning an entry only puts it back and deleting does nothing
+    """
+
+    def __init__(self, entries: SpillingList):
+        self.entries = entries
+
+    def __getitem__(self, uid):
+        if uid not in self.entries.members:
+            raise KeyError(uid)
+        return self.entries.store.get(uid)
+
+    def __setitem__(self, uid, entry):
+        self.entries.refresh(entry)
+
+    def __delitem__(self, uid):
+        pass
+
+    def __contains__(self, uid):
+        return uid in self.entries.members
+
+    def __iter__(self):
+        return iter(self.entries.order)
+
+    def __len__(self):
+        return len(self.entries.order)
+
+
+class JsonItemReader:
+    """
+    Reads the items of a top level JSON object or array one by one,
+    so the whole document is never held in memory
+    """
+
+    def __init__(self, file, chunk_size: int = JSON_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+    def _fill(self) -> bool:
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def _peek(self) -> str:
+        """
+        :return: next character that isn't whitespace, empty string at the end of the file
+        """
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expecting one of '{chars}' at position {self.position} of the JSON chunk")
+        self.position += 1
+        return char
+
+    def _value(self):
+        if self._peek() not in "{[\"":
+            # a number or a literal may continue in the next chunk, and its beginning would be decoded as a value
+            while not VALUE_END.search(self.buffer, self.position) and self._fill():
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            self.position = end
+            return value
+
+    def items(self):
+        """
+        Yields (key, value) pairs of an object or (index, value) pairs of an array
+        """
+        opening = self._expect("{[")
+        closing = "}" if opening == "{" else "]"
+        if self._peek() == closing:
+            self.position += 1
+            return
+        index = 0
+        while True:
+            if opening == "{":
+                key = self._value()
+                self._expect(":")
+            else:
+                key = index
+                index += 1
+            yield key, self._value()
+            if self._expect("," + closing) == closing:
+                return
+
+
+def iter_json_items(file):
+    return JsonItemReader(file).items()
+
+
+def iter_json_batches(file, size: int, stream: bool = True):
+    """
+    Yields (position of the first item, values of up to `size` items) of a top level JSON object or array
+    :param stream: read the items one by one; otherwise the file is parsed at once, which is faster
+    """
+    if stream:
+        values = (value for _, value in iter_json_items(file))
+    else:
+        data = json.load(file)
+        values = data.values() if isinstance(data, dict) else data
+    batch = []
+    start = 0
+    for value in values:
+        batch.append(value)
+        if len(batch) == size:
+            yield start, batch
+            start += size
+            batch = []
+    if batch:
+        yield start, batch
+
+
+def write_json_items(file, items, array: bool = False):
+    """
+    Writes the same text as json.dump(..., indent=4) one item at a time
+    :param items: (key, value) pairs of an object, or values of an array if array is set
+    """
+    file.write("[" if array else "{")
+    empty = True
+    for item in items:
+        file.write("\n    " if empty else ",\n    ")
+        empty = False
+        if array:
+            file.write(json.dumps(item, indent=4).replace("\n", "\n    "))
+        else:
+            key, value = item
+            file.write(f"{json.dumps(key)}: " + json.dumps(value, indent=4).replace("\n", "\n    "))
+    file.write(("" if empty else "\n") + ("]" if array else "}"))
@@ -0,0 +1,53 @@
+import time
+
+from print_util import print_info
+
+
+class DeferredLoad:
+    """
+    Loads a book the first time a command uses it, so sessions that never use the book don't read its file
+    and the prompt doesn't wait for it
+    """
+
+    def __init__(self, name: str, load, *args):
+        self.name = name
+        self.load = load
+        self.args = args
+        self.message = None
+        self.error = None
+        self.seconds = None
+
+    def run(self):
+        print_info(f"Loading {self.name}…")
+        start = time.perf_counter()
+        try:
+            self.message = self.load(*self.args)
+        except Exception as e:
+            self.error = e
+        self.seconds = time.perf_counter() - start
+
+
+class StartupTimings:
+    """
+    Durations of the startup steps, shown with --timings
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = []
+
+    def step(self, name: str, since: float) -> float:
+        """
+        Records a step that started at `since`
+        :return: end of the step, the start of the next one
+        """
+        now = time.perf_counter()
+        self.steps.append((name, now - since))
+        return now
+
+    def __str__(self):
+        lines = ["Startup timings:"]
+        for name, seconds in self.steps:
+            lines.append(f"  {name:<28}{seconds * 1000:>9.1f} ms")
+        lines.append(f"  {'ready for commands after':<28}{(time.perf_counter() - self.start) * 1000:>9.1f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import zlib
+from contextlib import contextmanager
+
+# the umask can only be read by setting it, which would affect files created by other threads meanwhile,
+# so it is read once at import
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+class CrcWriter:
+    """
+    Text file written as UTF-8, with the CRC-32 of everything written so far
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.crc = 0
+        self.size = 0
+
+    def write(self, text: str):
+        data = text.encode()
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.file.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+
+def sync_directory(directory: str):
+    """
+    Makes a rename in the directory durable, where the OS allows opening directories
+    """
+    if os.name != "posix":
+        return
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(path: str):
+    """
+    Writes a file through a temporary file in the same directory, which replaces the file only
+    after it was written and flushed to disk, so a crash or a full disk leaves the previous content
+    :return: CrcWriter of the temporary file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            writer = CrcWriter(file)
+            yield writer
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp creates the file readable only by the owner, the replaced file keeps its mode
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        else:
+            os.chmod(temp_path, 0o666 & ~UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    sync_directory(directory)
@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import zlib
+
+from address_book_classes import AddressBook, Record
+from notes_classes import Notes, note_log_path
+from constants import FILE_PATH_CONTACTS, FILE_PATH_NOTES, SYNC_BUCKETS, SYNC_STATE_FILE
+from storage import atomic_write
+
+
+def content_digest(data: dict) -> str:
+    """
+    Digest of a serialized record or note, without its change time
+    """
+    content = {key: value for key, value in data.items() if key != "updated"}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def bucket_of(key: str) -> int:
+    return zlib.crc32(key.encode()) % SYNC_BUCKETS
+
+
+class MerkleTree:
+    """
+    Content digests of records grouped into SYNC_BUCKETS buckets by key.
+    A bucket hash is recomputed only after one of its leaves changed
+    """
+
+    def __init__(self, leaves: dict = None):
+        self.leaves = [{} for _ in range(SYNC_BUCKETS)]
+        self.hashes = [""] * SYNC_BUCKETS
+        self.dirty_buckets = set(range(SYNC_BUCKETS))
+        for key, digest in (leaves or {}).items():
+            self.leaves[bucket_of(key)][key] = digest
+
+    def set_leaf(self, key: str, digest: str | None):
+        bucket = bucket_of(key)
+        if digest is None:
+            self.leaves[bucket].pop(key, None)
+        else:
+            self.leaves[bucket][key] = digest
+        self.dirty_buckets.add(bucket)
+
+    def bucket_hashes(self) -> list[str]:
+        for bucket in self.dirty_buckets:
+            content = "".join(f"{key}:{digest};" for key, digest in sorted(self.leaves[bucket].items()))
+            self.hashes[bucket] = hashlib.sha1(content.encode()).hexdigest()
+        self.dirty_buckets.clear()
+        return self.hashes
+
+    def root(self) -> str:
+        return hashlib.sha1("".join(self.bucket_hashes()).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        return self.leaves[bucket_of(key)].get(key)
+
+    def all_leaves(self) -> dict:
+        return {key: digest for bucket in self.leaves for key, digest in bucket.items()}
+
+    def diff(self, other: "MerkleTree") -> set[str]:
+        """
+        :return: keys whose digests differ, found by comparing roots and then buckets
+        """
+        if self.root() == other.root():
+            return set()
+        keys = set()
+        for bucket, (mine, theirs) in enumerate(zip(self.bucket_hashes(), other.bucket_hashes())):
+            if mine != theirs:
+                left, right = self.leaves[bucket], other.leaves[bucket]
+                keys |= {key for key in left.keys() | right.keys() if left.get(key) != right.get(key)}
+        return keys
+
+
+class TrackedTree(MerkleTree):
+    """
+    Merkle tree of an AddressBook or Notes kept up to date through their observers,
+    so only records changed since the previous sync are hashed again
+    """
+
+    def __init__(self, keys, serialize):
+        super().__init__()
+        self.keys = keys
+        self.serialize = serialize
+        self.dirty_keys = set()
+        self.rebuild = True
+
+    def __call__(self, key, value):
+        if key is None:
+            self.rebuild = True
+        else:
+            self.dirty_keys.add(key)
+
+    def refresh(self):
+        if self.rebuild:
+            self.leaves = [{} for _ in range(SYNC_BUCKETS)]
+            self.dirty_buckets = set(range(SYNC_BUCKETS))
+            self.dirty_keys = set(self.keys())
+            self.rebuild = False
+        for key in self.dirty_keys:
+            data = self.serialize(key)
+            self.set_leaf(key, None if data is None else content_digest(data))
+        self.dirty_keys.clear()
+        return self
+
+
+def contacts_tree(address_book: AddressBook) -> TrackedTree:
+    if address_book.merkle_tree is None:
+        address_book.merkle_tree = TrackedTree(
+            lambda: address_book.data.keys(),
+            lambda key: address_book.data[key].to_json() if key in address_book.data else None,
+        )
+        address_book.observers.append(address_book.merkle_tree)
+    return address_book.merkle_tree.refresh()
+
+
+def notes_tree(notebook: Notes) -> TrackedTree:
+    if notebook.merkle_tree is None:
+        notebook.merkle_tree = TrackedTree(
+            lambda: notebook.uids.keys(),
+            lambda uid: Notes.entry_to_json(notebook.uids[uid]) if uid in notebook.uids else None,
+        )
+        notebook.observers.append(notebook.merkle_tree)
+    return notebook.merkle_tree.refresh()
+
+
+def file_signature(path: str) -> list | None:
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def notes_signature(path: str) -> list | None:
+    """
+    Signature of the notes file and of the log of texts appended to its notes
+    """
+    signature = file_signature(path)
+    log_signature = file_signature(note_log_path(path))
+    if signature is None or log_signature is None:
+        return signature
+    return signature + log_signature
+
+
+def read_state(directory: str) -> dict:
+    path = os.path.join(directory, SYNC_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_state(directory: str, state: dict):
+    with atomic_write(os.path.join(directory, SYNC_STATE_FILE)) as file:
+        file.write(json.dumps(state))
+
+
+class DirectoryReplica:
+    """
+    Replica stored in a directory. Its Merkle leaves are kept in SYNC_STATE_FILE,
+    so the data files are only read when they changed since the last sync or records have to be merged.
+    The leaves saved by the last sync with a peer directory are the common base telling which side changed a record.
+    Both directories keep them under the path of the other one, so either of them may start the next sync
+    """
+
+    def __init__(self, directory: str, peer: str):
+        """
+        :param peer: directory of the books synchronized with the replica
+        """
+        self.directory = directory
+        self.peer = peer
+        self.contacts_path = os.path.join(directory, FILE_PATH_CONTACTS)
+        self.notes_path = os.path.join(directory, FILE_PATH_NOTES)
+        self._address_book = None
+        self._notebook = None
+        self.state = read_state(directory)
+        self.contacts_tree = self._tree(self.state.get("contacts"), file_signature(self.contacts_path),
+                                        self._contacts_leaves)
+        self.notes_tree = self._tree(self.state.get("notes"), notes_signature(self.notes_path), self._notes_leaves)
+        base = (read_state(peer).get("bases", {}).get(os.path.abspath(directory))
+                or self.state.get("bases", {}).get(os.path.abspath(peer), {}))
+        self.contacts_base = base.get("contacts", {})
+        self.notes_base = base.get("notes", {})
+
+    @staticmethod
+    def _tree(state: dict | None, signature: list | None, leaves) -> MerkleTree:
+        if state is not None and state["signature"] == signature:
+            return MerkleTree(state["leaves"])
+        return MerkleTree(leaves())
+
+    def _contacts_leaves(self) -> dict:
+        return {key: content_digest(record.to_json()) for key, record in self.address_book().data.items()}
+
+    def _notes_leaves(self) -> dict:
+        return {uid: content_digest(Notes.entry_to_json(data)) for uid, data in self.notebook().uids.items()}
+
+    def address_book(self) -> AddressBook:
+        if self._address_book is None:
+            self._address_book = AddressBook()
+            if os.path.exists(self.contacts_path):
+                self._address_book.load_contacts(self.contacts_path)
+        return self._address_book
+
+    def notebook(self) -> Notes:
+        if self._notebook is None:
+            self._notebook = Notes()
+            if os.path.exists(self.notes_path):
+                self._notebook.load_notes(self.notes_path)
+        return self._notebook
+
+    def save(self, contacts_changed: bool, notes_changed: bool):
+        os.makedirs(self.directory, exist_ok=True)
+        if contacts_changed:
+            self.address_book().save_contacts(self.contacts_path)
+        if notes_changed:
+            self.notebook().save_notes(self.notes_path)
+        base = {"contacts": self.contacts_tree.all_leaves(), "notes": self.notes_tree.all_leaves()}
+        self.state["contacts"] = {"signature": file_signature(self.contacts_path), "leaves": base["contacts"]}
+        self.state["notes"] = {"signature": notes_signature(self.notes_path), "leaves": base["notes"]}
+        self.state.setdefault("bases", {})[os.path.abspath(self.peer)] = base
+        write_state(self.directory, self.state)
+        peer_state = read_state(self.peer)
+        peer_state.setdefault("bases", {})[os.path.abspath(self.directory)] = base
+        write_state(self.peer, peer_state)
+
+
+class SyncReport:
+    def __init__(self):
+        self.pulled = {"contacts": 0, "notes": 0}
+        self.pushed = {"contacts": 0, "notes": 0}
+        # records deleted here because they were deleted in the replica, and the other way round
+        self.deleted_here = {"contacts": 0, "notes": 0}
+        self.deleted_there = {"contacts": 0, "notes": 0}
+        # (kind, key, side whose version won, whether the other side deleted the record)
+        self.conflicts = []
+
+    def __str__(self):
+        lines = [f"{kind.capitalize()}: {self.pulled[kind]} received, {self.pushed[kind]} sent, "
+                 f"{self.deleted_here[kind]} deleted here, {self.deleted_there[kind]} deleted there"
+                 for kind in ("contacts", "notes")]
+        for kind, key, winner, deleted in self.conflicts:
+            if deleted:
+                lines.append(f"Conflict in {kind} '{key}': deleted on one side and changed on the other, "
+                             f"kept the {winner} version")
+            else:
+                lines.append(f"Conflict in {kind} '{key}': kept the {winner} version (last write wins)")
+        return "\n".join(lines)
+
+
+def resolve(key: str, local: dict | None, remote: dict | None,
+            local_tree: MerkleTree, remote_tree: MerkleTree, base: dict) -> tuple[str, bool]:
+    """
+    Chooses the side whose version of a record is kept, where a missing record is a version too:
+    a record deleted on one side since the last sync is deleted on the other unless it was changed there as well.
+    Records changed on both sides keep the most recent version
+    :param base: leaves saved by the last sync
+    :return: 'local' or 'remote', and whether the record was changed or deleted on both sides since the last sync
+    """
+    if local is None or remote is None:
+        present, missing = ("remote", "local") if local is None else ("local", "remote")
+        if key not in base:
+            # added on one side
+            return present, False
+        present_tree = remote_tree if local is None else local_tree
+        if present_tree.get(key) == base[key]:
+            # deleted on one side, unchanged on the other
+            return missing, False
+        return present, True
+    winner = "local" if local["updated"] >= remote["updated"] else "remote"
+    return winner, base.get(key) not in (local_tree.get(key), remote_tree.get(key))
+
+
+def sync(address_book: AddressBook, notebook: Notes, directory: str) -> SyncReport:
+    """
+    Exchanges records that differ between the books in memory and the replica in the directory.
+    Records added or deleted on one side are added to or deleted from the other,
+    records changed on both sides are resolved by their change time
+    """
+    replica = DirectoryReplica(directory, os.path.dirname(os.path.abspath(address_book.path)))
+    report = SyncReport()
+
+    local_contacts = contacts_tree(address_book)
+    for key in sorted(local_contacts.diff(replica.contacts_tree)):
+        local = address_book.data[key].to_json() if key in address_book.data else None
+        remote_book = replica.address_book()
+        remote = remote_book.data[key].to_json() if key in remote_book.data else None
+        winner, conflict = resolve(key, local, remote, local_contacts, replica.contacts_tree, replica.contacts_base)
+        if conflict:
+            report.conflicts.append(("contact", key, winner, local is None or remote is None))
+        if winner == "local" and local is None:
+            del remote_book[key]
+            replica.contacts_tree.set_leaf(key, None)
+            report.deleted_there["contacts"] += 1
+        elif winner == "local":
+            remote_book[key] = Record.from_json(local)
+            replica.contacts_tree.set_leaf(key, content_digest(local))
+            report.pushed["contacts"] += 1
+        elif remote is None:
+            del address_book[key]
+            report.deleted_here["contacts"] += 1
+        else:
+            address_book[key] = Record.from_json(remote)
+            report.pulled["contacts"] += 1
+
+    local_notes = notes_tree(notebook)
+    # notes are removed after the loop, each removal would go through the whole notebook
+    removed_here, removed_there = [], []
+    for uid in local_notes.diff(replica.notes_tree):
+        local = Notes.entry_to_json(notebook.uids[uid]) if uid in notebook.uids else None
+        remote_notebook = replica.notebook()
+        remote = Notes.entry_to_json(remote_notebook.uids[uid]) if uid in remote_notebook.uids else None
+        winner, conflict = resolve(uid, local, remote, local_notes, replica.notes_tree, replica.notes_base)
+        if conflict:
+            report.conflicts.append(("note", uid, winner, local is None or remote is None))
+        if winner == "local" and local is None:
+            removed_there.append(uid)
+            replica.notes_tree.set_leaf(uid, None)
+            report.deleted_there["notes"] += 1
+        elif winner == "local":
+            remote_notebook.merge_entry(local)
+            replica.notes_tree.set_leaf(uid, content_digest(local))
+            report.pushed["notes"] += 1
+        elif remote is None:
+            removed_here.append(uid)
+            report.deleted_here["notes"] += 1
+        else:
+            notebook.merge_entry(remote)
+            report.pulled["notes"] += 1
+    notebook.remove_uids(removed_here)
+    if removed_there:
+        replica.notebook().remove_uids(removed_there)
+
+    replica.save(report.pushed["contacts"] + report.deleted_there["contacts"] > 0,
+                 report.pushed["notes"] + report.deleted_there["notes"] > 0)
+    if report.pulled["contacts"] or report.deleted_here["contacts"]:
+        address_book.save_contacts(address_book.path)
+    if report.pulled["notes"] or report.deleted_here["notes"]:
+        notebook.save_notes(notebook.path)
+    return report
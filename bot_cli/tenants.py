@@ -0,0 +1,100 @@
+import os
+import re
+from collections import OrderedDict
+
+from address_book_classes import AddressBook
+from backups import contact_backups, note_backups
+from notes_classes import Notes
+from constants import (
+    FILE_PATH_CONTACTS,
+    FILE_PATH_NOTES,
+    TENANT_MEMORY_BUDGET,
+    RECORD_MEMORY_ESTIMATE,
+    NOTE_MEMORY_ESTIMATE,
+)
+
+
+class Tenant:
+    """
+    Address book and notebook of one tenant, stored in its own directory
+    """
+
+    def __init__(self, name: str, directory: str):
+        self.name = name
+        self.directory = directory
+        self.address_book = AddressBook()
+        self.address_book.path = os.path.join(directory, FILE_PATH_CONTACTS)
+        self.notebook = Notes()
+        self.notebook.path = os.path.join(directory, FILE_PATH_NOTES)
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.address_book.path):
+            self.address_book.load_contacts(self.address_book.path)
+        if os.path.exists(self.notebook.path):
+            self.notebook.load_notes(self.notebook.path)
+        contact_backups(self.address_book, self.address_book.path).verify()
+        note_backups(self.notebook, self.notebook.path).verify()
+
+    def flush(self):
+        """
+        Saves the address book and the notebook if they changed since they were loaded or saved,
+        and the birthday reminder schedule
+        """
+        if self.address_book.generation != self.address_book.saved_generation:
+            self.address_book.save_contacts(self.address_book.path)
+        if self.address_book.scheduler is not None:
+            self.address_book.scheduler.save_state()
+        if self.notebook.generation != self.notebook.saved_generation:
+            self.notebook.save_notes(self.notebook.path)
+
+    def memory_estimate(self) -> int:
+        return (len(self.address_book.data) * RECORD_MEMORY_ESTIMATE
+                + len(self.notebook.data["notes"]) * NOTE_MEMORY_ESTIMATE)
+
+
+class BookManager:
+    """
+    Loads tenants lazily from <data_dir>/<tenant> and keeps the recently used ones in memory.
+    When their estimated memory exceeds the budget, the least recently used tenants are flushed and dropped
+    """
+
+    def __init__(self, data_dir: str, memory_budget: int = TENANT_MEMORY_BUDGET):
+        self.data_dir = data_dir
+        self.memory_budget = memory_budget
+        self.tenants = OrderedDict()
+        self.evictions = 0
+
+    def get(self, name: str) -> Tenant:
+        """
+        :return: loaded tenant, which becomes the most recently used one
+        """
+        if not re.fullmatch(r"[\w.-]+", name) or name in (".", ".."):
+            raise ValueError(f"'{name}' is not a valid tenant name")
+
+        tenant = self.tenants.get(name)
+        if tenant is None:
+            tenant = Tenant(name, os.path.join(self.data_dir, name))
+            tenant.load()
+            self.tenants[name] = tenant
+        self.tenants.move_to_end(name)
+        self.evict_idle()
+        return tenant
+
+    def memory_estimate(self) -> int:
+        return sum(tenant.memory_estimate() for tenant in self.tenants.values())
+
+    def evict_idle(self):
+        """
+        Drops least recently used tenants until the rest fit the budget, the most recent one always stays
+        """
+        used = self.memory_estimate()
+        while used > self.memory_budget and len(self.tenants) > 1:
+            _, tenant = self.tenants.popitem(last=False)
+            tenant.flush()
+            used -= tenant.memory_estimate()
+            self.evictions += 1
+
+    def flush_all(self):
+        for tenant in self.tenants.values():
+            tenant.flush()
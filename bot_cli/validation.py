@@ -0,0 +1,182 @@
+import atexit
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import NamedTuple
+
+from constants import VALIDATION_PARALLEL_MIN_ROWS, VALIDATION_CHUNKS_PER_WORKER, MAX_REPORTED_ERRORS
+
+PHONE_PATTERN = re.compile(r'\b\d{10}\b')
+BIRTHDAY_PATTERN = re.compile(r'\b\d{2}\.\d{2}\.\d{4}\b')
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b')
+MIN_ADDRESS_LEN = 5
+
+PHONE_ERROR = "'{}' doesn't match the phone format XXXXXXXXXX(10 digits)"
+BIRTHDAY_ERROR = "'{}' doesn't match the birthday format DD.MM.YYYY"
+EMAIL_ERROR = "'{}' is not valid email address"
+ADDRESS_ERROR = f"Address must be at least {MIN_ADDRESS_LEN} symbols"
+
+
+class RowError(NamedTuple):
+    row: int
+    field: str
+    value: str
+    message: str
+
+    def __str__(self):
+        return f"row {self.row + 1}, {self.field}: {self.message}"
+
+
+def parse_birthday(value: str) -> date:
+    """
+    :raise ValueError: if the value isn't a date in format DD.MM.YYYY
+    """
+    if not BIRTHDAY_PATTERN.match(value):
+        raise ValueError(BIRTHDAY_ERROR.format(value))
+    if len(value) == 10:
+        # the pattern matched the whole value, so its parts are at fixed positions
+        return date(int(value[6:]), int(value[3:5]), int(value[:2]))
+    return datetime.strptime(value, '%d.%m.%Y').date()
+
+
+def check_phones(values: list[str]) -> list:
+    match = PHONE_PATTERN.match
+    return [value if match(value) else None for value in values]
+
+
+def check_emails(values: list[str]) -> list:
+    match = EMAIL_PATTERN.match
+    return [value if match(value) else None for value in values]
+
+
+def check_addresses(values: list[str]) -> list:
+    return [value if len(value.strip()) >= MIN_ADDRESS_LEN else None for value in values]
+
+
+def check_birthdays(values: list[str]) -> list:
+    result = []
+    for value in values:
+        try:
+            result.append(parse_birthday(value))
+        except ValueError:
+            result.append(None)
+    return result
+
+
+# column validators: take all values of a field and return the parsed value of every row, None for invalid ones
+COLUMN_CHECKS = {
+    "phone": (check_phones, PHONE_ERROR),
+    "birthday": (check_birthdays, BIRTHDAY_ERROR),
+    "email": (check_emails, EMAIL_ERROR),
+    "address": (check_addresses, ADDRESS_ERROR),
+}
+
+
+def validate_column(field: str, values: list[str], rows: list[int]) -> tuple[list, list[RowError]]:
+    """
+    Validates all values of one field at once
+    :param rows: row number of every value
+    :return: parsed value of every row (None if it is invalid) and the errors of the invalid ones
+    """
+    check, message = COLUMN_CHECKS[field]
+    parsed = check(values)
+    errors = [RowError(row, field, value, message.format(value))
+              for row, value, result in zip(rows, values, parsed) if result is None]
+    return parsed, errors
+
+
+def reject(contact: dict) -> dict:
+    """
+    :return: rejected values of a validated contact, {"phones": [...], field: value}
+    """
+    if contact["rejected"] is None:
+        contact["rejected"] = {"phones": []}
+    return contact["rejected"]
+
+
+def validate_chunk(contacts: list[dict], start: int = 0) -> tuple[list[dict], list[RowError]]:
+    """
+    Validates serialized contacts (see Record.to_json) field by field.
+    Invalid values don't fail the whole contact, they are kept as they are in its "rejected" values,
+    so saving the contact writes them back
+    :param start: row number of the first contact, used in errors
+    :return: contacts with parsed values, for Record.from_valid, and the errors
+    """
+    result = [{
+        "name": contact["name"],
+        "phones": [],
+        "birthday": None,
+        "email": None,
+        "address": None,
+        "updated": contact.get("updated", 0),
+        "rejected": None,
+    } for contact in contacts]
+
+    rows = [row for row, contact in enumerate(contacts) for _ in contact["phones"]]
+    values = [phone for contact in contacts for phone in contact["phones"]]
+    parsed, errors = validate_column("phone", values, [start + row for row in rows])
+    for row, value, phone in zip(rows, values, parsed):
+        if phone is not None:
+            result[row]["phones"].append(phone)
+        else:
+            reject(result[row])["phones"].append(value)
+
+    for field in ("birthday", "email", "address"):
+        rows = [row for row, contact in enumerate(contacts) if contact.get(field)]
+        values = [contacts[row][field] for row in rows]
+        parsed, field_errors = validate_column(field, values, [start + row for row in rows])
+        errors.extend(field_errors)
+        for row, value, parsed_value in zip(rows, values, parsed):
+            if parsed_value is not None:
+                result[row][field] = parsed_value
+            else:
+                reject(result[row])[field] = value
+    return result, errors
+
+
+def _validate_part(part: tuple[list[dict], int]):
+    return validate_chunk(*part)
+
+
+class ValidationEngine:
+    """
+    Validates serialized contacts in bulk, splitting large batches between worker processes
+    """
+
+    def __init__(self, workers: int = None, min_rows: int = VALIDATION_PARALLEL_MIN_ROWS):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.executor = None
+
+    def validate(self, contacts: list[dict], start: int = 0) -> tuple[list[dict], list[RowError]]:
+        """
+        :return: contacts with parsed values in the same order and the errors of all of them
+        """
+        if self.workers < 2 or len(contacts) < self.min_rows:
+            return validate_chunk(contacts, start)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers)
+        size = -(-len(contacts) // (self.workers * VALIDATION_CHUNKS_PER_WORKER))
+        parts = [(contacts[i:i + size], start + i) for i in range(0, len(contacts), size)]
+        result, errors = [], []
+        for part_result, part_errors in self.executor.map(_validate_part, parts):
+            result.extend(part_result)
+            errors.extend(part_errors)
+        return result, errors
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def format_errors(errors: list[RowError], limit: int = MAX_REPORTED_ERRORS) -> str:
+    lines = [str(error) for error in errors[:limit]]
+    if len(errors) > limit:
+        lines.append(f"... and {len(errors) - limit} more")
+    return "\n".join(lines)
+
+
+VALIDATOR = ValidationEngine()
+atexit.register(VALIDATOR.shutdown)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+
+from address_book_classes import AddressBook, Record, Name
+from notes_classes import Note, Notes, apply_note_log
+from sync import content_digest, contacts_tree, notes_tree, file_signature
+
+
+class FileWatcher:
+    """
+    Polls a data file for changes made by other programs.
+    mtime and size are checked on every poll, the content hash only when they changed.
+    Loads and saves done by the bot itself are recognized by the saved generation of the book
+    """
+
+    def __init__(self, book, path_of, apply):
+        self.book = book
+        self.path_of = path_of
+        self.apply = apply
+        self.seen_generation = None
+        self.signature = None
+        self.digest = None
+
+    def poll(self) -> str | None:
+        """
+        :return: description of the applied external change, None if there was none
+        """
+        path = self.path_of(self.book)
+        if self.book.saved_generation != self.seen_generation:
+            self.seen_generation = self.book.saved_generation
+            self.signature = file_signature(path)
+            self.digest = None
+            return None
+
+        signature = file_signature(path)
+        if signature == self.signature or signature is None:
+            return None
+        self.signature = signature
+        with open(path, "rb") as file:
+            content = file.read()
+        digest = hashlib.sha1(content).hexdigest()
+        if digest == self.digest:
+            return None
+        self.digest = digest
+        try:
+            data = json.loads(content)
+        except ValueError:
+            # a damaged file or one still being written by another program, read again when it changes
+            return None
+        return self.apply(self.book, data)
+
+
+def apply_contacts(address_book: AddressBook, data: dict) -> str | None:
+    """
+    Applies only the records of the file that differ from the address book
+    """
+    records = {Name(record_data["name"]).value: record_data for record_data in data.values()}
+    tree = contacts_tree(address_book)
+    updated, removed, invalid = 0, 0, 0
+    for key, record_data in records.items():
+        if tree.get(key) != content_digest(record_data):
+            try:
+                record = Record.from_json(record_data)
+            except (ValueError, KeyError):
+                invalid += 1
+                continue
+            address_book[key] = record
+            updated += 1
+            # invalid values are kept in the record, as by a load
+            if record.rejected is not None:
+                invalid += 1
+    for key in [key for key in address_book.data if key not in records]:
+        del address_book[key]
+        removed += 1
+    if not (updated or removed or invalid):
+        return None
+    address_book.saved_generation = address_book.generation
+    return f"{updated} contacts updated, {removed} removed, {invalid} with invalid values"
+
+
+def apply_notes(notebook: Notes, data: list) -> str | None:
+    """
+    Applies only the notes of the file that differ from the notebook.
+    Notes added by other programs get an id and the file is saved with it
+    """
+    tree = notes_tree(notebook)
+    data = apply_note_log(data, notebook.path)
+    updated, missing_uid = 0, False
+    uids = set()
+    for note_data in data:
+        if "uid" not in note_data:
+            missing_uid = True
+            note_data = Notes.entry_to_json(Notes.entry_from_json(note_data))
+        elif len(note_data.get("note", "")) >= Note.COMPRESS_MIN_SIZE:
+            # notes in memory are compared in their saved form, in which large notes are compressed
+            note_data = Notes.entry_to_json(Notes.entry_from_json(note_data))
+        uids.add(note_data["uid"])
+        if tree.get(note_data["uid"]) != content_digest(note_data):
+            notebook.merge_entry(note_data)
+            updated += 1
+    removed = notebook.remove_uids([uid for uid in notebook.uids if uid not in uids])
+    if missing_uid:
+        notebook.save_notes(notebook.path)
+    else:
+        notebook.saved_generation = notebook.generation
+    if not (updated or removed):
+        return None
+    return f"{updated} notes updated, {removed} removed"
+
+
+class DataWatcher:
+    """
+    Watches the contacts and notes files of the books in use
+    """
+
+    def __init__(self, address_book: AddressBook, notebook: Notes = None):
+        """
+        :param notebook: None while the notebook is loading, it is watched from watch_notes on
+        """
+        self.watchers = [FileWatcher(address_book, lambda book: book.path, apply_contacts)]
+        if notebook is not None:
+            self.watchers.append(FileWatcher(notebook, lambda book: book.path, apply_notes))
+        self.poll()
+
+    def watch_notes(self, notebook: Notes):
+        watcher = FileWatcher(notebook, lambda book: book.path, apply_notes)
+        watcher.poll()
+        self.watchers.append(watcher)
+
+    def poll(self) -> list[str]:
+        """
+        :return: descriptions of the changes applied since the previous poll
+        """
+        return [change for watcher in self.watchers if (change := watcher.poll())]